@@ -0,0 +1 @@
+"""Controle de alimentações: núcleo sem interface (core), figuras (figures) e relatório em lote (report)."""
@@ -0,0 +1,1840 @@
+"""Núcleo do painel de alimentações: carga, processamento e agregação, sem Streamlit.
+
+Tudo o que não desenha a página fica aqui: o cliente do Microsoft Graph, a
+leitura das planilhas, o histórico mensal, os índices de filtro, o cubo de
+gastos e as estatísticas exibidas. O painel (controlealimentacao.py) e o
+relatório em lote (alimentacao.report) usam as mesmas funções.
+
+Dependências pesadas ou opcionais (requests, msal, openpyxl, duckdb e
+python-calamine) só são importadas onde são usadas, para que importar o
+núcleo custe pouco (ver benchmarks/bench_import.py).
+"""
+
+import functools
+import importlib.util
+import io
+import multiprocessing
+import os
+import json
+import logging
+import sys
+import time
+import random
+import re
+import tempfile
+import threading
+import contextvars
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import resource
+except ImportError:  # Windows não tem o módulo resource
+    resource = None
+
+# Endereços do Microsoft Graph / SharePoint
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+SITE_SHAREPOINT = "rezendeenergia.sharepoint.com:/sites/Intranet"
+# Planilhas de compras: a atual e as arquivadas por ano (p.ex. "Controle Alimentação 2023.xlsx");
+# cópias como "Controle Alimentação (1).xlsx" ou "Controle Alimentação - backup.xlsx" ficam de fora
+PREFIXO_ARQUIVO = "Controle Alimentação"
+PADRAO_ARQUIVO = re.compile(rf"{re.escape(PREFIXO_ARQUIVO)}( \d{{4}})?\.xlsx", re.IGNORECASE)
+# Nova busca por planilhas (s), para achar as novas (p.ex. o arquivo de um novo ano); entre
+# buscas, os metadados são relidos pelo id. Sem planilha conhecida, a busca é refeita a cada vez
+INTERVALO_DESCOBERTA = float(os.environ.get("ALIMENTACAO_INTERVALO_DESCOBERTA", "600"))
+# Planilhas baixadas e lidas ao mesmo tempo
+MAX_LEITURAS_PARALELAS = 4
+
+# Resiliência no acesso ao Graph
+TIMEOUT_GRAPH = (5, 60)  # conexão, leitura (s)
+STATUS_TEMPORARIOS_GRAPH = {429, 500, 502, 503, 504}
+ESPERA_MAXIMA_GRAPH = 60
+TAMANHO_BLOCO_DOWNLOAD = 8 * 1024 * 1024
+
+# Histórico local das compras processadas, em partições mensais (partida rápida
+# após reinício do processo e atualização proporcional às compras novas)
+DIRETORIO_CACHE = os.environ.get("ALIMENTACAO_CACHE_DIR", ".cache")
+DIRETORIO_HISTORICO = os.path.join(DIRETORIO_CACHE, "historico")
+
+# Leitor da planilha: 'auto' usa o calamine se estiver instalado, senão o openpyxl
+MOTOR_EXCEL = os.environ.get("ALIMENTACAO_MOTOR_EXCEL", "auto")
+
+# Motor das consultas do painel: 'pandas' (histórico inteiro em memória) ou
+# 'duckdb' (consultas sobre as partições do histórico em disco)
+MOTOR_CONSULTAS = os.environ.get("ALIMENTACAO_MOTOR_CONSULTAS", "pandas")
+MAX_SELECOES_DUCKDB = 32
+
+# Processos do ajuste da previsão de gastos: 1 ajusta tudo no próprio processo;
+# mais que 1 divide as séries entre processos (só compensa em históricos grandes)
+PROCESSOS_PREVISAO = int(os.environ.get("ALIMENTACAO_PROCESSOS_PREVISAO", "1"))
+
+# Intervalo (s) para conferir se a planilha mudou no SharePoint
+INTERVALO_ATUALIZACAO = float(os.environ.get("ALIMENTACAO_INTERVALO_ATUALIZACAO", "300"))
+
+# Log da instrumentação: tamanho a partir do qual o arquivo é rodado e cópias antigas mantidas
+MAX_BYTES_LOG_INSTRUMENTACAO = 10 * 2**20
+COPIAS_LOG_INSTRUMENTACAO = 3
+
+# Formato dos dados processados; históricos de outro formato são descartados
+VERSAO_FORMATO = "5"
+
+COLUNAS = ['data_compra', 'item', 'unidade_medida', 'valor_unitario',
+           'quantidade', 'valor_total', 'categoria', 'alojamento']
+COLUNAS_TEXTO = ['item', 'unidade_medida', 'categoria', 'alojamento']
+COLUNAS_NUMERICAS = ['valor_unitario', 'quantidade', 'valor_total']
+# Palavras ignoradas ao comparar o cabeçalho da planilha com COLUNAS ('Data da Compra' -> data_compra)
+CONECTIVOS_CABECALHO = {'da', 'de', 'do', 'das', 'dos'}
+DIAS_SEMANA = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DIAS_SEMANA_PT = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+# Exportação dos dados filtrados
+LINHAS_POR_BLOCO = 50_000
+LIMITE_LINHAS_EXCEL = 1_048_576
+
+MESES_PT = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+# Medidas somáveis do cubo de gastos (e as usadas nas listas de produtos)
+MEDIDAS_CUBO = ['valor_total', 'n_compras', 'n_valores', 'quantidade', 'soma_unitario', 'n_unitario']
+MEDIDAS_ITEM = ['valor_total', 'n_valores', 'quantidade', 'soma_unitario', 'n_unitario']
+
+# Faixas do histograma de valores das compras
+BINS_HISTOGRAMA = 30
+
+# Acompanhamento de preços: cada compra é comparada com a mediana das compras
+# anteriores da mesma série (item, ou item × alojamento)
+JANELA_PRECOS = 20             # compras anteriores na mediana móvel
+MIN_HISTORICO_PRECOS = 5       # compras anteriores exigidas antes de julgar um preço
+LIMITE_Z_PRECOS = 3.5          # |z| robusto a partir do qual a compra é marcada
+DISPERSAO_MINIMA_PRECOS = 0.05  # piso da dispersão, em fração da mediana (preços que nunca variam)
+COLUNAS_PRECOS = ['data_compra', 'item', 'alojamento', 'categoria', 'valor_unitario']
+
+# Previsão do gasto mensal por alojamento × categoria
+HORIZONTE_PREVISAO = 3    # meses projetados, a partir do primeiro mês ainda incompleto
+MESES_MIN_SAZONAL = 24    # meses observados para estimar a sazonalidade (dois anos)
+MESES_MIN_TENDENCIA = 6   # com menos meses, a previsão é a média da série
+Z_INTERVALO_PREVISAO = 1.96  # faixa de ~95% em torno do previsto
+
+logger = logging.getLogger(__name__)
+
+
+class Instrumentation:
+    """Tempos por etapa, memória e acertos de cache de cada execução da página (ALIMENTACAO_INSTRUMENTACAO=1 liga)"""
+
+    def __init__(self, ativo=False, caminho_log=None, max_bytes_log=MAX_BYTES_LOG_INSTRUMENTACAO,
+                 copias_log=COPIAS_LOG_INSTRUMENTACAO):
+        self.ativo = ativo
+        self.caminho_log = caminho_log
+        self.max_bytes_log = max_bytes_log
+        self.copias_log = copias_log
+        self.totais = Counter()
+        self.contadores = Counter()
+        self.pico_processo_mb = 0.0
+        self._execucao = contextvars.ContextVar('execucao', default=None)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, etapa):
+        """Soma o tempo do bloco à `etapa` (na execução atual e nos totais)"""
+        if not self.ativo:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracao = time.perf_counter() - inicio
+            execucao = self._execucao.get()
+            if execucao is not None:
+                execucao['etapas'][etapa] += duracao
+            with self._lock:
+                self.totais[etapa] += duracao
+
+    def count(self, nome, quantidade=1):
+        """Incrementa um contador (acertos/erros de cache, downloads...)"""
+        if not self.ativo:
+            return
+        execucao = self._execucao.get()
+        if execucao is not None:
+            execucao['contadores'][nome] += quantidade
+        with self._lock:
+            self.contadores[nome] += quantidade
+
+    def start_rerun(self):
+        if not self.ativo:
+            return
+        # O pico de RSS é do processo: guardar o anterior e zerá-lo para medir só esta execução
+        # (com sessões simultâneas, vale desde o início da execução mais recente)
+        self._update_process_peak(memory_usage_mb().get('rss_pico_mb'))
+        self._execucao.set({'inicio': time.perf_counter(), 'etapas': Counter(), 'contadores': Counter(),
+                            'pico_zerado': reset_peak_rss()})
+
+    def _update_process_peak(self, pico):
+        if pico is not None:
+            with self._lock:
+                self.pico_processo_mb = max(self.pico_processo_mb, pico)
+
+    def finish_rerun(self, **extras):
+        """Fecha a execução atual e retorna seu registro (já gravado no log)"""
+        execucao = self._execucao.get()
+        if not self.ativo or execucao is None:
+            return None
+        self._execucao.set(None)
+
+        memoria = memory_usage_mb()
+        pico = memoria.pop('rss_pico_mb', None)
+        self._update_process_peak(pico)
+        if execucao['pico_zerado'] and pico is not None:
+            memoria['rss_pico_execucao_mb'] = pico
+        registro = {
+            'momento': datetime.now().isoformat(timespec='seconds'),
+            'total_s': round(time.perf_counter() - execucao['inicio'], 4),
+            'etapas_s': {etapa: round(segundos, 4) for etapa, segundos in execucao['etapas'].items()},
+            'contadores': dict(execucao['contadores']),
+            **memoria,
+            'rss_pico_processo_mb': self.pico_processo_mb,
+            **extras,
+        }
+        if self.caminho_log:
+            try:
+                with self._lock:
+                    self._rotate_log()
+                    with open(self.caminho_log, 'a', encoding='utf-8') as arquivo:
+                        arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+            except OSError as e:
+                logger.warning("Não foi possível gravar o log de instrumentação: %s", e)
+        return registro
+
+    def _rotate_log(self):
+        """Roda o log quando ele passa de max_bytes_log: log -> log.1 -> log.2 ..., mantendo copias_log"""
+        if not os.path.exists(self.caminho_log) or os.path.getsize(self.caminho_log) < self.max_bytes_log:
+            return
+        for copia in range(self.copias_log, 0, -1):
+            anterior = f"{self.caminho_log}.{copia - 1}" if copia > 1 else self.caminho_log
+            if os.path.exists(anterior):
+                os.replace(anterior, f"{self.caminho_log}.{copia}")
+
+
+def memory_usage_mb():
+    """RSS atual e pico de RSS do processo (desde o início ou o último reset_peak_rss), em MB"""
+    memoria = {}
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss vem em KB no Linux e em bytes no macOS
+        memoria['rss_pico_mb'] = round(pico / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+    try:
+        with open('/proc/self/statm') as arquivo:
+            memoria['rss_atual_mb'] = round(int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    return memoria
+
+
+def reset_peak_rss():
+    """Zera o pico de RSS do processo (só no Linux); retorna se conseguiu"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as arquivo:
+            arquivo.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def dataframe_memory_mb(df):
+    return round(df.memory_usage(deep=True).sum() / 2**20, 2)
+
+
+def item_version(item):
+    """Identifica a versão de um item do drive (eTag, cTag e data de modificação)"""
+    return (item.get('eTag'), item.get('cTag'), item.get('lastModifiedDateTime'))
+
+
+def is_ledger_workbook(nome):
+    """Se o arquivo é uma das planilhas de compras (atual ou arquivada)"""
+    return PADRAO_ARQUIVO.fullmatch(unicodedata.normalize('NFC', nome)) is not None
+
+
+class GraphUnavailableError(RuntimeError):
+    """O disjuntor do Graph está aberto: as chamadas estão suspensas por um tempo"""
+
+
+class CircuitBreaker:
+    """Disjuntor: após `limite_falhas` falhas seguidas, recusa chamadas por `tempo_aberto` segundos"""
+
+    def __init__(self, limite_falhas=3, tempo_aberto=120):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas = 0
+        self.aberto_ate = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        # Passado o tempo aberto, a próxima chamada é liberada como teste
+        with self._lock:
+            return self.aberto_ate is None or time.monotonic() >= self.aberto_ate
+
+    def record_success(self):
+        with self._lock:
+            self.falhas = 0
+            self.aberto_ate = None
+
+    def record_failure(self):
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+                logger.warning("Graph indisponível: chamadas suspensas por %s s", self.tempo_aberto)
+
+
+def retry_after(response):
+    """Segundos pedidos no cabeçalho Retry-After (número ou data HTTP), ou None"""
+    valor = response.headers.get('Retry-After')
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(tentativa, base=1.0):
+    """Espera exponencial com jitter para a `tentativa` (0, 1, 2...)"""
+    return base * (2 ** tentativa) * random.uniform(0.5, 1.0)
+
+
+class GraphClient:
+    """Cliente do Microsoft Graph de vida longa, compartilhado entre as sessões"""
+
+    SCOPES = ["https://graph.microsoft.com/.default"]
+    CAMPOS_ITEM = "id,name,eTag,cTag,lastModifiedDateTime,size,@microsoft.graph.downloadUrl"
+
+    def __init__(self, app, graph_url=GRAPH_URL, token_cache=None, token_cache_path=None, pool_size=10,
+                 instrumentacao=None, max_tentativas=4, tamanho_bloco=TAMANHO_BLOCO_DOWNLOAD,
+                 circuito=None, sleep=time.sleep, intervalo_descoberta=INTERVALO_DESCOBERTA):
+        self.app = app  # ConfidentialClientApplication, ou um substituto com acquire_token_for_client
+        self.max_tentativas = max_tentativas
+        self.tamanho_bloco = tamanho_bloco
+        self.circuito = circuito or CircuitBreaker()
+        self._sleep = sleep
+        self.instrumentacao = instrumentacao or Instrumentation()
+        self.graph_url = graph_url.rstrip('/')
+        self.token_cache = token_cache
+        self.token_cache_path = token_cache_path
+        self.site_id = None
+        self.item_ids = None
+        self.descoberto_em = None
+        self.intervalo_descoberta = intervalo_descoberta
+        self._lock = threading.Lock()
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _headers(self):
+        # O MSAL devolve o token em cache enquanto ele for válido
+        result = self.app.acquire_token_for_client(scopes=self.SCOPES)
+        if "access_token" not in result:
+            raise RuntimeError(result.get('error_description', 'Falha ao obter token do Azure AD'))
+        self._save_token_cache()
+        return {"Authorization": f"Bearer {result['access_token']}"}
+
+    def _save_token_cache(self):
+        """Persiste o cache de tokens em disco, se configurado"""
+        if self.token_cache is None or not self.token_cache_path or not self.token_cache.has_state_changed:
+            return
+        with self._lock:
+            fd = os.open(self.token_cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as arquivo:
+                arquivo.write(self.token_cache.serialize())
+            self.token_cache.has_state_changed = False
+
+    def get(self, url, headers=None, autenticar=True, **kwargs):
+        """GET com timeout, novas tentativas (falhas de rede e 429/5xx) e disjuntor"""
+        import requests
+
+        if not self.circuito.allow():
+            raise GraphUnavailableError("SharePoint indisponível ou limitando requisições; nova tentativa em instantes")
+        kwargs.setdefault('timeout', TIMEOUT_GRAPH)
+
+        for tentativa in range(self.max_tentativas):
+            try:
+                cabecalhos = {**(self._headers() if autenticar else {}), **(headers or {})}
+                with self.instrumentacao.measure('graph'):
+                    response = self.session.get(url, headers=cabecalhos, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                erro, espera = e, None
+            else:
+                if response.status_code not in STATUS_TEMPORARIOS_GRAPH:
+                    # 401/403/404 são respostas do Graph, mas não provam que ele voltou
+                    if response.status_code < 400:
+                        self.circuito.record_success()
+                    return response
+                erro = requests.HTTPError(f"{response.status_code} ao acessar o Graph", response=response)
+                espera = retry_after(response)
+
+            if tentativa + 1 < self.max_tentativas:
+                self.instrumentacao.count('graph_nova_tentativa')
+                self._sleep(min(espera if espera is not None else backoff_delay(tentativa), ESPERA_MAXIMA_GRAPH))
+
+        # Aberto, o disjuntor suspende as chamadas e o painel segue com a última versão boa
+        self.circuito.record_failure()
+        raise erro
+
+    def resolve_site_id(self):
+        """Resolve (uma única vez) o id do site da Intranet"""
+        if self.site_id is None:
+            response = self.get(f"{self.graph_url}/sites/{SITE_SHAREPOINT}")
+            response.raise_for_status()
+            self.site_id = response.json()['id']
+        return self.site_id
+
+    def _search_items(self):
+        """Todas as planilhas de compras do drive, seguindo a paginação da busca"""
+        site_id = self.resolve_site_id()
+        url = f"{self.graph_url}/sites/{site_id}/drive/root/search(q='{PREFIXO_ARQUIVO}')"
+        itens = []
+        while url:
+            response = self.get(url)
+            response.raise_for_status()
+            pagina = response.json()
+            itens.extend(item for item in pagina.get('value', []) if is_ledger_workbook(item.get('name', '')))
+            url = pagina.get('@odata.nextLink')
+        return itens
+
+    def get_item(self, item_id):
+        """Metadados atuais de um item (id, eTag, cTag, lastModifiedDateTime); None se sumiu"""
+        response = self.get(
+            f"{self.graph_url}/sites/{self.resolve_site_id()}/drive/items/{item_id}",
+            params={'$select': self.CAMPOS_ITEM}
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def get_items(self):
+        """Metadados atuais de todas as planilhas de compras, em ordem de nome"""
+        # Sempre pelo id: a busca do SharePoint demora a refletir alterações. Se uma planilha
+        # sumiu (movida ou recriada), a busca é refeita na hora
+        for _ in range(2):
+            if not self.item_ids or time.monotonic() - self.descoberto_em > self.intervalo_descoberta:
+                self.item_ids = [item['id'] for item in self._search_items()]
+                self.descoberto_em = time.monotonic()
+            with ThreadPoolExecutor(MAX_LEITURAS_PARALELAS) as pool:
+                itens = list(pool.map(self.get_item, self.item_ids))
+            if None not in itens:
+                break
+            self.item_ids = None
+        return sorted((item for item in itens if item is not None), key=lambda item: item['name'])
+
+    def download(self, item):
+        """Conteúdo binário do item, baixado em faixas de bytes (HTTP Range), cada uma com suas tentativas"""
+        url = item.get('@microsoft.graph.downloadUrl')
+        autenticar = url is None
+        if url is None:
+            url = f"{self.graph_url}/sites/{self.resolve_site_id()}/drive/items/{item['id']}/content"
+
+        tamanho = item.get('size') or 0
+        if tamanho <= self.tamanho_bloco:
+            response = self.get(url, autenticar=autenticar)
+            response.raise_for_status()
+            return response.content
+
+        conteudo = bytearray()
+        # Limite de faixas: o dobro das esperadas, para servidores que devolvem menos que o pedido
+        for _ in range(2 * -(-tamanho // self.tamanho_bloco)):
+            if len(conteudo) >= tamanho:
+                break
+            fim = min(len(conteudo) + self.tamanho_bloco, tamanho) - 1
+            response = self.get(url, headers={'Range': f"bytes={len(conteudo)}-{fim}"}, autenticar=autenticar)
+            response.raise_for_status()
+            if response.status_code != 206:
+                # Servidor ignorou o Range e mandou o arquivo inteiro
+                return response.content
+            if not response.content:
+                raise RuntimeError(f"Download de '{item.get('name')}' parou em {len(conteudo)} de {tamanho} bytes")
+            conteudo += response.content
+        if len(conteudo) < tamanho:
+            raise RuntimeError(f"Download de '{item.get('name')}' incompleto: {len(conteudo)} de {tamanho} bytes")
+        return bytes(conteudo)
+
+
+def load_token_cache(caminho=None):
+    """Cache de tokens do MSAL, com o conteúdo gravado em `caminho` (se houver)"""
+    from msal import SerializableTokenCache
+
+    token_cache = SerializableTokenCache()
+    if caminho and os.path.exists(caminho):
+        with open(caminho) as arquivo:
+            token_cache.deserialize(arquivo.read())
+    return token_cache
+
+
+def create_graph_client(azure, instrumentacao=None):
+    """GraphClient configurado pela seção [azure] dos secrets (um dicionário)"""
+    from msal import ConfidentialClientApplication
+
+    token_cache_path = azure.get("token_cache_path")
+    token_cache = load_token_cache(token_cache_path)
+
+    app = ConfidentialClientApplication(
+        azure["client_id"],
+        authority=f"https://login.microsoftonline.com/{azure['tenant_id']}",
+        client_credential=azure["client_secret"],
+        token_cache=token_cache,
+    )
+    return GraphClient(
+        app,
+        graph_url=azure.get("graph_url", GRAPH_URL),
+        token_cache=token_cache,
+        token_cache_path=token_cache_path,
+        instrumentacao=instrumentacao,
+    )
+
+
+class HistoryStore:
+    """Histórico local das compras processadas, em partições mensais (Parquet)"""
+
+    MANIFESTO = "manifesto.json"
+    SEM_DATA = "sem_data"  # compras sem data válida
+    IDADE_TEMPORARIO_ORFAO = 3600  # (s) temporário mais velho que isso é de uma gravação interrompida
+
+    def __init__(self, diretorio=None, em_memoria=True):
+        if diretorio is None and not em_memoria:
+            raise ValueError("Histórico fora da memória precisa de um diretório")
+        # Sem diretório, o histórico fica só em memória; com em_memoria=False (motor DuckDB), só em disco
+        self.diretorio = diretorio
+        self.em_memoria = em_memoria
+        self.versao = None
+        self.meses = {}  # mes -> (hash, compras, cubo); sem compras/cubo fora da memória
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def load(self):
+        """Carrega as partições gravadas; retorna se havia histórico válido"""
+        if self.diretorio is None:
+            return False
+        try:
+            with open(self._caminho(self.MANIFESTO), encoding='utf-8') as arquivo:
+                manifesto = json.load(arquivo)
+            if manifesto.get('formato') != VERSAO_FORMATO:
+                logger.info("Histórico local em formato antigo, ignorando: %s", self.diretorio)
+                return False
+            meses = {}
+            for mes, hash_mes in manifesto['meses'].items():
+                if not self.em_memoria:
+                    meses[mes] = (hash_mes, None, None)
+                    continue
+                # A conversão copia as colunas para o pandas; liberar o Arrow coluna a coluna
+                # evita ter as duas cópias inteiras ao mesmo tempo
+                compras, cubo = (
+                    pq.read_table(self._caminho(f"{tipo}-{mes}-{hash_mes}.parquet"))
+                      .to_pandas(split_blocks=True, self_destruct=True)
+                    for tipo in ('compras', 'cubo')
+                )
+                meses[mes] = (hash_mes, compras, cubo)
+        except FileNotFoundError:
+            return False
+        except (OSError, KeyError, ValueError, pa.ArrowException) as e:
+            logger.warning("Histórico local inválido (%s): %s", self.diretorio, e)
+            return False
+
+        self.versao = tuple(tuple(versao_item) for versao_item in manifesto['versao'])
+        self.meses = meses
+        return True
+
+    @classmethod
+    def month_hashes(cls, tipado):
+        """Hash das linhas de origem de cada mês, e as posições dessas linhas"""
+        datas = pd.to_datetime(tipado['data_compra'])
+        meses = (datas.dt.year * 100 + datas.dt.month).fillna(0).astype('int64').to_numpy()
+        hashes = pd.util.hash_pandas_object(tipado[COLUNAS], index=False).to_numpy()
+
+        # Soma dos hashes (com estouro) e contagem: não depende da ordem das linhas
+        grupos = pd.Series(hashes).groupby(meses)
+        somas, contagens = grupos.sum(), grupos.size()
+        posicoes = grupos.indices
+        return {
+            f"{mes // 100:04d}-{mes % 100:02d}" if mes else cls.SEM_DATA:
+                (f"{somas[mes]:016x}{contagens[mes]:x}", posicoes[mes])
+            for mes in somas.index
+        }
+
+    def update(self, tipado, versao):
+        """Aplica uma nova leitura da origem; retorna os meses reprocessados"""
+        # Só os meses cujo hash mudou (compras novas, corrigidas ou apagadas) são reprocessados
+        atuais = self.month_hashes(tipado)
+        alterados = [mes for mes, (hash_mes, _) in atuais.items()
+                     if self.meses.get(mes, (None,))[0] != hash_mes]
+
+        meses = {mes: self.meses[mes] for mes in atuais if mes not in alterados}
+        for mes in alterados:
+            hash_mes, posicoes = atuais[mes]
+            compras = process_data(tipado.iloc[posicoes].reset_index(drop=True))
+            # Em ordem de data: o histórico inteiro já sai ordenado para o FilterIndex
+            compras = compras.sort_values('data_compra', kind='stable', ignore_index=True)
+            for coluna in compras.select_dtypes('category').columns:
+                if not compras[coluna].cat.ordered:
+                    compras[coluna] = compras[coluna].cat.remove_unused_categories()
+            meses[mes] = (hash_mes, compras, build_spend_cube(compras))
+
+        removidos = set(self.meses) - set(meses)
+        if self.diretorio is not None and (alterados or removidos or versao != self.versao):
+            try:
+                self._save(meses, versao, alterados)
+            except (OSError, pa.ArrowException) as e:
+                if not self.em_memoria:
+                    raise
+                logger.warning("Não foi possível gravar o histórico local: %s", e)
+        if not self.em_memoria:
+            meses = {mes: (hash_mes, None, None) for mes, (hash_mes, _, _) in meses.items()}
+        self.meses = dict(sorted(meses.items()))
+        self.versao = versao
+        return alterados
+
+    def _save(self, meses, versao, alterados):
+        os.makedirs(self.diretorio, exist_ok=True)
+        for mes in alterados:
+            hash_mes, compras, cubo = meses[mes]
+            for tipo, df in (('compras', compras), ('cubo', cubo)):
+                caminho = self._caminho(f"{tipo}-{mes}-{hash_mes}.parquet")
+                temporario = f"{caminho}.{os.getpid()}.tmp"
+                pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temporario)
+                os.replace(temporario, caminho)
+
+        # Manifesto por último e atômico: uma gravação interrompida deixa no máximo arquivos órfãos
+        manifesto = {
+            'formato': VERSAO_FORMATO,
+            'versao': [list(versao_item) for versao_item in versao],
+            'meses': {mes: hash_mes for mes, (hash_mes, _, _) in sorted(meses.items())},
+        }
+        caminho = self._caminho(self.MANIFESTO)
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(manifesto, arquivo)
+        os.replace(temporario, caminho)
+
+        # Apagar as partições que nem este manifesto nem o anterior citam (consultas da
+        # versão anterior ainda podem estar lendo as dela) e os temporários de gravações
+        # interrompidas (um temporário recente pode ser de uma gravação em andamento)
+        em_uso = {os.path.basename(caminho)
+                  for arquivos in (self.files(meses), self.files())
+                  for caminhos in arquivos.values() for caminho in caminhos.values()}
+        agora = time.time()
+        for nome in os.listdir(self.diretorio):
+            caminho = self._caminho(nome)
+            try:
+                if nome.endswith('.tmp'):
+                    orfao = agora - os.path.getmtime(caminho) > self.IDADE_TEMPORARIO_ORFAO
+                else:
+                    orfao = nome.endswith('.parquet') and nome not in em_uso
+                if orfao:
+                    os.remove(caminho)
+            except OSError:
+                pass
+
+    def files(self, meses=None):
+        """Caminho da partição de cada mês: {'compras': {mes: caminho}, 'cubo': {...}}"""
+        meses = self.meses if meses is None else meses
+        return {
+            tipo: {mes: self._caminho(f"{tipo}-{mes}-{hash_mes}.parquet") for mes, (hash_mes, _, _) in meses.items()}
+            for tipo in ('compras', 'cubo')
+        }
+
+    def frames(self):
+        """Compras e cubo de gastos de todo o histórico, já processados"""
+        if not self.meses or not self.em_memoria:
+            return None, None
+        partes = list(self.meses.values())
+        compras = concat_frames([compras for _, compras, _ in partes])
+        cubo = concat_frames([cubo for _, _, cubo in partes])
+
+        # Os meses passam a ser recortes (sem cópia) do histórico inteiro
+        limites_compras = np.cumsum([0] + [len(compras_mes) for _, compras_mes, _ in partes])
+        limites_cubo = np.cumsum([0] + [len(cubo_mes) for _, _, cubo_mes in partes])
+        self.meses = {
+            mes: (hash_mes,
+                  compras.iloc[limites_compras[i]:limites_compras[i + 1]],
+                  cubo.iloc[limites_cubo[i]:limites_cubo[i + 1]])
+            for i, (mes, (hash_mes, _, _)) in enumerate(self.meses.items())
+        }
+        return compras, cubo
+
+
+def is_blank(valor):
+    """Célula vazia: chega como None (openpyxl), '' (calamine) ou NaN (pandas)"""
+    return valor is None or valor == '' or valor != valor
+
+
+def text_column(valores):
+    """Coluna de texto categórica; códigos numéricos viram texto para as categorias terem um só tipo"""
+    textos = [
+        None if is_blank(valor)
+        else valor if isinstance(valor, str)
+        else str(int(valor)) if isinstance(valor, float) and valor.is_integer()
+        else str(valor)
+        for valor in valores
+    ]
+    return pd.Categorical(textos)
+
+
+def date_column(valores):
+    """Datas das compras e a máscara das células preenchidas que não puderam ser lidas como data"""
+    serie = pd.Series(valores, dtype=object)
+    try:
+        return pd.to_datetime(serie), np.zeros(len(serie), dtype=bool)
+    except (ValueError, TypeError):
+        pass
+    # Alguma célula não é data (p.ex. texto digitado): ler uma a uma, as ilegíveis viram NaT
+    preenchidas = ~serie.map(is_blank).to_numpy(dtype=bool)
+    datas = pd.to_datetime(serie.where(serie.map(lambda valor: isinstance(valor, (str, date))), None),
+                           errors='coerce', format='mixed', dayfirst=True)
+    return datas, preenchidas & datas.isna().to_numpy()
+
+
+def drop_unreadable_dates(df, invalidas):
+    """Descarta as linhas com data ilegível; a contagem fica em df.attrs['linhas_descartadas']"""
+    if invalidas.any():
+        df = df[~invalidas].reset_index(drop=True)
+    df.attrs['linhas_descartadas'] = int(invalidas.sum())
+    return df
+
+
+def typed_columns(linhas):
+    """DataFrame com as 8 colunas da planilha já tipadas, a partir das linhas de dados (sem o cabeçalho)"""
+    # Linhas inteiramente vazias (no fim ou no meio da aba) não são compras
+    linhas = [linha[:len(COLUNAS)] for linha in linhas if not all(map(is_blank, linha[:len(COLUNAS)]))]
+    colunas = dict(zip(COLUNAS, zip(*linhas))) if linhas else dict.fromkeys(COLUNAS, ())
+    del linhas
+
+    def texto(nome):
+        return text_column(colunas[nome])
+
+    data_compra, invalidas = date_column(colunas['data_compra'])
+
+    def numero(nome):
+        return pd.to_numeric(pd.Series(colunas[nome], dtype=object), errors='coerce')
+
+    df = pd.DataFrame({
+        'data_compra': data_compra,
+        'item': texto('item'),
+        'unidade_medida': texto('unidade_medida'),
+        'valor_unitario': numero('valor_unitario'),
+        'quantidade': numero('quantidade'),
+        'valor_total': numero('valor_total'),
+        'categoria': texto('categoria'),
+        'alojamento': texto('alojamento'),
+    })
+    return drop_unreadable_dates(df, invalidas)
+
+
+def column_name(titulo):
+    """Título de coluna da planilha no formato de COLUNAS, sem acentos nem conectivos"""
+    texto = unicodedata.normalize('NFKD', str(titulo)).encode('ascii', 'ignore').decode().casefold()
+    return '_'.join(palavra for palavra in re.findall(r'[a-z0-9]+', texto) if palavra not in CONECTIVOS_CABECALHO)
+
+
+def has_ledger_header(cabecalho):
+    """Se a linha de cabeçalho tem, na ordem, as 8 colunas do livro de compras"""
+    cabecalho = list(cabecalho if cabecalho is not None else ())[:len(COLUNAS)]
+    return [column_name(valor) if valor is not None else '' for valor in cabecalho] == COLUNAS
+
+
+def read_sheets(abas):
+    """Lê as abas de uma planilha, dadas como (nome, linhas com o cabeçalho na primeira)"""
+    partes = []
+    for nome, linhas in abas:
+        linhas = iter(linhas)
+        cabecalho = next(linhas, None)
+        if not has_ledger_header(cabecalho):
+            logger.info("Aba '%s' ignorada: cabeçalho %s não tem as colunas do livro de compras",
+                        nome, list(cabecalho or ())[:len(COLUNAS)])
+            continue
+        parte = typed_columns(linhas)
+        if parte.attrs['linhas_descartadas']:
+            logger.warning("Aba '%s': %d linhas com data ilegível descartadas",
+                           nome, parte.attrs['linhas_descartadas'])
+        partes.append(parte)
+    if not partes:
+        raise ValueError("Nenhuma aba da planilha tem as colunas do livro de compras")
+    return with_dropped_rows(concat_frames(partes), partes)
+
+
+def with_dropped_rows(df, partes):
+    """Soma em df.attrs['linhas_descartadas'] as linhas descartadas das abas"""
+    df.attrs['linhas_descartadas'] = sum(parte.attrs.get('linhas_descartadas', 0) for parte in partes)
+    return df
+
+
+def concat_frames(partes):
+    """Junta abas ou planilhas já tipadas num só DataFrame, mantendo as colunas categóricas"""
+    partes = [parte for parte in partes if len(parte)] or partes[:1]
+    if len(partes) == 1:
+        return partes[0].reset_index(drop=True)
+
+    colunas = {}
+    for coluna in partes[0].columns:
+        series = [parte[coluna] for parte in partes]
+        if all(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+            try:
+                colunas[coluna] = union_categoricals(series, sort_categories=not series[0].cat.ordered)
+                continue
+            except TypeError:  # categorias de tipos diferentes (números e textos)
+                series = [serie.astype(object) for serie in series]
+        colunas[coluna] = pd.concat(series, ignore_index=True)
+    return pd.DataFrame(colunas)
+
+
+def read_workbook_calamine(conteudo):
+    """Lê as abas com o calamine (Rust), bem mais rápido que o openpyxl"""
+    import python_calamine
+
+    livro = python_calamine.CalamineWorkbook.from_filelike(io.BytesIO(conteudo))
+    return read_sheets(
+        (nome, livro.get_sheet_by_name(nome).to_python(skip_empty_area=True)) for nome in livro.sheet_names
+    )
+
+
+def read_workbook_openpyxl(conteudo):
+    """Lê as abas com o openpyxl em modo somente leitura (streaming), só nas 8 colunas usadas"""
+    import openpyxl
+
+    livro = openpyxl.load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True, keep_links=False)
+    try:
+        def abas():
+            for aba in livro.worksheets:
+                aba.reset_dimensions()  # dimensões gravadas por alguns programas vêm erradas
+                yield aba.title, aba.iter_rows(max_col=len(COLUNAS), values_only=True)
+        return read_sheets(abas())
+    finally:
+        livro.close()
+
+
+def read_workbook_pandas(conteudo):
+    """Leitura pelo `pd.read_excel` (caminho antigo, mantido como referência)"""
+    abas = pd.read_excel(io.BytesIO(conteudo), sheet_name=None)
+    partes = []
+    for aba in abas.values():
+        if not has_ledger_header(aba.columns):
+            continue
+        parte = aba.iloc[:, :len(COLUNAS)].set_axis(COLUNAS, axis=1).dropna(how='all').reset_index(drop=True)
+        data_compra, invalidas = date_column(parte['data_compra'])
+        parte = parte.assign(
+            data_compra=data_compra,
+            **{nome: text_column(parte[nome]) for nome in COLUNAS_TEXTO},
+            **{nome: pd.to_numeric(parte[nome], errors='coerce') for nome in COLUNAS_NUMERICAS},
+        )
+        partes.append(drop_unreadable_dates(parte, invalidas))
+    if not partes:
+        raise ValueError("Nenhuma aba da planilha tem as colunas do livro de compras")
+    return with_dropped_rows(concat_frames(partes), partes)
+
+
+LEITORES_EXCEL = {
+    'calamine': read_workbook_calamine,
+    'openpyxl': read_workbook_openpyxl,
+    'pandas': read_workbook_pandas,
+}
+
+
+def excel_engines():
+    """Leitores disponíveis neste ambiente, do mais rápido ao mais lento"""
+    return [motor for motor in LEITORES_EXCEL if motor != 'calamine' or is_installed('python_calamine')]
+
+
+def read_workbook(conteudo, motor=None):
+    """Lê todas as abas da planilha (bytes do .xlsx) com o leitor escolhido em MOTOR_EXCEL"""
+    motor = motor or MOTOR_EXCEL
+    if motor == 'auto':
+        motor = excel_engines()[0]
+    if motor not in excel_engines():
+        raise ValueError(f"Leitor de Excel indisponível: {motor}")
+    return LEITORES_EXCEL[motor](conteudo)
+
+
+def sync_workbook(client, estado, historico=None):
+    """Sincroniza as planilhas de compras com o SharePoint, baixando só as que mudaram; retorna a versão"""
+    # estado: versao, df, cubo e partes (planilhas já lidas, por id) da última sincronização
+    if historico is None:
+        historico = estado.setdefault('historico', HistoryStore())
+    instrumentacao = client.instrumentacao
+    itens = client.get_items()
+    if not itens:
+        return None
+
+    versao = tuple(item_version(item) for item in itens)
+    if estado.get('versao') == versao:
+        # Nenhuma planilha mudou desde a última sincronização
+        instrumentacao.count('sharepoint_inalterado')
+        return versao
+
+    # Baixar e ler, em paralelo, as planilhas novas ou alteradas
+    anteriores = estado.get('partes') or {}
+    pendentes = [item for item in itens if anteriores.get(item['id'], (None,))[0] != item_version(item)]
+    instrumentacao.count('sharepoint_download', len(pendentes))
+
+    def carregar(item):
+        conteudo = client.download(item)
+        with instrumentacao.measure('read_excel'):
+            return read_workbook(conteudo)
+
+    with ThreadPoolExecutor(max(1, min(MAX_LEITURAS_PARALELAS, len(pendentes)))) as pool:
+        lidos = dict(zip([item['id'] for item in pendentes], pool.map(carregar, pendentes)))
+
+    partes = {
+        item['id']: (item_version(item), lidos[item['id']] if item['id'] in lidos else anteriores[item['id']][1])
+        for item in itens
+    }
+    # Linhas com data ilegível descartadas, por planilha, para o aviso no painel
+    descartadas = estado.get('linhas_descartadas') or {}
+    descartadas = {
+        item['name']: lidos[item['id']].attrs['linhas_descartadas'] if item['id'] in lidos
+        else descartadas.get(item['name'], 0)
+        for item in itens
+    }
+    with instrumentacao.measure('process_data'):
+        alterados = historico.update(concat_frames([tipado for _, tipado in partes.values()]), versao)
+        df, cubo = historico.frames()
+    instrumentacao.count('meses_reprocessados', len(alterados))
+
+    # Fora da memória, as planilhas lidas também não ficam guardadas
+    estado.update(versao=versao, df=df, cubo=cubo, partes=partes if historico.em_memoria else {},
+                  linhas_descartadas={nome: linhas for nome, linhas in descartadas.items() if linhas})
+    return versao
+
+
+class DataRefresher:
+    """Última versão boa dos dados, atualizada em segundo plano, uma atualização por vez"""
+
+    def __init__(self, client, intervalo=INTERVALO_ATUALIZACAO, diretorio_historico=DIRETORIO_HISTORICO,
+                 em_memoria=True):
+        self.client = client
+        self.intervalo = intervalo
+        self.historico = HistoryStore(diretorio_historico, em_memoria)
+        # (versao, df, cubo, partições em disco do motor DuckDB), sempre trocados juntos
+        self.dados = (None, None, None, None)
+        self.verificado_em = None  # time.monotonic() da última verificação
+        self.ultimo_erro = None
+        self.linhas_descartadas = {}  # planilha -> linhas com data ilegível, na última sincronização
+        self._estado = {'versao': None, 'df': None}
+        self._lock = threading.Lock()
+        self._concluida = None  # Event da atualização em andamento
+        self._repetir = False
+
+        # Partir do histórico local para não fazer o primeiro usuário esperar
+        if self.historico.load():
+            df, cubo = self.historico.frames()
+            self._estado.update(versao=self.historico.versao, df=df, cubo=cubo)
+            self.dados = self._snapshot(self.historico.versao, df, cubo)
+
+    def _snapshot(self, versao, df, cubo):
+        arquivos = None if self.historico.em_memoria else self.historico.files()
+        return versao, df, cubo, arquivos
+
+    def is_stale(self):
+        return self.verificado_em is None or time.monotonic() - self.verificado_em > self.intervalo
+
+    def schedule(self, prioridade=False):
+        """Dispara uma atualização, se não houver outra em andamento; retorna o Event de conclusão"""
+        with self._lock:
+            if self._concluida is not None:
+                # Com prioridade (botão "Atualizar Dados"), repetir ao terminar a que está em andamento
+                self._repetir = self._repetir or prioridade
+                return self._concluida
+            self._concluida = concluida = threading.Event()
+        threading.Thread(target=self._run, name="atualizacao-sharepoint", daemon=True).start()
+        return concluida
+
+    def _run(self):
+        while True:
+            self._refresh()
+            with self._lock:
+                if self._repetir:
+                    self._repetir = False
+                    continue
+                concluida, self._concluida = self._concluida, None
+            concluida.set()
+            return
+
+    def _refresh(self):
+        self.client.instrumentacao.count('verificacao_sharepoint')
+        try:
+            if sync_workbook(self.client, self._estado, self.historico) is None:
+                self.ultimo_erro = f"Nenhuma planilha '{PREFIXO_ARQUIVO}' encontrada no SharePoint"
+            else:
+                self.dados = self._snapshot(self._estado['versao'], self._estado['df'], self._estado['cubo'])
+                self.linhas_descartadas = self._estado.get('linhas_descartadas', {})
+                self.ultimo_erro = None
+        except Exception as e:
+            logger.warning("Falha ao atualizar os dados do SharePoint: %s", e)
+            self.ultimo_erro = str(e)
+        # Mesmo após falha, só tentar de novo no próximo intervalo (ou pelo botão)
+        self.verificado_em = time.monotonic()
+
+    def current(self, timeout=None):
+        """(versao, df, cubo, arquivos) da última versão boa; só bloqueia se ainda não houver dados"""
+        if self.is_stale():
+            concluida = self.schedule()
+            if self.dados[0] is None:
+                concluida.wait(timeout)
+        return self.dados
+
+
+@functools.cache
+def is_installed(modulo):
+    """Se um módulo opcional (duckdb, python_calamine) está instalado, sem importá-lo"""
+    return importlib.util.find_spec(modulo) is not None
+
+
+def query_engine():
+    """Motor das consultas em uso: o de MOTOR_CONSULTAS, se estiver disponível"""
+    return 'duckdb' if MOTOR_CONSULTAS == 'duckdb' and is_installed('duckdb') else 'pandas'
+
+
+def process_data(df):
+    """Processa e limpa os dados, sem alterar o DataFrame recebido"""
+    if df is None:
+        return None
+
+    # Renomear colunas para facilitar o trabalho
+    df = df.set_axis(COLUNAS, axis=1)
+
+    # Converter tipos de dados (os leitores tipados já entregam as datas prontas)
+    data_compra = df['data_compra']
+    if not pd.api.types.is_datetime64_any_dtype(data_compra):
+        data_compra = pd.to_datetime(data_compra)
+    # Textos categóricos e quantidade no menor inteiro; valores em reais em float64 (centavos nas somas)
+    processado = pd.DataFrame({
+        'data_compra': data_compra,
+        'item': df['item'].astype('category'),
+        'unidade_medida': df['unidade_medida'].astype('category'),
+        'valor_unitario': pd.to_numeric(df['valor_unitario'], errors='coerce'),
+        'quantidade': pd.to_numeric(df['quantidade'], errors='coerce', downcast='integer'),
+        'valor_total': pd.to_numeric(df['valor_total'], errors='coerce'),
+        'categoria': df['categoria'].astype('category'),
+        'alojamento': df['alojamento'].astype('category'),
+    })
+
+    # Adicionar colunas calculadas
+    processado['mes_ano'] = data_compra.dt.to_period('M')
+    processado['dia_semana'] = pd.Categorical(data_compra.dt.day_name(), categories=DIAS_SEMANA, ordered=True)
+    processado['semana'] = data_compra.dt.isocalendar().week.astype('UInt8')
+
+    return processado
+
+
+class FilterIndex:
+    """Índice para os filtros da barra lateral, construído uma vez por versão dos dados"""
+
+    COLUNAS_INDEXADAS = ('alojamento', 'categoria')
+
+    def __init__(self, df):
+        # Linhas em ordem de data (um período vira uma fatia) e, por alojamento e categoria,
+        # as posições ordenadas das suas linhas (os filtros são interseções delas)
+        ordem = np.argsort(df['data_compra'].to_numpy(), kind='stable')
+        if not np.array_equal(ordem, np.arange(len(ordem))):
+            df = df.iloc[ordem]
+        # O histórico já vem em ordem de data e numerado: nesse caso, o mesmo DataFrame, sem cópia
+        self.df = df if df.index.equals(pd.RangeIndex(len(df))) else df.reset_index(drop=True)
+        self.datas = self.df['data_compra'].to_numpy()
+
+        tipo_posicao = np.int32 if len(self.df) < np.iinfo(np.int32).max else np.int64
+        self.posicoes = {}
+        for coluna in self.COLUNAS_INDEXADAS:
+            codigos = self.df[coluna].cat.codes.to_numpy()
+            ordem_codigos = np.argsort(codigos, kind='stable').astype(tipo_posicao)
+            ordem_codigos.flags.writeable = False  # compartilhado entre as sessões
+            categorias = self.df[coluna].cat.categories
+            limites = np.searchsorted(codigos[ordem_codigos], np.arange(len(categorias) + 1))
+            self.posicoes[coluna] = {
+                categoria: ordem_codigos[limites[i]:limites[i + 1]]
+                for i, categoria in enumerate(categorias)
+            }
+
+    def options(self, coluna):
+        """Valores disponíveis para um filtro, em ordem alfabética"""
+        return list(self.posicoes[coluna])
+
+    def date_range(self):
+        """Primeira e última data de compra"""
+        datas = self.df['data_compra']
+        return datas.min().date(), datas.max().date()
+
+    def positions(self, data_inicio, data_fim, alojamento=None, categoria=None):
+        """Posições das linhas que atendem aos filtros (`slice` se só houver período)"""
+        inicio = np.searchsorted(self.datas, np.datetime64(data_inicio), side='left')
+        fim = np.searchsorted(self.datas, np.datetime64(data_fim + timedelta(days=1)), side='left')
+
+        posicoes = None
+        for coluna, valor in zip(self.COLUNAS_INDEXADAS, (alojamento, categoria)):
+            if valor is None:
+                continue
+            linhas = self.posicoes[coluna].get(valor, np.empty(0, dtype=np.int32))
+            # As posições estão ordenadas: recortar o período também com searchsorted
+            linhas = linhas[np.searchsorted(linhas, inicio):np.searchsorted(linhas, fim)]
+            posicoes = linhas if posicoes is None else np.intersect1d(posicoes, linhas, assume_unique=True)
+
+        return slice(inicio, fim) if posicoes is None else posicoes
+
+    def filter(self, data_inicio, data_fim, alojamento=None, categoria=None):
+        """Linhas que atendem aos filtros"""
+        return self.df.iloc[self.positions(data_inicio, data_fim, alojamento, categoria)]
+
+    def unit_prices(self):
+        """Valor unitário de todas as compras, para o acompanhamento de preços"""
+        return self.df[COLUNAS_PRECOS]
+
+    def price_tracking(self, por_alojamento=False):
+        """Acompanhamento de preços de todas as compras"""
+        return PriceTracking(self.unit_prices(), por_alojamento)
+
+    def monthly_spend(self):
+        """Gasto de cada mês por alojamento × categoria, para a previsão de gastos"""
+        return monthly_spend(self.df)
+
+    def __len__(self):
+        return len(self.df)
+
+    def memory_mb(self):
+        return dataframe_memory_mb(self.df)
+
+
+def build_spend_cube(df):
+    """Consolida as compras no grão dia × alojamento × categoria × item (somas e contagens)"""
+    # Somas e contagens (e não médias): qualquer recorte é reagregado somando células
+    dia = df['data_compra'].dt.normalize()
+    cubo = df.groupby([dia, 'alojamento', 'categoria', 'item'], observed=True, dropna=False, sort=False).agg(
+        valor_total=('valor_total', 'sum'),
+        n_compras=('valor_total', 'size'),
+        n_valores=('valor_total', 'count'),
+        quantidade=('quantidade', 'sum'),
+        soma_unitario=('valor_unitario', 'sum'),
+        n_unitario=('valor_unitario', 'count'),
+    ).reset_index()
+
+    return add_calendar_columns(cubo)
+
+
+def add_calendar_columns(cubo):
+    """Acrescenta ao cubo as colunas de calendário usadas nos agrupamentos (mês e dia da semana)"""
+    cubo['mes_ano'] = cubo['data_compra'].dt.to_period('M')
+    cubo['dia_semana'] = pd.Categorical(cubo['data_compra'].dt.day_name(), categories=DIAS_SEMANA, ordered=True)
+    return cubo
+
+
+class Selection:
+    """Recorte dos dados pelos filtros da barra lateral, calculado em memória (pandas)"""
+
+    def __init__(self, indice, indice_cubo, filtros):
+        self.indice = indice
+        self.filtros = filtros
+        self.cubo = indice_cubo.filter(**filtros)
+
+    def __len__(self):
+        """Número de compras no recorte"""
+        return int(self.cubo['n_compras'].sum())
+
+    def purchases(self):
+        """Compras do recorte, em ordem de data"""
+        return self.indice.filter(**self.filtros)
+
+    def item_totals(self):
+        """Somas por item (para as listas de produtos da análise detalhada)"""
+        return self.cubo.groupby('item', observed=True)[MEDIDAS_ITEM].sum()
+
+    def value_histogram(self, nbins=BINS_HISTOGRAMA):
+        valores = self.indice.df['valor_total'].to_numpy()[self.indice.positions(**self.filtros)]
+        return value_histogram(valores, nbins)
+
+    def stats(self):
+        return compute_detailed_stats(self.cubo, self.item_totals())
+
+
+class DuckDBIndex:
+    """Consultas do painel executadas pelo DuckDB direto sobre o histórico em disco"""
+
+    def __init__(self, arquivos):
+        self.arquivos = arquivos  # {'compras': {mes: caminho}, 'cubo': {mes: caminho}}
+        import duckdb
+
+        self._conexao = duckdb.connect()
+        self._selecoes = OrderedDict()
+        self._lock = threading.Lock()
+
+        # O que a barra lateral pede a cada execução é consultado uma vez só
+        fonte = self.source('cubo')
+        resumo = self.query(
+            f"SELECT coalesce(sum(n_compras), 0) AS n, min(data_compra) AS inicio, max(data_compra) AS fim "
+            f"FROM {fonte}"
+        )
+        self._n_compras = int(resumo['n'][0])
+        self._datas = (resumo['inicio'][0].date(), resumo['fim'][0].date())
+        self._opcoes = {
+            coluna: sorted(self.query(
+                f"SELECT DISTINCT {coluna} AS valor FROM {fonte} WHERE {coluna} IS NOT NULL"
+            )['valor'])
+            for coluna in FilterIndex.COLUNAS_INDEXADAS
+        }
+
+    def source(self, tipo, data_inicio=None, data_fim=None, posicao=False):
+        """Expressão FROM com as partições do período (None se não houver nenhuma)"""
+        caminhos = [
+            caminho for mes, caminho in self.arquivos[tipo].items()
+            if data_inicio is None or (mes != HistoryStore.SEM_DATA
+                                       and f"{data_inicio:%Y-%m}" <= mes <= f"{data_fim:%Y-%m}")
+        ]
+        if not caminhos:
+            return None
+        lista = ", ".join("'" + caminho.replace("'", "''") + "'" for caminho in caminhos)
+        # Com `posicao`, o arquivo e a linha de cada compra: a ordem das compras no histórico
+        opcoes = ", filename = true, file_row_number = true" if posicao else ""
+        return f"read_parquet([{lista}], union_by_name = true{opcoes})"
+
+    def query(self, sql, parametros=()):
+        # Um cursor por consulta: a conexão é compartilhada entre as sessões (threads)
+        with self._conexao.cursor() as cursor:
+            return cursor.execute(sql, parametros).df()
+
+    def where(self, data_inicio, data_fim, alojamento=None, categoria=None):
+        """Condição SQL e parâmetros dos filtros da barra lateral"""
+        condicoes = ["data_compra >= ?", "data_compra < ?"]
+        parametros = [datetime.combine(data_inicio, datetime.min.time()),
+                      datetime.combine(data_fim + timedelta(days=1), datetime.min.time())]
+        for coluna, valor in (('alojamento', alojamento), ('categoria', categoria)):
+            if valor is not None:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(valor)
+        return " AND ".join(condicoes), parametros
+
+    def price_tracking(self, por_alojamento=False):
+        """Acompanhamento de preços calculado no DuckDB"""
+        return DuckDBPriceTracking(self, por_alojamento)
+
+    def monthly_spend(self):
+        """Gasto de cada mês por alojamento × categoria, somado no DuckDB"""
+        mensal = self.query(
+            f"SELECT date_trunc('month', data_compra) AS mes_ano, alojamento, categoria, "
+            f"sum(valor_total)::DOUBLE AS valor_total FROM {self.source('cubo')} "
+            f"WHERE data_compra IS NOT NULL GROUP BY ALL"
+        )
+        mensal['mes_ano'] = mensal['mes_ano'].dt.to_period('M')
+        for coluna in ('alojamento', 'categoria'):
+            mensal[coluna] = mensal[coluna].astype('category')
+        return mensal
+
+    def __len__(self):
+        return self._n_compras
+
+    def memory_mb(self):
+        return 0.0
+
+    def options(self, coluna):
+        """Valores disponíveis para um filtro, em ordem alfabética"""
+        return list(self._opcoes[coluna])
+
+    def date_range(self):
+        """Primeira e última data de compra"""
+        return self._datas
+
+    def select(self, data_inicio, data_fim, alojamento=None, categoria=None):
+        """Recorte pelos filtros; os recortes mais recentes ficam guardados"""
+        filtros = dict(data_inicio=data_inicio, data_fim=data_fim, alojamento=alojamento, categoria=categoria)
+        chave = tuple(filtros.values())
+        with self._lock:
+            if chave in self._selecoes:
+                self._selecoes.move_to_end(chave)
+                return self._selecoes[chave]
+        selecao = DuckDBSelection(self, filtros)
+        with self._lock:
+            self._selecoes[chave] = selecao
+            while len(self._selecoes) > MAX_SELECOES_DUCKDB:
+                self._selecoes.popitem(last=False)
+        return selecao
+
+
+class DuckDBSelection(Selection):
+    """Recorte calculado pelo DuckDB: o cubo chega já reduzido ao grão dia × alojamento × categoria"""
+
+    def __init__(self, indice, filtros):
+        self.indice = indice
+        self.filtros = filtros
+        self._condicao, self._parametros = indice.where(**filtros)
+        self._cubo_fonte = indice.source('cubo', filtros['data_inicio'], filtros['data_fim'])
+        self._compras_fonte = indice.source('compras', filtros['data_inicio'], filtros['data_fim'])
+
+        if self._cubo_fonte is None:
+            cubo = pd.DataFrame({'data_compra': pd.Series(dtype='datetime64[ns]'),
+                                 'alojamento': pd.Series(dtype=object), 'categoria': pd.Series(dtype=object),
+                                 **{medida: pd.Series(dtype=float) for medida in MEDIDAS_CUBO}})
+        else:
+            somas = ", ".join(f"sum({medida})::DOUBLE AS {medida}" for medida in MEDIDAS_CUBO)
+            cubo = indice.query(
+                f"SELECT data_compra, alojamento, categoria, {somas} FROM {self._cubo_fonte} "
+                f"WHERE {self._condicao} GROUP BY ALL ORDER BY data_compra",
+                self._parametros,
+            )
+        for coluna in ('alojamento', 'categoria'):
+            cubo[coluna] = cubo[coluna].astype('category')
+        for medida in ('n_compras', 'n_valores', 'n_unitario'):
+            cubo[medida] = cubo[medida].astype('int64')
+        self.cubo = add_calendar_columns(cubo)
+
+    def purchases(self):
+        if self._compras_fonte is None:
+            return process_data(pd.DataFrame({coluna: [] for coluna in COLUNAS}))
+        colunas = ", ".join(COLUNAS)
+        return process_data(self.indice.query(
+            f"SELECT {colunas} FROM {self._compras_fonte} WHERE {self._condicao} ORDER BY data_compra",
+            self._parametros,
+        ))
+
+    def item_totals(self):
+        if self._cubo_fonte is None:
+            return pd.DataFrame(columns=MEDIDAS_ITEM, dtype=float)
+        somas = ", ".join(f"sum({medida})::DOUBLE AS {medida}" for medida in MEDIDAS_ITEM)
+        return self.indice.query(
+            f"SELECT item, {somas} FROM {self._cubo_fonte} "
+            f"WHERE {self._condicao} AND item IS NOT NULL GROUP BY item ORDER BY item",
+            self._parametros,
+        ).set_index('item')
+
+    def value_histogram(self, nbins=BINS_HISTOGRAMA):
+        if self._compras_fonte is None:
+            return value_histogram(np.empty(0), nbins)
+        # Faixas de mesma largura entre o menor e o maior valor, como no np.histogram
+        faixas = self.indice.query(
+            f"""
+            WITH valores AS (
+                SELECT valor_total FROM {self._compras_fonte}
+                WHERE {self._condicao} AND valor_total IS NOT NULL AND NOT isnan(valor_total)
+            ), limites AS (SELECT min(valor_total) AS minimo, max(valor_total) AS maximo FROM valores)
+            SELECT least(floor((valor_total - minimo) / nullif(maximo - minimo, 0) * {nbins}), {nbins - 1})::INTEGER
+                       AS faixa,
+                   count(*) AS n, any_value(minimo) AS minimo, any_value(maximo) AS maximo
+            FROM valores, limites GROUP BY ALL
+            """,
+            self._parametros,
+        )
+        if faixas.empty:
+            return value_histogram(np.empty(0), nbins)
+        minimo, maximo = faixas['minimo'][0], faixas['maximo'][0]
+        if minimo == maximo:
+            minimo, maximo = minimo - 0.5, maximo + 0.5
+        contagens = np.zeros(nbins, dtype=np.int64)
+        contagens[faixas['faixa'].fillna(nbins // 2).astype(int).to_numpy()] = faixas['n'].to_numpy()
+        return np.linspace(minimo, maximo, nbins + 1), contagens
+
+
+def value_histogram(valores, nbins=BINS_HISTOGRAMA):
+    """(bordas, contagens) de faixas de mesma largura, sem mandar cada valor ao navegador"""
+    valores = np.asarray(valores, dtype=float)
+    contagens, bordas = np.histogram(valores[~np.isnan(valores)], bins=nbins)
+    return bordas, contagens
+
+
+def lttb_indices(x, y, n_pontos):
+    """Posições dos pontos escolhidos pelo Largest-Triangle-Three-Buckets (LTTB), que preserva picos e vales"""
+    n = len(x)
+    if n <= n_pontos or n_pontos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # n_pontos - 2 faixas entre o primeiro e o último ponto, e a média de cada uma
+    limites = np.linspace(1, n - 1, n_pontos - 1).astype(np.int64)
+    tamanhos = np.diff(limites)
+    proximo_x = np.append(np.add.reduceat(x[:n - 1], limites[:-1])[1:] / tamanhos[1:], x[-1])
+    proximo_y = np.append(np.add.reduceat(y[:n - 1], limites[:-1])[1:] / tamanhos[1:], y[-1])
+
+    escolhidos = np.empty(n_pontos, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    # De cada faixa, o ponto do maior triângulo com o escolhido na anterior e a média da seguinte
+    anterior = 0
+    for i in range(n_pontos - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        areas = np.abs((x[anterior] - proximo_x[i]) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (proximo_y[i] - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        escolhidos[i + 1] = anterior
+    return escolhidos
+
+
+@dataclass(frozen=True)
+class Kpis:
+    """Indicadores dos cards do topo do painel"""
+
+    total_gasto: float
+    total_itens: int
+    gasto_medio_dia: float
+    variacao_mensal: float  # % do gasto do mês atual sobre o do mês anterior
+    alojamentos_ativos: int
+
+
+def compute_kpis(cubo, hoje=None):
+    """Indicadores principais a partir do cubo de gastos filtrado"""
+    # Métricas gerais
+    total_gasto = cubo['valor_total'].sum()
+    total_itens = int(cubo['n_compras'].sum())
+    gasto_medio_dia = cubo.groupby('data_compra')['valor_total'].sum().mean()
+    alojamentos_ativos = cubo['alojamento'].nunique()
+
+    # Métricas do mês atual vs anterior
+    hoje = hoje or datetime.now()
+    mes_atual = cubo[cubo['data_compra'].dt.month == hoje.month]
+    mes_anterior = cubo[cubo['data_compra'].dt.month == (hoje.month - 1 if hoje.month > 1 else 12)]
+
+    gasto_mes_atual = mes_atual['valor_total'].sum() if len(mes_atual) > 0 else 0
+    gasto_mes_anterior = mes_anterior['valor_total'].sum() if len(mes_anterior) > 0 else 0
+
+    if gasto_mes_anterior > 0:
+        variacao_mensal = ((gasto_mes_atual - gasto_mes_anterior) / gasto_mes_anterior) * 100
+    else:
+        variacao_mensal = 0
+
+    return Kpis(
+        total_gasto=float(total_gasto),
+        total_itens=total_itens,
+        gasto_medio_dia=float(gasto_medio_dia),
+        variacao_mensal=float(variacao_mensal),
+        alojamentos_ativos=int(alojamentos_ativos),
+    )
+
+
+def spend_by(cubo, coluna):
+    """Gasto total por valor de `coluna` (categoria ou alojamento), do maior para o menor"""
+    gastos = cubo.groupby(coluna, observed=True)['valor_total'].sum().reset_index()
+    return gastos.sort_values('valor_total', ascending=False)
+
+
+def daily_spend(cubo):
+    """Gasto total de cada dia, em ordem de data"""
+    return cubo.groupby('data_compra')['valor_total'].sum()
+
+
+def weekday_spend(cubo):
+    """Gasto por categoria (linhas) e dia da semana (colunas, de segunda a domingo)"""
+    df_pivot = cubo.pivot_table(
+        values='valor_total',
+        index='categoria',
+        columns='dia_semana',
+        aggfunc='sum',
+        fill_value=0,
+        observed=True
+    )
+
+    # Reordenar dias da semana
+    return df_pivot.reindex(columns=[dia for dia in DIAS_SEMANA if dia in df_pivot.columns])
+
+
+@dataclass(frozen=True)
+class DetailedStats:
+    """Estatísticas lidas pelas abas de análise detalhada"""
+
+    top_produtos: pd.DataFrame      # item -> quantidade, valor_total (10 mais comprados)
+    produtos_caros: pd.Series       # item -> valor unitário médio (10 mais caros)
+    gastos_mes: pd.DataFrame        # mes_ano, valor_total, mes_ano_str
+    alojamento_stats: pd.DataFrame  # alojamento -> Total Gasto, Gasto Médio, Nº Compras, Quantidade Total
+    gastos_dia_semana: pd.DataFrame  # dia_semana, valor_total (média), dia_pt
+    gastos_sazonalidade: pd.DataFrame  # mes, valor_total (média), mes_nome
+
+
+def compute_detailed_stats(cubo, por_item=None):
+    """Calcula, com uma única agregação por chave, tudo o que as abas detalhadas exibem"""
+    colunas = MEDIDAS_ITEM
+
+    if por_item is None:  # o motor DuckDB já manda as somas por item
+        por_item = cubo.groupby('item', observed=True)[colunas].sum()
+    top_produtos = por_item[['quantidade', 'valor_total']].sort_values('quantidade', ascending=False).head(10)
+    produtos_caros = (por_item['soma_unitario'] / por_item['n_unitario']).sort_values(ascending=False).head(10)
+
+    por_alojamento = cubo.groupby('alojamento', observed=True)[colunas].sum()
+    alojamento_stats = pd.DataFrame({
+        'Total Gasto': por_alojamento['valor_total'],
+        'Gasto Médio': por_alojamento['valor_total'] / por_alojamento['n_valores'],
+        'Nº Compras': por_alojamento['n_valores'],
+        'Quantidade Total': por_alojamento['quantidade']
+    }).round(2).sort_values('Total Gasto', ascending=False)
+
+    por_dia = cubo.groupby('dia_semana', observed=True)[['valor_total', 'n_valores']].sum()
+    gastos_dia_semana = (por_dia['valor_total'] / por_dia['n_valores']).rename('valor_total').reset_index()
+    gastos_dia_semana['dia_pt'] = gastos_dia_semana['dia_semana'].cat.rename_categories(DIAS_SEMANA_PT)
+
+    por_mes = cubo.groupby('mes_ano')[['valor_total', 'n_valores']].sum()
+    gastos_mes = por_mes['valor_total'].reset_index()
+    gastos_mes['mes_ano_str'] = gastos_mes['mes_ano'].astype(str)
+
+    por_mes_do_ano = por_mes.groupby(por_mes.index.month.rename('mes')).sum()
+    gastos_sazonalidade = (por_mes_do_ano['valor_total'] / por_mes_do_ano['n_valores']).rename('valor_total').reset_index()
+    gastos_sazonalidade['mes_nome'] = np.asarray(MESES_PT)[gastos_sazonalidade['mes'].to_numpy() - 1]
+
+    return DetailedStats(
+        top_produtos=top_produtos,
+        produtos_caros=produtos_caros,
+        gastos_mes=gastos_mes,
+        alojamento_stats=alojamento_stats,
+        gastos_dia_semana=gastos_dia_semana,
+        gastos_sazonalidade=gastos_sazonalidade,
+    )
+
+
+def _window_median(janelas):
+    """Mediana de cada linha, ignorando NaN: um só sort para o bloco inteiro"""
+    ordenadas = np.sort(janelas, axis=1)  # NaN vão para o fim da linha
+    n_validos = np.count_nonzero(~np.isnan(janelas), axis=1)
+    baixo = np.maximum(n_validos - 1, 0) // 2
+    alto = n_validos // 2
+    linhas = np.arange(len(janelas))
+    return (ordenadas[linhas, baixo] + ordenadas[linhas, np.minimum(alto, janelas.shape[1] - 1)]) / 2
+
+
+def rolling_prior_median(valores, inicios, janela=JANELA_PRECOS):
+    """Mediana, MAD e número de compras anteriores de cada linha, nas `janela` posições anteriores da série"""
+    # `valores` em ordem de série e data; `inicios`: posição onde começa a série de cada linha.
+    # As janelas são uma visão deslizante sobre o vetor inteiro, com NaN onde invadem a série
+    # anterior; a própria compra fica fora da sua janela
+    n = len(valores)
+    preenchido = np.concatenate([np.full(janela, np.nan), np.asarray(valores, dtype=float)])
+    mediana, mad = np.empty(n), np.empty(n)
+    for inicio in range(0, n, LINHAS_POR_BLOCO):
+        fim = min(inicio + LINHAS_POR_BLOCO, n)
+        # Linha i do bloco: valores[i - janela:i]
+        janelas = sliding_window_view(preenchido[inicio:fim + janela], janela)[:fim - inicio]
+        posicoes = np.arange(inicio, fim)[:, None] - janela + np.arange(janela)
+        janelas = np.where(posicoes >= inicios[inicio:fim, None], janelas, np.nan)
+        mediana[inicio:fim] = _window_median(janelas)
+        mad[inicio:fim] = _window_median(np.abs(janelas - mediana[inicio:fim, None]))
+    n_anteriores = np.minimum(np.arange(n) - inicios, janela)
+    return mediana, mad, n_anteriores
+
+
+class PriceTracking:
+    """Séries de valor unitário por item (ou item × alojamento), com as compras fora da curva"""
+
+    def __init__(self, precos, por_alojamento=False, janela=JANELA_PRECOS, limite_z=LIMITE_Z_PRECOS):
+        self.por_alojamento = por_alojamento
+        precos = precos[precos['item'].notna() & precos['valor_unitario'].notna()]
+        if por_alojamento:
+            precos = precos[precos['alojamento'].notna()]
+
+        # Código da série de cada compra e ordem (série, data)
+        serie = precos['item'].cat.codes.to_numpy().astype(np.int64)
+        if por_alojamento:
+            serie = serie * len(precos['alojamento'].cat.categories) + precos['alojamento'].cat.codes.to_numpy()
+        ordem = np.lexsort((precos['data_compra'].to_numpy(), serie))
+        serie = serie[ordem]
+        precos = precos.iloc[ordem].reset_index(drop=True)
+
+        primeira = np.flatnonzero(np.r_[True, serie[1:] != serie[:-1]])
+        inicios = np.repeat(primeira, np.diff(np.r_[primeira, len(serie)]))
+        valores = precos['valor_unitario'].to_numpy(dtype=float)
+        mediana, mad, n_anteriores = rolling_prior_median(valores, inicios, janela)
+
+        # z robusto: (valor - mediana) / (1,4826 × MAD), com piso de DISPERSAO_MINIMA_PRECOS da mediana
+        escala = np.maximum(1.4826 * mad, DISPERSAO_MINIMA_PRECOS * np.abs(mediana))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = np.where(escala > 0, (valores - mediana) / escala, np.nan)
+        precos['mediana'] = mediana
+        precos['z'] = z
+        precos['anomalia'] = (n_anteriores >= MIN_HISTORICO_PRECOS) & (np.abs(z) >= limite_z)
+
+        self.compras = precos
+        self.series = serie
+        self.anomalias = precos[precos['anomalia'].to_numpy()].sort_values('data_compra', kind='stable')
+
+    def __len__(self):
+        return len(self.compras)
+
+    def anomalies(self, data_inicio, data_fim, alojamento=None, categoria=None):
+        """Compras marcadas dentro dos filtros da barra lateral, das mais fora da curva para as menos"""
+        anomalias = self.anomalias
+        datas = anomalias['data_compra']
+        manter = (datas >= pd.Timestamp(data_inicio)) & (datas < pd.Timestamp(data_fim + timedelta(days=1)))
+        for coluna, valor in (('alojamento', alojamento), ('categoria', categoria)):
+            if valor is not None:
+                manter &= anomalias[coluna] == valor
+        anomalias = anomalias[manter.to_numpy()]
+        variacao = (anomalias['valor_unitario'] / anomalias['mediana'] - 1) * 100
+        return (anomalias.assign(variacao_pct=variacao.round(1))
+                         .sort_values('z', key=np.abs, ascending=False, ignore_index=True))
+
+    def series_rows(self, item, alojamento=None):
+        """Compras de uma série (item, ou item × alojamento), em ordem de data"""
+        itens = self.compras['item'].cat.categories
+        if item not in itens or (self.por_alojamento and alojamento is None):
+            return self.compras.iloc[:0]
+        codigo = itens.get_loc(item)
+        if self.por_alojamento:
+            alojamentos = self.compras['alojamento'].cat.categories
+            if alojamento not in alojamentos:
+                return self.compras.iloc[:0]
+            codigo = codigo * len(alojamentos) + alojamentos.get_loc(alojamento)
+        inicio, fim = np.searchsorted(self.series, [codigo, codigo + 1])
+        return self.compras.iloc[inicio:fim]
+
+    def memory_mb(self):
+        return dataframe_memory_mb(self.compras)
+
+
+class DuckDBPriceTracking(PriceTracking):
+    """Acompanhamento de preços calculado pelo DuckDB: só as compras marcadas ficam em memória"""
+
+    def __init__(self, indice, por_alojamento=False, janela=JANELA_PRECOS, limite_z=LIMITE_Z_PRECOS):
+        self.indice = indice
+        self.por_alojamento = por_alojamento
+        self.janela = janela
+        self.limite_z = limite_z
+        self._fonte = indice.source('compras', posicao=True)
+        if self._fonte is None:
+            self._n_compras = 0
+            self.anomalias = self._empty()
+            return
+        self._n_compras = int(indice.query(
+            f"SELECT count(*) AS n FROM {self._fonte} WHERE {self._condicao()}"
+        )['n'][0])
+        self.anomalias = self._query("anomalia").sort_values('data_compra', kind='stable')
+
+    def _condicao(self):
+        condicao = "item IS NOT NULL AND valor_unitario IS NOT NULL AND NOT isnan(valor_unitario)"
+        return condicao + (" AND alojamento IS NOT NULL" if self.por_alojamento else "")
+
+    def _empty(self):
+        vazio = process_data(pd.DataFrame({coluna: [] for coluna in COLUNAS}))[COLUNAS_PRECOS]
+        return vazio.assign(mediana=np.empty(0), z=np.empty(0), anomalia=np.empty(0, dtype=bool))
+
+    def _query(self, filtro, parametros=()):
+        """Compras com mediana, z e marcação, calculados com janelas do DuckDB (as de PriceTracking)"""
+        serie = "item, alojamento" if self.por_alojamento else "item"
+        precos = self.indice.query(
+            f"""
+            WITH janelas AS (
+                SELECT {', '.join(COLUNAS_PRECOS)},
+                       median(valor_unitario) OVER anteriores AS mediana,
+                       mad(valor_unitario) OVER anteriores AS mad,
+                       count(valor_unitario) OVER anteriores AS n_anteriores
+                FROM {self._fonte}
+                WHERE {self._condicao()}
+                WINDOW anteriores AS (
+                    PARTITION BY {serie} ORDER BY data_compra NULLS FIRST, filename, file_row_number
+                    ROWS BETWEEN {self.janela} PRECEDING AND 1 PRECEDING
+                )
+            ), escalas AS (
+                SELECT *, greatest(1.4826 * mad, {DISPERSAO_MINIMA_PRECOS} * abs(mediana)) AS escala FROM janelas
+            ), precos AS (
+                SELECT {', '.join(COLUNAS_PRECOS)}, mediana::DOUBLE AS mediana,
+                       CASE WHEN escala > 0 THEN ((valor_unitario - mediana) / escala)::DOUBLE END AS z,
+                       n_anteriores
+                FROM escalas
+            )
+            SELECT {', '.join(COLUNAS_PRECOS)}, mediana, z,
+                   coalesce(n_anteriores >= {MIN_HISTORICO_PRECOS} AND abs(z) >= {self.limite_z}, false) AS anomalia
+            FROM precos WHERE {filtro}
+            ORDER BY data_compra NULLS FIRST
+            """,
+            parametros,
+        )
+        for coluna in ('item', 'alojamento', 'categoria'):
+            precos[coluna] = precos[coluna].astype('category')
+        return precos
+
+    def __len__(self):
+        return self._n_compras
+
+    def series_rows(self, item, alojamento=None):
+        """Compras de uma série (item, ou item × alojamento), consultadas só quando ela é escolhida"""
+        if self._fonte is None or (self.por_alojamento and alojamento is None):
+            return self._empty()
+        if self.por_alojamento:
+            return self._query("item = ? AND alojamento = ?", [item, alojamento])
+        return self._query("item = ?", [item])
+
+    def memory_mb(self):
+        return dataframe_memory_mb(self.anomalias)
+
+
+def monthly_spend(df):
+    """Gasto de cada mês por alojamento × categoria (de compras ou do cubo de gastos)"""
+    return (df.groupby(['mes_ano', 'alojamento', 'categoria'], observed=True)['valor_total'].sum()
+              .reset_index())
+
+
+def seasonal_design(n_meses, n_total, mes_inicial):
+    """Matriz de regressão mês a mês: constante, tendência e sazonalidade, conforme os meses observados"""
+    t = np.arange(n_total)
+    colunas = [np.ones(n_total)]
+    if n_meses >= MESES_MIN_TENDENCIA:
+        colunas.append(t / 12)
+    if n_meses >= MESES_MIN_SAZONAL:
+        # Indicadoras de 11 meses do ano; o primeiro mês da série é a referência
+        mes = (mes_inicial - 1 + t) % 12
+        referencia = (mes_inicial - 1) % 12
+        colunas += [(mes == m).astype(float) for m in range(12) if m != referencia]
+    return np.column_stack(colunas)
+
+
+def fit_seasonal_trend(historico, mes_inicial, horizonte=HORIZONTE_PREVISAO):
+    """Ajusta tendência + sazonalidade a um bloco de séries (meses × séries) com um único lstsq"""
+    n_meses = len(historico)
+    x = seasonal_design(n_meses, n_meses + horizonte, mes_inicial)
+    coeficientes, *_ = np.linalg.lstsq(x[:n_meses], historico, rcond=None)
+    ajustado = x @ coeficientes
+    residuos = historico - ajustado[:n_meses]
+    graus_liberdade = max(n_meses - x.shape[1], 1)
+    desvio = np.sqrt((residuos ** 2).sum(axis=0) / graus_liberdade)
+    return np.maximum(ajustado[n_meses:], 0), desvio
+
+
+class SpendForecast:
+    """Previsão do gasto mensal de todas as séries alojamento × categoria, ajustadas em lote"""
+
+    def __init__(self, mensal, ultimo_dia, horizonte=HORIZONTE_PREVISAO, processos=PROCESSOS_PREVISAO):
+        # Só meses completos: o da última compra conta se já terminou
+        ultimo_mes = pd.Period(ultimo_dia, 'M')
+        fim = ultimo_mes if pd.Timestamp(ultimo_dia) >= ultimo_mes.end_time.normalize() else ultimo_mes - 1
+        mensal = mensal[mensal['mes_ano'] <= fim]
+
+        # Meses × séries, com zero nos meses sem compras da série
+        matriz = mensal.pivot_table(index='mes_ano', columns=['alojamento', 'categoria'], values='valor_total',
+                                    aggfunc='sum', fill_value=0, observed=True)
+        if len(matriz):
+            matriz = matriz.reindex(pd.period_range(matriz.index.min(), fim, freq='M'), fill_value=0)
+        self.historico = matriz
+        self.meses_previstos = pd.period_range(fim + 1, periods=horizonte, freq='M')
+
+        valores = matriz.to_numpy(dtype=float)
+        previsao = np.zeros((horizonte, valores.shape[1]))
+        desvio = np.zeros(valores.shape[1])
+        # Cada série começa no seu primeiro mês com gasto; as que começam juntas vão juntas.
+        # Sem nenhum mês completo (planilha começada neste mês) não há séries: previsão vazia
+        primeiro = (valores != 0).argmax(axis=0) if len(valores) else np.zeros(valores.shape[1], dtype=np.int64)
+        blocos = []
+        for inicio in np.unique(primeiro):
+            colunas = np.flatnonzero(primeiro == inicio)
+            blocos += [parte for parte in np.array_split(colunas, max(processos, 1)) if len(parte)]
+        argumentos = (
+            [valores[primeiro[bloco[0]]:, bloco] for bloco in blocos],
+            [matriz.index[primeiro[bloco[0]]].month for bloco in blocos],
+            [horizonte] * len(blocos),
+        )
+        if processos > 1 and len(blocos) > 1:
+            # spawn: o processo do painel tem threads (servidor, atualização em segundo plano)
+            with ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context('spawn')) as pool:
+                resultados = list(pool.map(fit_seasonal_trend, *argumentos))
+        else:
+            resultados = list(map(fit_seasonal_trend, *argumentos))
+        for bloco, (previsto, desvio_bloco) in zip(blocos, resultados):
+            previsao[:, bloco] = previsto
+            desvio[bloco] = desvio_bloco
+
+        self.previsao = pd.DataFrame(previsao, index=self.meses_previstos, columns=matriz.columns)
+        self.desvio = pd.Series(desvio, index=matriz.columns)
+
+    def __len__(self):
+        """Número de séries alojamento × categoria"""
+        return self.historico.shape[1]
+
+    def _series(self, alojamento=None, categoria=None):
+        colunas = self.historico.columns
+        manter = np.ones(len(colunas), dtype=bool)
+        for nivel, valor in (('alojamento', alojamento), ('categoria', categoria)):
+            if valor is not None:
+                manter &= colunas.get_level_values(nivel) == valor
+        return manter
+
+    def totals(self, alojamento=None, categoria=None):
+        """Gasto realizado por mês e previsão (previsto, mínimo, máximo) das séries dos filtros somadas"""
+        manter = self._series(alojamento, categoria)
+        realizado = self.historico.loc[:, manter].sum(axis=1).rename('valor_total')
+        previsto = self.previsao.loc[:, manter].sum(axis=1)
+        # Desvios somados como independentes
+        margem = Z_INTERVALO_PREVISAO * np.sqrt((self.desvio[manter] ** 2).sum())
+        return realizado, pd.DataFrame({
+            'previsto': previsto,
+            'minimo': np.maximum(previsto - margem, 0),
+            'maximo': previsto + margem,
+        })
+
+    def table(self, alojamento=None, categoria=None):
+        """Previsão de cada série dos filtros, uma linha por série e mês previsto"""
+        manter = self._series(alojamento, categoria)
+        previsao = self.previsao.loc[:, manter]
+        margem = Z_INTERVALO_PREVISAO * self.desvio[manter].to_numpy()
+        linhas = previsao.T.stack().rename('previsto').reset_index().rename(columns={'level_2': 'mes'})
+        linhas['mes'] = linhas['mes'].astype(str)
+        linhas['minimo'] = np.maximum(linhas['previsto'] - np.repeat(margem, len(previsao)), 0)
+        linhas['maximo'] = linhas['previsto'] + np.repeat(margem, len(previsao))
+        return linhas
+
+
+def _export_blocks(df):
+    """Percorre as linhas em blocos, com tipos que todos os formatos aceitam"""
+    for inicio in range(0, max(len(df), 1), LINHAS_POR_BLOCO):
+        bloco = df.iloc[inicio:inicio + LINHAS_POR_BLOCO]
+        if 'mes_ano' in bloco:
+            bloco = bloco.assign(mes_ano=bloco['mes_ano'].astype(str))
+        yield inicio, bloco
+
+
+def write_export(df, formato, destino):
+    """Grava `df` em `destino` (arquivo binário) bloco a bloco, sem montar tudo em memória"""
+    if formato == 'csv':
+        for inicio, bloco in _export_blocks(df):
+            destino.write(bloco.to_csv(index=False, header=inicio == 0).encode('utf-8'))
+
+    elif formato == 'parquet':
+        escritor = None
+        for _, bloco in _export_blocks(df):
+            tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(destino, tabela.schema)
+            escritor.write_table(tabela)
+        escritor.close()
+
+    elif formato == 'xlsx':
+        import openpyxl
+
+        # Modo write_only: as linhas vão direto para o arquivo, sem modelo em memória
+        planilha = openpyxl.Workbook(write_only=True)
+        aba, linhas_na_aba = None, LIMITE_LINHAS_EXCEL
+        for _, bloco in _export_blocks(df):
+            linhas = bloco.astype(object).where(bloco.notna(), None).itertuples(index=False, name=None)
+            for linha in linhas:
+                if linhas_na_aba >= LIMITE_LINHAS_EXCEL:
+                    # Excel aceita ~1 milhão de linhas por aba: continuar na próxima
+                    aba = planilha.create_sheet(f"Dados {len(planilha.worksheets) + 1}")
+                    aba.append(list(df.columns))
+                    linhas_na_aba = 1
+                aba.append(linha)
+                linhas_na_aba += 1
+        if aba is None:
+            planilha.create_sheet("Dados 1").append(list(df.columns))
+        planilha.save(destino)
+
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+
+def export_dataframe(df, formato):
+    """Conteúdo do arquivo exportado, gerado em blocos num arquivo temporário"""
+    with tempfile.TemporaryFile() as arquivo:
+        write_export(df, formato, arquivo)
+        arquivo.seek(0)
+        return arquivo.read()
@@ -0,0 +1,278 @@
+"""Figuras Plotly do painel, montadas a partir do cubo de gastos e das estatísticas do núcleo.
+
+Usadas pelo painel e pelo relatório em HTML; importar este módulo carrega o
+Plotly, por isso o núcleo e o relatório em Parquet/JSON não dependem dele.
+"""
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from alimentacao.core import daily_spend, lttb_indices, spend_by, weekday_spend
+
+# Cores da empresa
+CORES_EMPRESA = ['#F7931E', '#000000', '#FF6B35', '#FFB366', '#333333', '#666666', '#999999']
+
+# Pontos da linha do tempo mandados ao navegador (~ largura do gráfico em
+# pixels); períodos mais curtos no filtro de datas mostram todos os dias
+MAX_PONTOS_TIMELINE = 800
+
+
+def build_category_pie(cubo):
+    """Gráfico de gastos por categoria"""
+    gastos_categoria = spend_by(cubo, 'categoria')
+
+    fig_categoria = px.pie(
+        gastos_categoria,
+        values='valor_total',
+        names='categoria',
+        title="💳 Distribuição de Gastos por Categoria",
+        color_discrete_sequence=CORES_EMPRESA
+    )
+    fig_categoria.update_layout(
+        height=400,
+        title_x=0.5,
+        font=dict(size=12),
+        title_font_color='#000000'
+    )
+    return fig_categoria
+
+
+def build_alojamento_bar(cubo):
+    """Gráfico de gastos por alojamento"""
+    gastos_alojamento = spend_by(cubo, 'alojamento').sort_values('valor_total', ascending=True)
+
+    fig_alojamento = px.bar(
+        gastos_alojamento,
+        x='valor_total',
+        y='alojamento',
+        title="🏠 Gastos por Alojamento",
+        orientation='h',
+        color='valor_total',
+        color_continuous_scale=[[0, '#F7931E'], [1, '#000000']]
+    )
+    fig_alojamento.update_layout(
+        height=400,
+        title_x=0.5,
+        showlegend=False,
+        title_font_color='#000000'
+    )
+    return fig_alojamento
+
+
+def build_timeline(cubo, max_pontos=MAX_PONTOS_TIMELINE):
+    """Gráfico de evolução temporal, reduzido (LTTB) e desenhado em WebGL"""
+    gastos_diarios = daily_spend(cubo)
+    dias = gastos_diarios.index.to_numpy().astype('datetime64[D]').astype(np.int64)
+    gastos_diarios = gastos_diarios.iloc[lttb_indices(dias, gastos_diarios.to_numpy(), max_pontos)]
+
+    fig_timeline = go.Figure(go.Scattergl(
+        x=gastos_diarios.index,
+        y=gastos_diarios.to_numpy(),
+        mode='lines',
+        line=dict(color='#F7931E', width=3),
+        hovertemplate='%{x|%d/%m/%Y}<br>R$ %{y:,.2f}<extra></extra>'
+    ))
+    fig_timeline.update_layout(
+        title="📈 Evolução dos Gastos ao Longo do Tempo",
+        height=400,
+        title_x=0.5,
+        xaxis_title="Data",
+        yaxis_title="Valor Total (R$)",
+        title_font_color='#000000'
+    )
+    return fig_timeline
+
+
+def build_heatmap(cubo):
+    """Heatmap de gastos por dia da semana e categoria"""
+    df_pivot = weekday_spend(cubo)
+
+    fig_heatmap = px.imshow(
+        df_pivot.values,
+        x=[dia[:3] for dia in df_pivot.columns],
+        y=df_pivot.index,
+        title="🗓️ Heatmap: Gastos por Categoria e Dia da Semana",
+        color_continuous_scale=[[0, '#FFFFFF'], [0.5, '#F7931E'], [1, '#000000']],
+        aspect='auto'
+    )
+    fig_heatmap.update_layout(
+        height=400,
+        title_x=0.5,
+        xaxis_title="Dia da Semana",
+        yaxis_title="Categoria",
+        title_font_color='#000000'
+    )
+    return fig_heatmap
+
+
+def build_monthly_bar(stats):
+    """Gráfico de gastos por mês"""
+    fig_mes = px.bar(
+        stats.gastos_mes,
+        x='mes_ano_str',
+        y='valor_total',
+        title="📅 Gastos por Mês",
+        color='valor_total',
+        color_continuous_scale=[[0, '#F7931E'], [1, '#000000']]
+    )
+    fig_mes.update_layout(title_font_color='#000000')
+    return fig_mes
+
+
+def build_value_histogram(histograma):
+    """Distribuição de valores das compras, a partir das faixas já contadas (bordas, contagens)"""
+    bordas, contagens = histograma
+    fig_dist = go.Figure(go.Bar(
+        x=(bordas[:-1] + bordas[1:]) / 2,
+        y=contagens,
+        width=np.diff(bordas),
+        marker_color='#F7931E'
+    ))
+    fig_dist.update_layout(
+        title="📊 Distribuição de Valores das Compras",
+        xaxis_title='valor_total',
+        yaxis_title='count',
+        bargap=0,
+        title_font_color='#000000'
+    )
+    return fig_dist
+
+
+def build_alojamento_comparison(stats):
+    """Comparativo de gastos x número de compras por alojamento"""
+    alojamento_stats = stats.alojamento_stats
+    fig_aloj_comp = go.Figure()
+
+    fig_aloj_comp.add_trace(go.Bar(
+        name='Total Gasto',
+        x=alojamento_stats.index,
+        y=alojamento_stats['Total Gasto'],
+        yaxis='y',
+        offsetgroup=1,
+        marker_color='#F7931E'
+    ))
+
+    fig_aloj_comp.add_trace(go.Bar(
+        name='Nº Compras',
+        x=alojamento_stats.index,
+        y=alojamento_stats['Nº Compras'],
+        yaxis='y2',
+        offsetgroup=2,
+        marker_color='#000000'
+    ))
+
+    fig_aloj_comp.update_layout(
+        title="📊 Comparativo: Gastos vs Número de Compras por Alojamento",
+        xaxis_title="Alojamento",
+        yaxis=dict(title="Valor Total (R$)", side="left"),
+        yaxis2=dict(title="Número de Compras", side="right", overlaying="y"),
+        height=500,
+        title_font_color='#000000'
+    )
+    return fig_aloj_comp
+
+
+def build_weekday_bar(stats):
+    """Gasto médio por dia da semana (já na ordem Seg..Dom, só com os dias presentes)"""
+    fig_dia_semana = px.bar(
+        stats.gastos_dia_semana,
+        x='dia_pt',
+        y='valor_total',
+        title="📅 Gasto Médio por Dia da Semana",
+        color='valor_total',
+        color_continuous_scale=[[0, '#F7931E'], [1, '#000000']],
+        text='valor_total'
+    )
+    fig_dia_semana.update_traces(texttemplate='R$ %{text:,.0f}', textposition='outside')
+    fig_dia_semana.update_layout(title_font_color='#000000')
+    return fig_dia_semana
+
+
+def build_seasonality_line(stats):
+    """Sazonalidade mensal"""
+    fig_sazonalidade = px.line(
+        stats.gastos_sazonalidade,
+        x='mes_nome',
+        y='valor_total',
+        title="🌟 Sazonalidade - Gasto Médio por Mês",
+        markers=True
+    )
+    fig_sazonalidade.update_traces(line_color='#F7931E', line_width=3, marker_size=8,
+                                   marker_color='#000000')
+    fig_sazonalidade.update_layout(title_font_color='#000000')
+    return fig_sazonalidade
+
+
+def build_price_series(serie, titulo, max_pontos=MAX_PONTOS_TIMELINE):
+    """Valor unitário de uma série de compras, com a mediana móvel e as compras fora da curva"""
+    datas = serie['data_compra'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    reduzida = serie.iloc[lttb_indices(datas, serie['valor_unitario'].to_numpy(), max_pontos)]
+    anomalias = serie[serie['anomalia'].to_numpy()]
+
+    fig_precos = go.Figure([
+        go.Scattergl(
+            x=reduzida['data_compra'], y=reduzida['valor_unitario'], mode='lines',
+            name='Valor unitário', line=dict(color='#999999', width=1),
+            hovertemplate='%{x|%d/%m/%Y}<br>R$ %{y:,.2f}<extra></extra>'
+        ),
+        go.Scattergl(
+            x=reduzida['data_compra'], y=reduzida['mediana'], mode='lines',
+            name='Mediana móvel', line=dict(color='#F7931E', width=3),
+            hovertemplate='%{x|%d/%m/%Y}<br>Mediana: R$ %{y:,.2f}<extra></extra>'
+        ),
+        go.Scattergl(
+            x=anomalias['data_compra'], y=anomalias['valor_unitario'], mode='markers',
+            name='Fora da curva', marker=dict(color='#FF0000', size=9),
+            customdata=np.column_stack([anomalias['alojamento'].astype(str), anomalias['z'].round(1).astype(str)]),
+            hovertemplate='%{x|%d/%m/%Y}<br>R$ %{y:,.2f}<br>%{customdata[0]}<br>z = %{customdata[1]}<extra></extra>'
+        ),
+    ])
+    fig_precos.update_layout(
+        title=titulo,
+        height=400,
+        title_x=0.5,
+        xaxis_title="Data",
+        yaxis_title="Valor Unitário (R$)",
+        title_font_color='#000000',
+        legend=dict(orientation='h', y=-0.2)
+    )
+    return fig_precos
+
+
+def build_forecast_chart(realizado, previsao, titulo="🔮 Gasto Mensal: Realizado e Previsto"):
+    """Gasto mensal realizado e a previsão dos próximos meses, com a faixa de ~95%"""
+    meses_realizados = realizado.index.to_timestamp()
+    meses_previstos = previsao.index.to_timestamp()
+    # A linha prevista parte do último mês realizado, para as duas se encontrarem
+    inicio_x = list(meses_realizados[-1:])
+    inicio_y = list(realizado.to_numpy()[-1:])
+
+    fig_previsao = go.Figure([
+        go.Scatter(
+            x=list(meses_previstos) + list(meses_previstos[::-1]),
+            y=list(previsao['maximo']) + list(previsao['minimo'][::-1]),
+            fill='toself', fillcolor='rgba(247, 147, 30, 0.2)', line=dict(width=0),
+            name='Faixa (~95%)', hoverinfo='skip'
+        ),
+        go.Scatter(
+            x=meses_realizados, y=realizado.to_numpy(), mode='lines+markers',
+            name='Realizado', line=dict(color='#000000', width=2),
+            hovertemplate='%{x|%m/%Y}<br>R$ %{y:,.2f}<extra></extra>'
+        ),
+        go.Scatter(
+            x=inicio_x + list(meses_previstos), y=inicio_y + list(previsao['previsto']), mode='lines+markers',
+            name='Previsto', line=dict(color='#F7931E', width=3, dash='dash'),
+            hovertemplate='%{x|%m/%Y}<br>Previsto: R$ %{y:,.2f}<extra></extra>'
+        ),
+    ])
+    fig_previsao.update_layout(
+        title=titulo,
+        height=400,
+        title_x=0.5,
+        xaxis_title="Mês",
+        yaxis_title="Valor Total (R$)",
+        title_font_color='#000000',
+        legend=dict(orientation='h', y=-0.2)
+    )
+    return fig_previsao
@@ -0,0 +1,240 @@
+"""Relatório em lote do painel de alimentações, sem Streamlit.
+
+Uso:
+    python -m alimentacao.report [--historico .cache/historico [--sincronizar] | --planilha ARQ.xlsx ...]
+                                 [--inicio AAAA-MM-DD] [--fim AAAA-MM-DD]
+                                 [--alojamento NOME] [--categoria NOME]
+                                 [--formatos parquet json html] [--saida relatorio]
+
+Calcula os mesmos indicadores e agregados dos cards, dos gráficos e da análise
+detalhada do painel, com os mesmos filtros, e grava em --saida uma tabela
+Parquet por agregado, relatorio.json (indicadores, filtros e tabelas) e
+relatorio.html (página estática com as figuras do painel). Os dados vêm do
+histórico local do painel, opcionalmente atualizado antes pelo SharePoint
+(--sincronizar, com as credenciais da seção [azure] de --secrets), ou de
+planilhas locais (--planilha). Próprio para tarefas agendadas (cron).
+"""
+
+import argparse
+import html
+import json
+import os
+import sys
+from dataclasses import asdict
+from datetime import date, datetime
+
+import pandas as pd
+
+from alimentacao.core import (
+    DIRETORIO_HISTORICO, FilterIndex, HistoryStore, PriceTracking, Selection, SpendForecast, compute_kpis,
+    concat_frames, create_graph_client, daily_spend, read_workbook, spend_by, sync_workbook, weekday_spend,
+)
+
+FORMATOS_RELATORIO = ('parquet', 'json', 'html')
+
+
+def load_secrets(caminho):
+    """Secrets do Streamlit (TOML), lidos sem o Streamlit"""
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11: o pacote toml vem junto com o Streamlit
+        import toml
+        with open(caminho, encoding='utf-8') as arquivo:
+            return toml.load(arquivo)
+    with open(caminho, 'rb') as arquivo:
+        return tomllib.load(arquivo)
+
+
+def load_frames(args):
+    """Compras e cubo de gastos processados, da origem escolhida na linha de comando"""
+    if args.planilha:
+        historico = HistoryStore()
+        partes = []
+        for caminho in args.planilha:
+            with open(caminho, 'rb') as arquivo:
+                partes.append(read_workbook(arquivo.read()))
+            report_dropped_rows({caminho: partes[-1].attrs['linhas_descartadas']})
+        versao = tuple((os.path.abspath(caminho), os.path.getmtime(caminho)) for caminho in args.planilha)
+        historico.update(concat_frames(partes), versao)
+    else:
+        historico = HistoryStore(args.historico)
+        historico.load()
+        if args.sincronizar:
+            # Só as planilhas e os meses que mudaram desde a última carga do histórico
+            client = create_graph_client(load_secrets(args.secrets)["azure"])
+            estado = {'versao': historico.versao}
+            sync_workbook(client, estado, historico)
+            report_dropped_rows(estado.get('linhas_descartadas', {}))
+    return historico.frames()
+
+
+def report_dropped_rows(descartadas):
+    """Avisa, no stderr, as linhas com data ilegível que ficaram fora do relatório"""
+    for planilha, linhas in descartadas.items():
+        if linhas:
+            print(f"Aviso: {planilha}: {linhas} linha(s) com data inválida foram ignoradas", file=sys.stderr)
+
+
+def report_tables(cubo, stats, histograma, anomalias, previsao):
+    """Agregados do painel como tabelas planas (cards, gráficos e análise detalhada)"""
+    bordas, contagens = histograma
+    gastos_mes = stats.gastos_mes[['mes_ano_str', 'valor_total']].rename(columns={'mes_ano_str': 'mes_ano'})
+    return {
+        'gastos_categoria': spend_by(cubo, 'categoria'),
+        'gastos_alojamento': spend_by(cubo, 'alojamento'),
+        'gastos_diarios': daily_spend(cubo).reset_index(),
+        'gastos_categoria_dia_semana': weekday_spend(cubo).rename_axis(columns=None).rename(columns=str)
+                                                          .reset_index(),
+        'top_produtos': stats.top_produtos.reset_index(),
+        'produtos_caros': stats.produtos_caros.rename('valor_unitario_medio').rename_axis('item').reset_index(),
+        'gastos_mes': gastos_mes,
+        'alojamento_stats': stats.alojamento_stats.rename_axis('alojamento').reset_index(),
+        'gastos_dia_semana': stats.gastos_dia_semana,
+        'sazonalidade': stats.gastos_sazonalidade,
+        'distribuicao_valores': pd.DataFrame({'inicio': bordas[:-1], 'fim': bordas[1:], 'compras': contagens}),
+        'precos_fora_da_curva': anomalias.drop(columns='anomalia'),
+        'previsao_gastos': previsao,
+    }
+
+
+def write_parquet(tabelas, diretorio):
+    caminhos = []
+    for nome, tabela in tabelas.items():
+        caminho = os.path.join(diretorio, f"{nome}.parquet")
+        tabela.to_parquet(caminho, index=False)
+        caminhos.append(caminho)
+    return caminhos
+
+
+def write_json(kpis, filtros, tabelas, caminho):
+    relatorio = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'filtros': filtros,
+        'indicadores': asdict(kpis),
+        'tabelas': {
+            nome: json.loads(tabela.to_json(orient='records', date_format='iso', force_ascii=False))
+            for nome, tabela in tabelas.items()
+        },
+    }
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2, default=str)
+    return caminho
+
+
+def write_html(cubo, stats, histograma, kpis, filtros, caminho):
+    """Página estática com os cards, as figuras e as tabelas do painel (Plotly embutido)"""
+    from alimentacao import figures
+
+    figuras = [
+        figures.build_category_pie(cubo),
+        figures.build_alojamento_bar(cubo),
+        figures.build_timeline(cubo),
+        figures.build_heatmap(cubo),
+        figures.build_monthly_bar(stats),
+        figures.build_value_histogram(histograma),
+        figures.build_alojamento_comparison(stats),
+        figures.build_weekday_bar(stats),
+        figures.build_seasonality_line(stats),
+    ]
+    # O Plotly vai uma vez só, com a primeira figura: a página abre sem internet
+    graficos = "\n".join(
+        figura.to_html(full_html=False, include_plotlyjs=i == 0) for i, figura in enumerate(figuras)
+    )
+
+    cards = [
+        ("💰 Gasto Total", f"R$ {kpis.total_gasto:,.2f}"),
+        ("📦 Total de Itens", f"{kpis.total_itens:,}"),
+        ("📅 Gasto Médio/Dia", f"R$ {kpis.gasto_medio_dia:.2f} ({kpis.variacao_mensal:+.1f}% vs mês anterior)"),
+        ("🏠 Alojamentos Ativos", f"{kpis.alojamentos_ativos}"),
+    ]
+    descricao_filtros = ", ".join(f"{nome}: {valor}" for nome, valor in filtros.items() if valor is not None)
+    pagina = f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>Painel Gerencial - Alimentações</title>
+<style>
+    body {{ font-family: sans-serif; margin: 2rem; }}
+    .cards {{ display: flex; gap: 1rem; margin-bottom: 2rem; }}
+    .card {{ flex: 1; padding: 1rem; border-left: 4px solid #F7931E; box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1); }}
+    .card strong {{ display: block; font-size: 1.5rem; }}
+    table {{ border-collapse: collapse; margin-bottom: 2rem; }}
+    td, th {{ padding: 0.25rem 0.75rem; border-bottom: 1px solid #ddd; text-align: right; }}
+</style>
+</head>
+<body>
+<h1>🍽️ Painel Gerencial - Controle de Alimentações</h1>
+<p>{html.escape(descricao_filtros)} | Gerado em {datetime.now():%d/%m/%Y às %H:%M}</p>
+<div class="cards">
+{"".join(f'<div class="card">{titulo}<strong>{html.escape(valor)}</strong></div>' for titulo, valor in cards)}
+</div>
+{graficos}
+<h2>📈 Top 10 - Produtos Mais Comprados</h2>
+{stats.top_produtos.to_html(float_format=lambda valor: f"{valor:,.2f}")}
+<h2>🏠 Estatísticas por Alojamento</h2>
+{stats.alojamento_stats.to_html(float_format=lambda valor: f"{valor:,.2f}")}
+</body>
+</html>
+"""
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(pagina)
+    return caminho
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    origem = parser.add_mutually_exclusive_group()
+    origem.add_argument('--historico', default=DIRETORIO_HISTORICO, help='histórico local do painel')
+    origem.add_argument('--planilha', nargs='+', help='planilhas .xlsx locais, em vez do histórico')
+    parser.add_argument('--sincronizar', action='store_true', help='atualiza o histórico pelo SharePoint antes')
+    parser.add_argument('--secrets', default=os.path.join('.streamlit', 'secrets.toml'))
+    parser.add_argument('--inicio', type=date.fromisoformat, help='primeiro dia (padrão: o mais antigo)')
+    parser.add_argument('--fim', type=date.fromisoformat, help='último dia (padrão: o mais recente)')
+    parser.add_argument('--alojamento')
+    parser.add_argument('--categoria')
+    parser.add_argument('--formatos', nargs='+', choices=FORMATOS_RELATORIO, default=list(FORMATOS_RELATORIO))
+    parser.add_argument('--saida', default='relatorio', help='diretório de saída')
+    args = parser.parse_args(argv)
+    if args.sincronizar and args.planilha:
+        parser.error("--sincronizar atualiza o histórico; não combina com --planilha")
+    # Como no painel: recortes e reset_index sem cópia dos dados
+    pd.set_option("mode.copy_on_write", True)
+
+    df, cubo = load_frames(args)
+    if df is None:
+        sys.exit("Nenhum dado: o histórico está vazio (rode com --sincronizar ou --planilha)")
+
+    indice = FilterIndex(df)
+    data_min, data_max = indice.date_range()
+    filtros = dict(
+        data_inicio=args.inicio or data_min,
+        data_fim=args.fim or data_max,
+        alojamento=args.alojamento,
+        categoria=args.categoria,
+    )
+    selecao = Selection(indice, FilterIndex(cubo), filtros)
+    if len(selecao) == 0:
+        sys.exit("Nenhuma compra com os filtros informados")
+
+    stats = selecao.stats()
+    histograma = selecao.value_histogram()
+    kpis = compute_kpis(selecao.cubo)
+    anomalias = PriceTracking(indice.unit_prices()).anomalies(**filtros)
+    previsao = SpendForecast(indice.monthly_spend(), data_max).table(args.alojamento, args.categoria)
+    tabelas = report_tables(selecao.cubo, stats, histograma, anomalias, previsao)
+    filtros = {nome: str(valor) if valor is not None else None for nome, valor in filtros.items()}
+
+    os.makedirs(args.saida, exist_ok=True)
+    gravados = []
+    if 'parquet' in args.formatos:
+        gravados += write_parquet(tabelas, args.saida)
+    if 'json' in args.formatos:
+        gravados.append(write_json(kpis, filtros, tabelas, os.path.join(args.saida, 'relatorio.json')))
+    if 'html' in args.formatos:
+        gravados.append(write_html(selecao.cubo, stats, histograma, kpis, filtros,
+                                   os.path.join(args.saida, 'relatorio.html')))
+    print("\n".join(gravados))
+
+
+if __name__ == '__main__':
+    main()
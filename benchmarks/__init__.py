@@ -0,0 +1 @@
+"""Benchmarks do painel de alimentações (execução sem interface)"""
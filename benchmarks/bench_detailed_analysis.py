@@ -0,0 +1,83 @@
+"""Compara o cálculo das abas de análise detalhada: por aba (antigo) x agregação única.
+
+Uso: python -m benchmarks.bench_detailed_analysis [--linhas 100000 1000000] [--repeticoes 5]
+
+O caminho antigo refaz cada `groupby` sobre as compras filtradas, com `apply`
+linha a linha para ordenar os dias e nomear os meses. O novo filtra o cubo de
+gastos e chama `compute_detailed_stats` uma vez. Imprime um JSON por tamanho.
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from alimentacao import core
+from benchmarks.synthetic import make_ledger
+from benchmarks.timing import best_of
+
+
+def legacy_detailed_stats(df):
+    """Estatísticas das abas calculadas como antes, uma aba de cada vez sobre as compras"""
+    top_produtos = df.groupby('item', observed=True).agg({
+        'quantidade': 'sum',
+        'valor_total': 'sum'
+    }).sort_values('quantidade', ascending=False).head(10)
+    produtos_caros = df.groupby('item', observed=True)['valor_unitario'].mean().sort_values(ascending=False).head(10)
+
+    gastos_mes = df.groupby('mes_ano')['valor_total'].sum().reset_index()
+    gastos_mes['mes_ano_str'] = gastos_mes['mes_ano'].astype(str)
+
+    alojamento_stats = df.groupby('alojamento', observed=True).agg({
+        'valor_total': ['sum', 'mean', 'count'],
+        'quantidade': 'sum'
+    }).round(2)
+
+    gastos_dia_semana = df.groupby('dia_semana', observed=True)['valor_total'].mean().reset_index()
+    gastos_dia_semana['dia_num'] = gastos_dia_semana['dia_semana'].apply(lambda x: core.DIAS_SEMANA.index(x))
+    gastos_dia_semana = gastos_dia_semana.sort_values('dia_num')
+
+    mes = df['data_compra'].dt.month.rename('mes')
+    gastos_sazonalidade = df.groupby(mes)['valor_total'].mean().reset_index()
+    gastos_sazonalidade['mes_nome'] = gastos_sazonalidade['mes'].apply(lambda x: core.MESES_PT[x - 1])
+
+    return top_produtos, produtos_caros, gastos_mes, alojamento_stats, gastos_dia_semana, gastos_sazonalidade
+
+
+def run(n_linhas, repeticoes):
+    df = core.process_data(make_ledger(n_linhas))
+    indice = core.FilterIndex(df)
+    indice_cubo = core.FilterIndex(core.build_spend_cube(indice.df))
+    data_inicio, data_fim = indice.date_range()
+
+    antigo = best_of(lambda: legacy_detailed_stats(indice.filter(data_inicio, data_fim)), repeticoes)
+    novo = best_of(lambda: core.compute_detailed_stats(indice_cubo.filter(data_inicio, data_fim)), repeticoes)
+
+    # Os dois caminhos precisam concordar
+    esperado = legacy_detailed_stats(indice.filter(data_inicio, data_fim))
+    obtido = core.compute_detailed_stats(indice_cubo.filter(data_inicio, data_fim))
+    assert np.allclose(esperado[2]['valor_total'], obtido.gastos_mes['valor_total'])
+    assert np.allclose(esperado[5]['valor_total'], obtido.gastos_sazonalidade['valor_total'])
+
+    return {
+        'benchmark': 'detailed_analysis',
+        'linhas': n_linhas,
+        'celulas_cubo': len(indice_cubo.df),
+        'por_aba_s': round(antigo, 4),
+        'agregacao_unica_s': round(novo, 4),
+        'aceleracao': round(antigo / novo, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    for n_linhas in args.linhas:
+        print(json.dumps(run(n_linhas, args.repeticoes)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Compara o ajuste da previsão de gastos: série a série x em lote (x em lote com processos).
+
+Uso: python -m benchmarks.bench_forecast [--linhas 1000000] [--alojamentos 40 200] [--processos 4]
+
+Monta o gasto mensal alojamento × categoria de um livro sintético e mede o
+ajuste de tendência + sazonalidade com um `lstsq` por série (caminho
+ingênuo, de tests/reference.py), com o SpendForecast num processo só e com o SpendForecast dividido
+entre processos. Confere que as previsões coincidem e imprime um JSON por
+número de alojamentos.
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from alimentacao import core
+from benchmarks.synthetic import make_ledger
+from benchmarks.timing import best_of
+from tests.reference import per_series_forecast
+
+
+def run(n_linhas, n_alojamentos, processos, repeticoes):
+    indice = core.FilterIndex(core.process_data(make_ledger(n_linhas, n_alojamentos=n_alojamentos)))
+    mensal = indice.monthly_spend()
+    ultimo_dia = indice.date_range()[1]
+
+    lote = core.SpendForecast(mensal, ultimo_dia)
+    em_processos = core.SpendForecast(mensal, ultimo_dia, processos=processos)
+    iguais = (np.allclose(per_series_forecast(lote), lote.previsao.to_numpy())
+              and np.allclose(em_processos.previsao.to_numpy(), lote.previsao.to_numpy()))
+
+    return {
+        'benchmark': 'forecast',
+        'linhas': n_linhas,
+        'series': len(lote),
+        'meses': len(lote.historico),
+        'resultados_iguais': bool(iguais),
+        'por_serie_s': round(best_of(lambda: per_series_forecast(lote), repeticoes), 4),
+        'lote_s': round(best_of(lambda: core.SpendForecast(mensal, ultimo_dia), repeticoes), 4),
+        f'lote_{processos}_processos_s': round(
+            best_of(lambda: core.SpendForecast(mensal, ultimo_dia, processos=processos), repeticoes), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=1_000_000)
+    parser.add_argument('--alojamentos', type=int, nargs='+', default=[40, 200])
+    parser.add_argument('--processos', type=int, default=4)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    for n_alojamentos in args.alojamentos:
+        print(json.dumps(run(args.linhas, n_alojamentos, args.processos, args.repeticoes)))
+
+
+if __name__ == '__main__':
+    main()
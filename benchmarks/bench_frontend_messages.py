@@ -0,0 +1,140 @@
+"""Mensagens enviadas ao navegador pelos cards e pelas listas Top 10: elemento por elemento (antigo) x em bloco.
+
+Uso: python -m benchmarks.bench_frontend_messages [--linhas 100000]
+
+Roda cada versão como script do Streamlit (AppTest) sobre um livro sintético
+e conta, numa reexecução, as mensagens com elementos da página (deltas) e o
+seu tamanho serializado. O caminho antigo manda um `st.markdown` por card,
+dentro de quatro colunas, e um por produto nas listas Top 10; o novo manda
+um bloco para os cards e um por lista. Imprime um JSON.
+"""
+
+import argparse
+import json
+
+from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+from streamlit.testing.v1 import AppTest
+
+
+def legacy_metrics_cards(cubo, col1, col2, col3, col4):
+    """Cards como antes: um `st.markdown` por card, cada um na sua coluna"""
+    import streamlit as st
+
+    from alimentacao.core import compute_kpis
+
+    kpis = compute_kpis(cubo)
+    variacao_color = "#F7931E" if kpis.variacao_mensal >= 0 else "#FF0000"
+    variacao_icon = "↗️" if kpis.variacao_mensal >= 0 else "↘️"
+    cards = [
+        (col1, "💰 Gasto Total", f"R$ {kpis.total_gasto:,.2f}", ""),
+        (col2, "📦 Total de Itens", f"{kpis.total_itens:,}", ""),
+        (col3, "📅 Gasto Médio/Dia", f"R$ {kpis.gasto_medio_dia:.2f}", f"""
+            <div class="metric-delta" style="color: {variacao_color}">
+                {variacao_icon} {kpis.variacao_mensal:.1f}% vs mês anterior
+            </div>"""),
+        (col4, "🏠 Alojamentos Ativos", f"{kpis.alojamentos_ativos}", ""),
+    ]
+    for coluna, titulo, valor, extra in cards:
+        with coluna:
+            st.markdown(f"""
+        <div class="metric-card">
+            <div class="metric-title">{titulo}</div>
+            <div class="metric-value">{valor}</div>{extra}
+        </div>
+        """, unsafe_allow_html=True)
+
+
+def legacy_top_products(stats):
+    """Listas Top 10 como antes: um `st.markdown` por produto, com o estilo em cada item"""
+    import streamlit as st
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("### 📈 Top 10 - Produtos Mais Comprados")
+        for idx, (produto, row) in enumerate(stats.top_produtos.iterrows(), 1):
+            st.markdown(f"""
+            <div style="padding: 0.5rem; border-left: 3px solid #F7931E; margin-bottom: 0.5rem; background: #f8f9fa;">
+                <strong>{idx}. {produto}</strong><br>
+                Quantidade: {row['quantidade']:.0f} | Valor: R$ {row['valor_total']:,.2f}
+            </div>
+            """, unsafe_allow_html=True)
+    with col2:
+        st.markdown("### 💎 Top 10 - Produtos Mais Caros (Valor Unitário)")
+        for idx, (produto, valor) in enumerate(stats.produtos_caros.items(), 1):
+            st.markdown(f"""
+            <div style="padding: 0.5rem; border-left: 3px solid #000000; margin-bottom: 0.5rem; background: #f8f9fa;">
+                <strong>{idx}. {produto}</strong><br>
+                Valor Unitário: R$ {valor:,.2f}
+            </div>
+            """, unsafe_allow_html=True)
+
+
+def page(n_linhas, versao):
+    """Script medido: cards e listas Top 10 do painel, na versão pedida"""
+    import streamlit as st
+
+    import controlealimentacao as app
+    from alimentacao import core
+    from benchmarks import bench_frontend_messages as bench
+    from benchmarks.synthetic import make_ledger
+
+    @st.cache_resource
+    def selecao_sintetica(n_linhas):
+        df = core.process_data(make_ledger(n_linhas))
+        indice = core.FilterIndex(df)
+        data_min, data_max = indice.date_range()
+        return core.Selection(indice, core.FilterIndex(core.build_spend_cube(df)),
+                              dict(data_inicio=data_min, data_fim=data_max))
+
+    selecao = selecao_sintetica(n_linhas)
+    if versao == 'antigo':
+        bench.legacy_metrics_cards(selecao.cubo, *st.columns(4))
+        bench.legacy_top_products(selecao.stats())
+    else:
+        app.create_metrics_cards(selecao.cubo)
+        app.render_top_products_tab(selecao, None)
+
+
+def count_messages(n_linhas, versao):
+    """Deltas e bytes enviados numa reexecução (a primeira aquece dados e importações)"""
+    teste = AppTest.from_function(page, args=(n_linhas, versao), default_timeout=120)
+    teste.run()
+
+    contagem = {'mensagens': 0, 'bytes': 0}
+    original = ForwardMsgQueue.enqueue
+
+    def enqueue(fila, msg):
+        if msg.WhichOneof('type') == 'delta':
+            contagem['mensagens'] += 1
+            contagem['bytes'] += msg.ByteSize()
+        return original(fila, msg)
+
+    ForwardMsgQueue.enqueue = enqueue
+    try:
+        teste.run()
+    finally:
+        ForwardMsgQueue.enqueue = original
+    if teste.exception:
+        raise RuntimeError(teste.exception[0].message)
+    return contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=100_000)
+    args = parser.parse_args()
+
+    antigo = count_messages(args.linhas, 'antigo')
+    novo = count_messages(args.linhas, 'novo')
+    print(json.dumps({
+        'benchmark': 'frontend_messages',
+        'linhas': args.linhas,
+        'antigo_mensagens': antigo['mensagens'],
+        'novo_mensagens': novo['mensagens'],
+        'antigo_kb': round(antigo['bytes'] / 1024, 2),
+        'novo_kb': round(novo['bytes'] / 1024, 2),
+    }))
+
+
+if __name__ == '__main__':
+    main()
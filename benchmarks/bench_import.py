@@ -0,0 +1,58 @@
+"""Tempo de importação do núcleo e do relatório, com orçamento.
+
+Uso: python -m benchmarks.bench_import [--orcamento-ms 1000] [--repeticoes 5]
+
+Importa cada módulo num processo Python novo e guarda o melhor tempo (para
+ver o que pesa, use `python -X importtime -c "import alimentacao.core"`).
+Também confere que o núcleo e o relatório não carregam dependências da
+interface ou opcionais (streamlit, plotly, msal, openpyxl, requests, duckdb,
+python-calamine), que só devem ser importadas onde são usadas. Imprime um
+JSON; se algum módulo passar do orçamento ou carregar uma dependência
+proibida, o processo sai com código 1.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+MODULOS = ['alimentacao.core', 'alimentacao.report']
+PROIBIDOS = ['streamlit', 'plotly', 'msal', 'openpyxl', 'requests', 'duckdb', 'python_calamine']
+
+
+def import_time_ms(modulo):
+    """Tempo (ms) da importação de `modulo` num processo Python novo"""
+    codigo = f"import time; inicio = time.perf_counter(); import {modulo}; print(time.perf_counter() - inicio)"
+    saida = subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True, check=True).stdout
+    return float(saida) * 1000
+
+
+def loaded_forbidden(modulo):
+    """Dependências proibidas que a importação de `modulo` carrega"""
+    codigo = (f"import sys, json, {modulo}; "
+              f"print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}} & set({PROIBIDOS!r}))))")
+    return json.loads(subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True,
+                                     check=True).stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orcamento-ms', type=float, default=1000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    resultados = []
+    for modulo in MODULOS:
+        ms = min(import_time_ms(modulo) for _ in range(args.repeticoes))
+        proibidos = loaded_forbidden(modulo)
+        resultados.append({'modulo': modulo, 'importacao_ms': round(ms, 1), 'orcamento_ms': args.orcamento_ms,
+                           'dependencias_proibidas': proibidos,
+                           'ok': ms <= args.orcamento_ms and not proibidos})
+
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if not all(resultado['ok'] for resultado in resultados):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Compara os leitores de Excel: `pd.read_excel` (antigo) x openpyxl somente leitura x calamine.
+
+Uso: python -m benchmarks.bench_ingestion [--linhas 10000 100000 500000] [--dados .bench_data]
+
+Mede leitura + `process_data` de cada leitor disponível sobre a mesma planilha
+sintética, confere que todos produzem o mesmo DataFrame e imprime um JSON por
+tamanho. O calamine só entra se `python-calamine` estiver instalado.
+"""
+
+import argparse
+import json
+
+import pandas as pd
+
+from alimentacao import core
+from benchmarks.synthetic import write_ledger_files
+from benchmarks.timing import timed
+
+
+def run(n_linhas, diretorio):
+    caminho = write_ledger_files(n_linhas, diretorio, formatos=('xlsx',))['xlsx']
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read()
+
+    tempos = {}
+    resultados = {}
+    for motor in core.excel_engines():
+        resultados[motor], tempos[motor] = timed(lambda: core.process_data(core.read_workbook(conteudo, motor)))
+
+    # Todos os leitores precisam chegar aos mesmos dados do caminho antigo
+    for motor, df in resultados.items():
+        pd.testing.assert_frame_equal(df, resultados['pandas'])
+
+    return {
+        'benchmark': 'ingestion',
+        'linhas': n_linhas,
+        'tamanho_mb': round(len(conteudo) / 2**20, 1),
+        **{f'{motor}_s': round(segundos, 3) for motor, segundos in tempos.items()},
+        **{f'aceleracao_{motor}': round(tempos['pandas'] / segundos, 1)
+           for motor, segundos in tempos.items() if motor != 'pandas'},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--dados', default='.bench_data', help='diretório das planilhas sintéticas')
+    args = parser.parse_args()
+
+    for n_linhas in args.linhas:
+        print(json.dumps(run(n_linhas, args.dados)))
+
+
+if __name__ == '__main__':
+    main()
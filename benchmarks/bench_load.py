@@ -0,0 +1,517 @@
+"""Teste de carga do painel: N sessões simultâneas mudando filtros ao acaso.
+
+Uso:
+    python -m benchmarks.bench_load [--sessoes 1 4 16] [--execucoes 20] [--linhas 50000]
+                                    [--motor pandas] [--pausa-ms 0]
+                                    [--intervalo-atualizacao 300] [--nova-versao-s 0]
+                                    [--saida resultado.json]
+
+Sobe um servidor local que imita a parte do Graph/SharePoint usada pelo
+painel (site, busca, metadados e download da planilha sintética) e o painel
+de verdade, com `streamlit run`, num processo à parte. Cada sessão simulada
+é um cliente WebSocket que fala com o servidor como o navegador: pede a
+execução da página, recebe os elementos, muda um widget ao acaso (período,
+alojamento, categoria ou aba da análise detalhada) e pede a próxima
+execução. A troca de aba reexecuta só o fragmento da análise detalhada,
+como no navegador.
+
+As sessões rodam ao mesmo tempo, sem fila: o servidor executa cada uma na
+sua thread, e todas usam os mesmos caches de st.cache_resource, como em
+produção. A latência vai do pedido da execução até o servidor avisar que
+ela terminou. Os clientes dividem um só event loop neste processo; o
+trabalho deles (ler as mensagens) é pequeno perto do do servidor. Com
+--intervalo-atualizacao curto e --nova-versao-s, a planilha muda durante a
+rajada e as sessões pegam a versão nova no meio do teste.
+
+Para cada número de sessões, relata:
+- p50/p95 da latência das interações e da abertura da página;
+- reexecuções por segundo;
+- memória (RSS) do servidor e por sessão, aproximada: o aumento do RSS com
+  as sessões conectadas dividido pelo número de sessões;
+- requisições ao Graph;
+- as etapas e os contadores da instrumentação do painel.
+
+Imprime um JSON. A autenticação é trocada por um token local: o servidor
+aceita qualquer um.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import COLUNAS_PLANILHA, make_ledger
+from benchmarks.timing import environment
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_PAINEL = os.path.join(RAIZ, 'controlealimentacao.py')
+ACOES = ['periodo', 'alojamento', 'categoria', 'aba']
+# Rótulo de cada widget mexido pelas sessões
+ROTULOS = {
+    'periodo': "Selecione o período:",
+    'alojamento': "Selecione o alojamento:",
+    'categoria': "Selecione a categoria:",
+    'aba': "Análise detalhada",
+}
+FORMATO_DATA = '%Y/%m/%d'  # datas do st.date_input no protocolo
+MAX_MENSAGEM = 256 * 2**20
+
+
+class LocalTokenApp:
+    """Substituto do ConfidentialClientApplication: o servidor local aceita qualquer token"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def acquire_token_for_client(self, scopes):
+        return {'access_token': 'local'}
+
+
+class FakeGraph:
+    """Servidor HTTP local com a parte da API do Graph que o painel usa.
+
+    Serve uma planilha de compras; `publish` cria uma versão nova (novo eTag),
+    alternando entre os conteúdos recebidos, como se alguém tivesse lançado
+    compras no SharePoint.
+    """
+
+    ITEM_ID = 'planilha-carga'
+
+    def __init__(self, conteudos):
+        from alimentacao.core import PREFIXO_ARQUIVO
+
+        self.nome = f"{PREFIXO_ARQUIVO}.xlsx"
+        self.conteudos = conteudos
+        self.versao = 0
+        self.requisicoes = Counter()
+        self._lock = threading.Lock()
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        threading.Thread(target=self.servidor.serve_forever, name='fake-graph', daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.servidor.server_port}"
+
+    def publish(self):
+        with self._lock:
+            self.versao += 1
+
+    def item(self):
+        """Metadados e conteúdo da versão atual da planilha"""
+        with self._lock:
+            versao = self.versao
+        conteudo = self.conteudos[versao % len(self.conteudos)]
+        etag = f'"{{{self.ITEM_ID}}},{versao}"'
+        return {'id': self.ITEM_ID, 'name': self.nome, 'eTag': etag, 'cTag': etag,
+                'lastModifiedDateTime': f"2024-01-01T00:00:{versao % 60:02d}Z", 'size': len(conteudo)}, conteudo
+
+    def _handler(grafo):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                caminho = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+                item, conteudo = grafo.item()
+                status, tipo = 200, 'application/json'
+                if caminho.endswith('/content'):
+                    grafo.requisicoes['download'] += 1
+                    tipo, corpo = 'application/octet-stream', conteudo
+                    faixa = self.headers.get('Range')
+                    if faixa:
+                        inicio, fim = (int(valor) for valor in faixa.split('=')[1].split('-'))
+                        status, corpo = 206, conteudo[inicio:fim + 1]
+                elif 'search(' in caminho:
+                    grafo.requisicoes['busca'] += 1
+                    corpo = json.dumps({'value': [item]}).encode()
+                elif '/items/' in caminho:
+                    grafo.requisicoes['metadados'] += 1
+                    corpo = json.dumps(item).encode()
+                else:
+                    grafo.requisicoes['site'] += 1
+                    corpo = json.dumps({'id': 'site-local'}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+        return Handler
+
+
+def ledger_versions(n_linhas):
+    """Planilha sintética (.xlsx) e a mesma com um lote de compras novas no último dia"""
+    base = make_ledger(n_linhas)
+    novas = base.tail(max(n_linhas // 100, 1)).assign(**{COLUNAS_PLANILHA[0]: base[COLUNAS_PLANILHA[0]].max()})
+    conteudos = []
+    for df in (base, pd.concat([base, novas], ignore_index=True)):
+        arquivo = io.BytesIO()
+        df.to_excel(arquivo, index=False, engine='openpyxl')
+        conteudos.append(arquivo.getvalue())
+    return conteudos
+
+
+def serve():
+    """Processo do servidor: `streamlit run` do painel, com o token local no lugar do MSAL"""
+    import msal
+    from streamlit.web import cli
+
+    msal.ConfidentialClientApplication = LocalTokenApp
+    sys.argv = ['streamlit', 'run', SCRIPT_PAINEL, *sys.argv[1:]]
+    sys.exit(cli.main())
+
+
+def start_dashboard(grafo, diretorio, ambiente):
+    """Sobe o painel num processo à parte e espera ele responder; retorna (processo, url)"""
+    segredos = os.path.join(diretorio, 'secrets.toml')
+    with open(segredos, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(f'[azure]\nclient_id = "carga"\ntenant_id = "local"\nclient_secret = "local"\n'
+                      f'graph_url = "{grafo.url}"\n')
+    with socket.socket() as livre:
+        livre.bind(('127.0.0.1', 0))
+        porta = livre.getsockname()[1]
+
+    processo = subprocess.Popen(
+        [sys.executable, '-c', 'from benchmarks.bench_load import serve; serve()',
+         '--server.headless=true', '--server.address=127.0.0.1', f'--server.port={porta}',
+         '--server.enableXsrfProtection=false', '--server.fileWatcherType=none',
+         '--browser.gatherUsageStats=false', f'--secrets.files={segredos}', '--logger.level=error'],
+        cwd=RAIZ, env={**os.environ, **ambiente}, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{porta}"
+    sem_proxy = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    limite = time.monotonic() + 120
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            sys.exit("O servidor do painel terminou ao iniciar")
+        try:
+            with sem_proxy.open(f"{url}/_stcore/health", timeout=1):
+                return processo, url
+        except OSError:
+            time.sleep(0.2)
+    processo.terminate()
+    sys.exit("O servidor do painel não respondeu")
+
+
+def widget_state(widget_id, tipo, valor):
+    """Valor de um widget no formato que o navegador manda ao servidor"""
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    estado = WidgetState(id=widget_id)
+    if tipo == 'date_input':
+        estado.string_array_value.data.extend(valor)
+    elif tipo == 'selectbox':
+        estado.string_value = valor
+    else:
+        estado.int_value = valor
+    return estado
+
+
+class DashboardSession:
+    """Uma sessão do painel pelo WebSocket do Streamlit, como o navegador a conduz"""
+
+    def __init__(self, url):
+        self.url = f"ws{url[len('http'):]}/_stcore/stream"
+        self.conexao = None
+        self.widgets = {}  # ação -> (tipo, proto do widget, fragment_id)
+        self.valores = {}  # id do widget -> WidgetState mandado a cada execução
+        self.guardadas = {}  # hash -> ForwardMsg que o servidor pode mandar só como referência
+        self.bytes_recebidos = 0
+        self._vistos = set()
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+
+        self.conexao = await websocket_connect(self.url, subprotocols=['streamlit'], max_message_size=MAX_MENSAGEM)
+
+    def close(self):
+        self.conexao.close()
+
+    def set(self, acao, valor):
+        tipo, widget, _ = self.widgets[acao]
+        self.valores[widget.id] = widget_state(widget.id, tipo, valor)
+
+    async def run(self, fragment_id=''):
+        """Pede uma execução da página (ou só de um fragmento) e espera o fim; retorna se houve erro"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ClientState_pb2 import ClientState
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        estado = ClientState(query_string='', fragment_id=fragment_id, cached_message_hashes=list(self.guardadas))
+        estado.widget_states.widgets.extend(self.valores.values())
+        await self.conexao.write_message(BackMsg(rerun_script=estado).SerializeToString(), binary=True)
+
+        self._vistos = set()
+        erro = False
+        while True:
+            dados = await self.conexao.read_message()
+            if dados is None:
+                raise ConnectionError("O servidor do painel fechou a conexão")
+            self.bytes_recebidos += len(dados)
+            msg = ForwardMsg()
+            msg.ParseFromString(dados)
+            metadados = msg.metadata
+            if msg.WhichOneof('type') == 'ref_hash':
+                msg = self.guardadas[msg.ref_hash]
+            elif metadados.cacheable:
+                self.guardadas[msg.hash] = msg
+
+            tipo = msg.WhichOneof('type')
+            if tipo == 'delta':
+                erro = self._read_delta(msg.delta) or erro
+            elif tipo == 'script_finished':
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if not fragment_id:
+                    # Widgets que sumiram da página deixam de ser mandados
+                    self.valores = {widget_id: valor for widget_id, valor in self.valores.items()
+                                    if widget_id in self._vistos}
+                    self.widgets = {acao: widget for acao, widget in self.widgets.items()
+                                    if widget[1].id in self._vistos}
+                return erro or msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR
+
+    def _read_delta(self, delta):
+        """Guarda os widgets da página; retorna se o elemento é um erro"""
+        if delta.WhichOneof('type') != 'new_element':
+            return False
+        elemento = delta.new_element
+        tipo = elemento.WhichOneof('type')
+        if tipo == 'exception':
+            return True
+        if tipo not in ('date_input', 'selectbox', 'radio'):
+            return False
+
+        widget = getattr(elemento, tipo)
+        self._vistos.add(widget.id)
+        if widget.id not in self.valores:
+            if tipo == 'date_input':
+                padrao = list(widget.default)
+            elif tipo == 'selectbox':
+                padrao = widget.options[widget.default] if widget.options else ''
+            else:
+                padrao = widget.default
+            self.valores[widget.id] = widget_state(widget.id, tipo, padrao)
+        acao = next((acao for acao, rotulo in ROTULOS.items() if rotulo == widget.label), None)
+        if acao is not None:
+            self.widgets[acao] = (tipo, widget, delta.fragment_id)
+        return False
+
+
+def interact(sessao, rng):
+    """Muda um widget ao acaso (sem executar); retorna a ação e o fragmento a reexecutar"""
+    acao = rng.choice(ACOES)
+    if acao not in sessao.widgets:
+        # Página sem a análise detalhada (filtros sem dados): voltar ao período inteiro
+        _, periodo, _ = sessao.widgets['periodo']
+        sessao.set('periodo', [periodo.min, periodo.max])
+        return 'periodo', ''
+
+    _, widget, fragment_id = sessao.widgets[acao]
+    if acao == 'periodo':
+        data_min, data_max = (datetime.strptime(data, FORMATO_DATA).date() for data in (widget.min, widget.max))
+        inicio, fim = sorted(rng.sample(range((data_max - data_min).days + 1), 2))
+        valor = [(data_min + timedelta(days=dias)).strftime(FORMATO_DATA) for dias in (inicio, fim)]
+    elif acao in ('alojamento', 'categoria'):
+        valor = rng.choice(list(widget.options))
+    else:
+        valor = rng.randrange(len(widget.options))
+    sessao.set(acao, valor)
+    return acao, fragment_id
+
+
+async def run_session(url, n_execucoes, pausa_s, seed, medidas):
+    rng = random.Random(seed)
+    sessao = DashboardSession(url)
+    await sessao.connect()
+    for execucao in range(n_execucoes + 1):
+        acao, fragment_id = ('abertura', '') if execucao == 0 else interact(sessao, rng)
+        if pausa_s:
+            await asyncio.sleep(rng.expovariate(1 / pausa_s))
+        inicio = time.perf_counter()
+        erro = await sessao.run(fragment_id)
+        medidas.append({'acao': acao, 'latencia': time.perf_counter() - inicio, 'erro': erro,
+                        'fragmento': bool(fragment_id)})
+    return sessao
+
+
+def process_memory_mb(pid):
+    """RSS atual e pico de outro processo, pelo /proc (só no Linux)"""
+    memoria = {}
+    try:
+        with open(f"/proc/{pid}/status") as arquivo:
+            for linha in arquivo:
+                campo, _, valor = linha.partition(':')
+                if campo in ('VmRSS', 'VmHWM'):
+                    memoria['rss_atual_mb' if campo == 'VmRSS' else 'rss_pico_mb'] = round(
+                        int(valor.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return memoria
+
+
+def read_instrumentation(caminho, posicao):
+    """Registros da instrumentação gravados a partir de `posicao`; retorna (registros, nova posição)"""
+    if not os.path.exists(caminho):
+        return [], posicao
+    if os.path.getsize(caminho) < posicao:
+        posicao = 0  # log rotacionado
+    with open(caminho) as arquivo:
+        arquivo.seek(posicao)
+        registros = [json.loads(linha) for linha in arquivo if linha.strip()]
+        return registros, arquivo.tell()
+
+
+def percentile_ms(valores, q):
+    return round(float(np.percentile(valores, q)) * 1000, 1) if valores else None
+
+
+def run_level(grafo, servidor, url, n_sessoes, args, caminho_log, posicao_log):
+    rss_inicio = process_memory_mb(servidor.pid).get('rss_atual_mb')
+    requisicoes_inicio = Counter(grafo.requisicoes)
+    versao_inicio = grafo.versao
+
+    # Planilha mudando durante a rajada
+    parar = threading.Event()
+
+    def publicar():
+        while not parar.wait(args.nova_versao_s):
+            grafo.publish()
+
+    if args.nova_versao_s:
+        threading.Thread(target=publicar, name='nova-versao', daemon=True).start()
+
+    medidas = []
+
+    async def rajada():
+        inicio = time.perf_counter()
+        sessoes = await asyncio.gather(*(
+            run_session(url, args.execucoes, args.pausa_ms / 1000, seed, medidas)
+            for seed in range(args.seed * 10_000, args.seed * 10_000 + n_sessoes)
+        ))
+        duracao = time.perf_counter() - inicio
+        # Memória do servidor com as sessões ainda conectadas
+        memoria = process_memory_mb(servidor.pid)
+        for sessao in sessoes:
+            sessao.close()
+        return duracao, memoria, sum(sessao.bytes_recebidos for sessao in sessoes)
+
+    duracao, memoria, bytes_recebidos = asyncio.run(rajada())
+    parar.set()
+
+    rss_fim = memoria.get('rss_atual_mb')
+    registros, posicao_log = read_instrumentation(caminho_log, posicao_log)
+    etapas, contadores = defaultdict(list), Counter()
+    for registro in registros:
+        for etapa, segundos in registro['etapas_s'].items():
+            etapas[etapa].append(segundos)
+        contadores.update(registro['contadores'])
+
+    interacoes = [medida for medida in medidas if medida['acao'] != 'abertura']
+    aberturas = [medida['latencia'] for medida in medidas if medida['acao'] == 'abertura']
+    resultado = {
+        'sessoes': n_sessoes,
+        'execucoes': len(medidas),
+        'execucoes_fragmento': sum(medida['fragmento'] for medida in medidas),
+        'erros': sum(medida['erro'] for medida in medidas),
+        'duracao_s': round(duracao, 2),
+        'vazao_execucoes_s': round(len(medidas) / duracao, 2),
+        'latencia_p50_ms': percentile_ms([medida['latencia'] for medida in interacoes], 50),
+        'latencia_p95_ms': percentile_ms([medida['latencia'] for medida in interacoes], 95),
+        'abertura_p50_ms': percentile_ms(aberturas, 50),
+        'abertura_p95_ms': percentile_ms(aberturas, 95),
+        'kb_por_execucao': round(bytes_recebidos / len(medidas) / 1024, 1),
+        'rss_mb': rss_fim,
+        'rss_pico_mb': memoria.get('rss_pico_mb'),
+        'memoria_por_sessao_mb': (round((rss_fim - rss_inicio) / n_sessoes, 2)
+                                  if rss_inicio is not None and rss_fim is not None else None),
+        'versoes_publicadas': grafo.versao - versao_inicio,
+        'requisicoes_graph': dict(Counter(grafo.requisicoes) - requisicoes_inicio),
+        'etapas_p50_ms': {etapa: percentile_ms(valores, 50) for etapa, valores in sorted(etapas.items())},
+        'etapas_p95_ms': {etapa: percentile_ms(valores, 95) for etapa, valores in sorted(etapas.items())},
+        'contadores': dict(sorted(contadores.items())),
+    }
+    return resultado, posicao_log
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessoes', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--execucoes', type=int, default=20, help='interações por sessão')
+    parser.add_argument('--linhas', type=int, default=50_000, help='compras da planilha sintética')
+    parser.add_argument('--motor', choices=['pandas', 'duckdb'], default='pandas', help='motor de consultas')
+    parser.add_argument('--pausa-ms', type=float, default=0, help='pausa média entre interações (0 = rajada)')
+    parser.add_argument('--intervalo-atualizacao', type=float, default=300,
+                        help='intervalo (s) entre verificações do SharePoint')
+    parser.add_argument('--nova-versao-s', type=float, default=0,
+                        help='publica uma nova versão da planilha a cada N s (0 = nunca)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--saida', help='arquivo JSON de saída (padrão: stdout)')
+    args = parser.parse_args()
+
+    # Configuração do painel, lida pelo núcleo na importação, no processo do servidor
+    diretorio = tempfile.mkdtemp(prefix='carga_painel_')
+    caminho_log = os.path.join(diretorio, 'instrumentacao.jsonl')
+    ambiente = {
+        'ALIMENTACAO_CACHE_DIR': diretorio,
+        'ALIMENTACAO_MOTOR_CONSULTAS': args.motor,
+        'ALIMENTACAO_INTERVALO_ATUALIZACAO': str(args.intervalo_atualizacao),
+        'ALIMENTACAO_INSTRUMENTACAO': '1',
+        'ALIMENTACAO_LOG_INSTRUMENTACAO': caminho_log,
+    }
+
+    print("Gerando a planilha sintética...", file=sys.stderr)
+    grafo = FakeGraph(ledger_versions(args.linhas))
+    servidor, url = start_dashboard(grafo, diretorio, ambiente)
+    try:
+        # Primeira carga (planilha baixada, lida e processada) fora das medidas
+        medidas = []
+        inicio = time.perf_counter()
+        asyncio.run(run_session(url, 0, 0, args.seed, medidas))
+        carga_inicial_s = time.perf_counter() - inicio
+        if medidas[0]['erro']:
+            sys.exit("O painel falhou na primeira carga")
+        _, posicao_log = read_instrumentation(caminho_log, 0)
+
+        resultados = []
+        for n_sessoes in args.sessoes:
+            resultado, posicao_log = run_level(grafo, servidor, url, n_sessoes, args, caminho_log, posicao_log)
+            resultados.append(resultado)
+            print(f"{n_sessoes} sessões: ok", file=sys.stderr)
+    finally:
+        servidor.terminate()
+        servidor.wait(30)
+
+    relatorio = {
+        'ambiente': environment(),
+        'configuracao': {'linhas': args.linhas, 'motor': args.motor, 'execucoes_por_sessao': args.execucoes,
+                         'pausa_ms': args.pausa_ms, 'intervalo_atualizacao_s': args.intervalo_atualizacao,
+                         'nova_versao_s': args.nova_versao_s},
+        'carga_inicial_s': round(carga_inicial_s, 2),
+        'resultados': resultados,
+    }
+    saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida)
+    else:
+        print(saida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compara o acompanhamento de preços: laço por série (pandas) x janelas vetorizadas (PriceTracking).
+
+Uso: python -m benchmarks.bench_price_anomalies [--linhas 100000 500000] [--itens 5000] [--repeticoes 3]
+
+O caminho por série (tests/reference.py) agrupa as compras e aplica, a
+cada item (ou item × alojamento), `rolling().median()` e um `apply` para o
+desvio absoluto mediano. O vetorizado monta as janelas de todas as séries de uma vez e tira
+as medianas com um sort por bloco. Confere que as medianas e as compras
+marcadas coincidem e imprime um JSON por tamanho e nível.
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from alimentacao import core
+from benchmarks.synthetic import make_ledger
+from benchmarks.timing import best_of
+from tests.reference import legacy_price_tracking
+
+
+def run(n_linhas, n_itens, repeticoes):
+    precos = core.process_data(make_ledger(n_linhas, n_itens=n_itens))[core.COLUNAS_PRECOS]
+    resultados = []
+    for por_alojamento in (False, True):
+        vetorizado = core.PriceTracking(precos, por_alojamento)
+        antigo = legacy_price_tracking(precos, por_alojamento)
+        iguais = (np.allclose(antigo['mediana'], vetorizado.compras['mediana'], equal_nan=True)
+                  and np.array_equal(antigo['anomalia'], vetorizado.compras['anomalia']))
+
+        antigo_s = best_of(lambda: legacy_price_tracking(precos, por_alojamento), repeticoes)
+        vetorizado_s = best_of(lambda: core.PriceTracking(precos, por_alojamento), repeticoes)
+        resultados.append({
+            'benchmark': 'price_anomalies',
+            'linhas': n_linhas,
+            'itens': n_itens,
+            'nivel': 'item_alojamento' if por_alojamento else 'item',
+            'series': int(len(np.unique(vetorizado.series))),
+            'anomalias': len(vetorizado.anomalias),
+            'resultados_iguais': bool(iguais),
+            'por_serie_s': round(antigo_s, 4),
+            'vetorizado_s': round(vetorizado_s, 4),
+            'aceleracao': round(antigo_s / vetorizado_s, 1),
+        })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100_000, 500_000])
+    parser.add_argument('--itens', type=int, default=5000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    for n_linhas in args.linhas:
+        for resultado in run(n_linhas, args.itens, args.repeticoes):
+            print(json.dumps(resultado))
+
+
+if __name__ == '__main__':
+    main()
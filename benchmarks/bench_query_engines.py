@@ -0,0 +1,89 @@
+"""Compara os motores de consulta do painel: pandas (em memória) x DuckDB (histórico em disco).
+
+Uso: python -m benchmarks.bench_query_engines [--linhas 1000000 5000000] [--dados .bench_data]
+
+Grava o livro sintético como histórico mensal (HistoryStore) e mede, para
+cada motor, o tempo de um recorte típico (filtros + estatísticas detalhadas +
+histograma) e a memória que o motor mantém: o histórico inteiro no pandas,
+só os resultados agregados no DuckDB. Imprime um JSON por tamanho.
+"""
+
+import argparse
+import json
+import os
+import shutil
+from datetime import timedelta
+
+from alimentacao import core
+from benchmarks.synthetic import make_ledger
+from benchmarks.timing import best_of, timed
+
+
+def touch_selection(selecao):
+    """O que uma execução da página pede ao recorte"""
+    selecao.stats()
+    selecao.value_histogram()
+    return len(selecao)
+
+
+def run(n_linhas, diretorio, repeticoes):
+    diretorio_historico = os.path.join(diretorio, f"historico_{n_linhas}")
+    shutil.rmtree(diretorio_historico, ignore_errors=True)
+    historico = core.HistoryStore(diretorio_historico, em_memoria=False)
+    _, segundos_gravacao = timed(lambda: historico.update(make_ledger(n_linhas).set_axis(core.COLUNAS, axis=1),
+                                                          (('sintetico',),)))
+
+    # DuckDB: nada do histórico fica em memória
+    indice_duckdb = core.DuckDBIndex(historico.files())
+    data_min, data_max = indice_duckdb.date_range()
+    combinacoes = [
+        dict(data_inicio=data_min, data_fim=data_max),
+        dict(data_inicio=data_max - timedelta(days=90), data_fim=data_max,
+             alojamento=indice_duckdb.options('alojamento')[0]),
+    ]
+
+    def consultar_duckdb():
+        for filtros in combinacoes:
+            touch_selection(core.DuckDBSelection(indice_duckdb, filtros))
+
+    duckdb_s = best_of(consultar_duckdb, repeticoes) / len(combinacoes)
+    selecao = core.DuckDBSelection(indice_duckdb, combinacoes[0])
+    duckdb_mb = core.dataframe_memory_mb(selecao.cubo) + core.dataframe_memory_mb(selecao.item_totals())
+
+    # pandas: o histórico inteiro carregado, como no motor padrão
+    em_memoria = core.HistoryStore(diretorio_historico)
+    em_memoria.load()
+    df, cubo = em_memoria.frames()
+    indice, indice_cubo = core.FilterIndex(df), core.FilterIndex(cubo)
+
+    def consultar_pandas():
+        for filtros in combinacoes:
+            touch_selection(core.Selection(indice, indice_cubo, filtros))
+
+    pandas_s = best_of(consultar_pandas, repeticoes) / len(combinacoes)
+    pandas_mb = indice.memory_mb() + indice_cubo.memory_mb()
+
+    return {
+        'benchmark': 'query_engines',
+        'linhas': n_linhas,
+        'gravacao_historico_s': round(segundos_gravacao, 2),
+        'pandas_s': round(pandas_s, 4),
+        'duckdb_s': round(duckdb_s, 4),
+        'pandas_memoria_mb': round(pandas_mb, 1),
+        'duckdb_memoria_mb': round(duckdb_mb, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[1_000_000, 5_000_000])
+    parser.add_argument('--dados', default='.bench_data', help='diretório dos históricos sintéticos')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    for n_linhas in args.linhas:
+        print(json.dumps(run(n_linhas, args.dados, args.repeticoes)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Benchmark de cada etapa do painel sobre livros de compras sintéticos.
+
+Uso:
+    python -m benchmarks.bench_stages [--linhas 10000 100000 1000000 5000000]
+                                      [--dados .bench_data] [--saida resultado.json]
+                                      [--comparar base.json --tolerancia 0.25]
+
+Gera (uma vez, em --dados) planilhas com o layout de 8 colunas em .xlsx e
+Parquet e mede, para cada tamanho, as etapas: leitura (parse_xlsx_<leitor>
+para cada leitor de Excel disponível, parse_parquet), process, store_full e
+store_incremental (histórico mensal, antes e depois de chegarem compras
+novas), build_index, build_cube, filter, aggregate e figures (com o tamanho
+do JSON das figuras). O resultado é um JSON; com --comparar, etapas mais
+lentas que a base além da tolerância são listadas e o processo sai com código 1.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from datetime import timedelta
+
+import pandas as pd
+
+from alimentacao import core, figures
+from benchmarks.synthetic import write_ledger_files
+from benchmarks.timing import best_of, environment, timed
+
+FIGURAS_CUBO = [figures.build_category_pie, figures.build_alojamento_bar, figures.build_timeline, figures.build_heatmap]
+FIGURAS_STATS = [figures.build_monthly_bar, figures.build_alojamento_comparison, figures.build_weekday_bar,
+                 figures.build_seasonality_line]
+
+
+def filter_combinations(indice):
+    """Combinações típicas de filtros da barra lateral"""
+    data_min, data_max = indice.date_range()
+    alojamento = indice.options('alojamento')[0]
+    categoria = indice.options('categoria')[0]
+    return [
+        dict(data_inicio=data_min, data_fim=data_max),
+        dict(data_inicio=data_max - timedelta(days=90), data_fim=data_max),
+        dict(data_inicio=data_min, data_fim=data_max, alojamento=alojamento),
+        dict(data_inicio=data_min, data_fim=data_max, alojamento=alojamento, categoria=categoria),
+    ]
+
+
+def run_size(n_linhas, diretorio, repeticoes):
+    """Mede todas as etapas para um tamanho de livro"""
+    caminhos = write_ledger_files(n_linhas, diretorio)
+    resultados = []
+
+    def registrar(etapa, segundos, vezes=1, **extras):
+        resultados.append({'linhas': n_linhas, 'etapa': etapa, 'segundos': round(segundos, 6),
+                           'repeticoes': vezes, **extras})
+
+    # Leitura (a do .xlsx é cara demais para repetir)
+    if 'xlsx' in caminhos:
+        with open(caminhos['xlsx'], 'rb') as arquivo:
+            conteudo = arquivo.read()
+        for motor in core.excel_engines():
+            _, segundos = timed(lambda: core.read_workbook(conteudo, motor))
+            registrar(f'parse_xlsx_{motor}', segundos)
+        del conteudo
+    bruto = pd.read_parquet(caminhos['parquet'])
+    registrar('parse_parquet', best_of(lambda: pd.read_parquet(caminhos['parquet']), repeticoes), repeticoes)
+
+    # Processamento e estruturas construídas uma vez por versão dos dados
+    df, segundos = timed(lambda: core.process_data(bruto))
+    registrar('process', segundos, memoria_mb=round(df.memory_usage(deep=True).sum() / 2**20, 1))
+
+    # Histórico mensal: carga completa e depois só um lote de compras novas
+    bruto = bruto.set_axis(core.COLUNAS, axis=1)
+    novas = bruto.tail(max(n_linhas // 1000, 1)).assign(data_compra=bruto['data_compra'].max())
+    with tempfile.TemporaryDirectory() as diretorio_historico:
+        historico = core.HistoryStore(diretorio_historico)
+        _, segundos = timed(lambda: historico.update(bruto, (('base',),)))
+        registrar('store_full', segundos)
+        atualizado = pd.concat([bruto, novas], ignore_index=True)
+        alterados, segundos = timed(lambda: historico.update(atualizado, (('novas',),)))
+        registrar('store_incremental', segundos, linhas_novas=len(novas), meses_reprocessados=len(alterados))
+    del bruto, atualizado
+
+    indice, segundos = timed(lambda: core.FilterIndex(df))
+    registrar('build_index', segundos)
+    indice_cubo, segundos = timed(lambda: core.FilterIndex(core.build_spend_cube(indice.df)))
+    registrar('build_cube', segundos, celulas_cubo=len(indice_cubo.df))
+
+    # Etapas de cada interação do usuário
+    combinacoes = filter_combinations(indice)
+
+    def filtrar():
+        for filtros in combinacoes:
+            indice.filter(**filtros)
+            indice_cubo.filter(**filtros)
+
+    def agregar():
+        for filtros in combinacoes:
+            core.compute_detailed_stats(indice_cubo.filter(**filtros))
+
+    cubo = indice_cubo.filter(**combinacoes[0])
+    stats = core.compute_detailed_stats(cubo)
+    compras = indice.filter(**combinacoes[0])
+
+    def construir_figuras():
+        figuras = [construir(cubo) for construir in FIGURAS_CUBO]
+        figuras += [construir(stats) for construir in FIGURAS_STATS]
+        figuras.append(figures.build_value_histogram(core.value_histogram(compras['valor_total'])))
+        return figuras
+
+    registrar('filter', best_of(filtrar, repeticoes) / len(combinacoes), repeticoes)
+    registrar('aggregate', best_of(agregar, repeticoes) / len(combinacoes), repeticoes)
+    registrar('figures', best_of(construir_figuras, repeticoes), repeticoes,
+              json_kb=round(sum(len(figura.to_json()) for figura in construir_figuras()) / 1024, 1))
+    return resultados
+
+
+def regressions(resultados, base, tolerancia):
+    """Etapas mais lentas que na base por mais que a tolerância (fração)"""
+    anteriores = {(r['linhas'], r['etapa']): r['segundos'] for r in base['resultados']}
+    piores = []
+    for r in resultados:
+        anterior = anteriores.get((r['linhas'], r['etapa']))
+        if anterior and r['segundos'] > anterior * (1 + tolerancia):
+            piores.append({**r, 'base_segundos': anterior, 'razao': round(r['segundos'] / anterior, 2)})
+    return piores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 5_000_000])
+    parser.add_argument('--dados', default='.bench_data', help='diretório dos livros sintéticos')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--saida', help='arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior para detectar regressões')
+    parser.add_argument('--tolerancia', type=float, default=0.25)
+    args = parser.parse_args()
+    # Mesmo modo do painel, para os tempos e a memória valerem para ele
+    pd.set_option("mode.copy_on_write", True)
+
+    resultados = []
+    for n_linhas in args.linhas:
+        resultados.extend(run_size(n_linhas, args.dados, args.repeticoes))
+        print(f"{n_linhas} linhas: ok", file=sys.stderr)
+
+    relatorio = {'ambiente': environment(), 'resultados': resultados}
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            relatorio['regressoes'] = regressions(resultados, json.load(arquivo), args.tolerancia)
+
+    saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(saida)
+    else:
+        print(saida)
+
+    if relatorio.get('regressoes'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
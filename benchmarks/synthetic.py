@@ -0,0 +1,81 @@
+"""Geração de planilhas de compras sintéticas com o mesmo layout de 8 colunas"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_PLANILHA = ['Data da Compra', 'Item', 'Unidade de Medida', 'Valor Unitário',
+                    'Quantidade', 'Valor Total', 'Categoria', 'Alojamento']
+
+CATEGORIAS = ['Mercearia', 'Açougue', 'Hortifruti', 'Laticínios', 'Padaria',
+              'Bebidas', 'Limpeza', 'Descartáveis']
+UNIDADES = ['KG', 'UN', 'L', 'CX', 'PCT']
+
+# Última linha possível numa aba do Excel (já contando o cabeçalho)
+LIMITE_LINHAS_EXCEL = 1_048_576
+
+
+def rank_weights(n, expoente, rng):
+    """Probabilidades 1 / posição ** expoente (lei de Zipf), com as posições sorteadas"""
+    peso = 1 / np.arange(1, n + 1) ** expoente
+    return rng.permutation(peso / peso.sum())
+
+
+def make_ledger(n_linhas, n_itens=800, n_alojamentos=40, anos=3, seed=0):
+    """Livro de compras aleatório, mas com preços estáveis por item (como o real)"""
+    rng = np.random.default_rng(seed)
+
+    itens = np.array([f"Item {i:04d}" for i in range(n_itens)])
+    # Categorias repartidas igualmente entre os itens, em qualquer faixa de popularidade
+    categoria_item = np.array(CATEGORIAS)[rng.permutation(n_itens) % len(CATEGORIAS)]
+    unidade_item = rng.choice(UNIDADES, n_itens)
+    preco_item = np.round(rng.lognormal(2.0, 0.8, n_itens), 2)
+    alojamentos = np.array([f"Alojamento {i:02d}" for i in range(n_alojamentos)])
+
+    # Itens e alojamentos com popularidade desigual: peso pela posição num ranking embaralhado
+    codigo_item = rng.choice(n_itens, n_linhas, p=rank_weights(n_itens, 1.1, rng))
+    codigo_alojamento = rng.choice(n_alojamentos, n_linhas, p=rank_weights(n_alojamentos, 0.5, rng))
+
+    inicio = pd.Timestamp.today().normalize() - pd.DateOffset(years=anos)
+    dias = rng.integers(0, anos * 365, n_linhas)
+    preco = np.round(preco_item[codigo_item] * rng.normal(1.0, 0.05, n_linhas), 2)
+    quantidade = rng.integers(1, 50, n_linhas)
+
+    return pd.DataFrame({
+        COLUNAS_PLANILHA[0]: inicio + pd.to_timedelta(dias, unit='D'),
+        COLUNAS_PLANILHA[1]: itens[codigo_item],
+        COLUNAS_PLANILHA[2]: unidade_item[codigo_item],
+        COLUNAS_PLANILHA[3]: preco,
+        COLUNAS_PLANILHA[4]: quantidade,
+        COLUNAS_PLANILHA[5]: np.round(preco * quantidade, 2),
+        COLUNAS_PLANILHA[6]: categoria_item[codigo_item],
+        COLUNAS_PLANILHA[7]: alojamentos[codigo_alojamento],
+    })
+
+
+def write_ledger_files(n_linhas, diretorio, formatos=('xlsx', 'parquet'), seed=0):
+    """Grava (uma vez) o livro sintético de `n_linhas` nos formatos pedidos.
+
+    Retorna {formato: caminho}. Arquivos já existentes são reaproveitados, pois
+    gerar um .xlsx grande leva minutos. Planilhas acima do limite de linhas do
+    Excel não são geradas em .xlsx.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    caminhos = {}
+    df = None
+    for formato in formatos:
+        if formato == 'xlsx' and n_linhas >= LIMITE_LINHAS_EXCEL:
+            continue
+        caminho = os.path.join(diretorio, f"ledger_{n_linhas}_{seed}.{formato}")
+        if not os.path.exists(caminho):
+            if df is None:
+                df = make_ledger(n_linhas, seed=seed)
+            temporario = os.path.join(diretorio, f"parcial_{n_linhas}_{seed}.{formato}")
+            if formato == 'xlsx':
+                df.to_excel(temporario, index=False, engine='openpyxl')
+            else:
+                df.to_parquet(temporario, index=False)
+            os.replace(temporario, caminho)
+        caminhos[formato] = caminho
+    return caminhos
@@ -0,0 +1,36 @@
+"""Utilitários de medição compartilhados pelos benchmarks"""
+
+import platform
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def best_of(funcao, repeticoes):
+    """Menor tempo (s) entre `repeticoes` execuções de `funcao`"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def timed(funcao):
+    """Executa `funcao` uma vez e retorna (resultado, segundos)"""
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, time.perf_counter() - inicio
+
+
+def environment():
+    """Descrição do ambiente, para comparar resultados de máquinas diferentes"""
+    return {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
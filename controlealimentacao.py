@@ -1,14 +1,30 @@
 import streamlit as st
-import requests
-from msal import ConfidentialClientApplication
 import pandas as pd
-import io
-import plotly.express as px
+import os
+import sys
+import hmac
+import html
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from datetime import datetime
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from datetime import datetime, timedelta
-import numpy as np
-import openpyxl
+
+from alimentacao.core import (
+    DIRETORIO_CACHE, JANELA_PRECOS, LIMITE_Z_PRECOS, MOTOR_CONSULTAS, Instrumentation, DataRefresher,
+    FilterIndex, Selection, DuckDBIndex, SpendForecast, compute_kpis,
+    create_graph_client, dataframe_memory_mb, export_dataframe, is_installed, query_engine,
+)
+from alimentacao.figures import (
+    build_alojamento_bar, build_alojamento_comparison, build_category_pie, build_forecast_chart, build_heatmap,
+    build_monthly_bar, build_price_series, build_seasonality_line, build_timeline, build_value_histogram, build_weekday_bar,
+)
+
+# Copy-on-write: recortes, renomeações e reset_index compartilham a memória dos
+# dados de origem, e só quem escreve ganha uma cópia. Os dados compartilhados
+# entre as sessões nunca são alterados por uma delas.
+pd.set_option("mode.copy_on_write", True)
 
 # Configuração da página
 st.set_page_config(
@@ -30,6 +46,12 @@ st.markdown("""
         color: white;
     }
 
+    .metric-row {
+        display: grid;
+        grid-template-columns: repeat(auto-fit, minmax(12rem, 1fr));
+        gap: 1rem;
+    }
+
     .metric-card {
         background: white;
         padding: 1.5rem;
@@ -57,6 +79,17 @@ st.markdown("""
         margin-top: 0.5rem;
     }
 
+    .top-item {
+        padding: 0.5rem;
+        border-left: 3px solid #F7931E;
+        margin-bottom: 0.5rem;
+        background: #f8f9fa;
+    }
+
+    .top-item.mais-caro {
+        border-left-color: #000000;
+    }
+
     .sidebar .sidebar-content {
         background: linear-gradient(180deg, #F7931E 0%, #000000 100%);
     }
@@ -109,416 +142,510 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+ABAS_DETALHADAS = [
+    "📊 Top Produtos", "💰 Análise Financeira", "🏠 Por Alojamento", "📅 Tendências", "💲 Preços", "🔮 Previsão"
+]
+# Compras fora da curva listadas na aba Preços (as de maior |z|)
+MAX_ANOMALIAS_TABELA = 200
+# Exportação dos dados filtrados
+FORMATOS_EXPORTACAO = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+# Limites do cache de figuras compartilhado entre as sessões
+MAX_FIGURAS_CACHE = 512
+MAX_BYTES_FIGURAS_CACHE = 256 * 1024 * 1024
+
+# Intervalo (s) entre as conferências da atualização pedida pelo botão "Atualizar Dados"
+INTERVALO_AGUARDAR_ATUALIZACAO = 2
+
+logger = logging.getLogger(__name__)
+
+
+@st.cache_resource
+def get_instrumentation():
+    """Instrumentação única por processo (ligada por ALIMENTACAO_INSTRUMENTACAO=1)"""
+    ativo = os.environ.get("ALIMENTACAO_INSTRUMENTACAO") == "1"
+    caminho_log = os.environ.get(
+        "ALIMENTACAO_LOG_INSTRUMENTACAO", os.path.join(DIRETORIO_CACHE, "instrumentacao.jsonl")
+    )
+    if ativo:
+        os.makedirs(os.path.dirname(caminho_log) or '.', exist_ok=True)
+    return Instrumentation(ativo, caminho_log)
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
-def download_excel_sharepoint():
-    """Baixa dados do SharePoint usando st.secrets"""
-    try:
-        # Configurar autenticação usando st.secrets
-        app = ConfidentialClientApplication(
-            st.secrets["azure"]["client_id"],
-            authority=f"https://login.microsoftonline.com/{st.secrets['azure']['tenant_id']}",
-            client_credential=st.secrets["azure"]["client_secret"],
-        )
 
-        # Obter token
-        result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
+@st.cache_resource
+def get_graph_client():
+    """Cliente do Graph único por processo, configurado via st.secrets"""
+    return create_graph_client(st.secrets["azure"], get_instrumentation())
+
+
+@st.cache_resource
+def get_refresher():
+    """DataRefresher único por processo, compartilhado entre as sessões"""
+    if MOTOR_CONSULTAS == 'duckdb' and not is_installed('duckdb'):
+        logger.warning("MOTOR_CONSULTAS=duckdb, mas o duckdb não está instalado; usando pandas")
+    return DataRefresher(get_graph_client(), em_memoria=query_engine() == 'pandas')
+
+
+# Os dados de cada versão vêm junto com ela, do mesmo DataRefresher.current() (argumentos com
+# "_" ficam fora da chave do cache): uma atualização que chegue no meio da execução não põe
+# os dados de outra versão sob esta chave
+
+@st.cache_resource(max_entries=2)
+def get_filter_index(versao, _df):
+    """Índice de filtros de uma versão dos dados, compartilhado entre as sessões"""
+    # O próprio DataFrame do DataRefresher, sem cópia (cache_data devolveria uma cópia a cada chamada)
+    return FilterIndex(_df)
+
+
+@st.cache_resource(max_entries=2)
+def get_cube_index(versao, _cubo):
+    """Cubo de gastos de uma versão dos dados, indexado pelos mesmos filtros das compras"""
+    return FilterIndex(_cubo)
+
+
+# Uma entrada só: o histórico apaga as partições de duas versões atrás, que um índice mais
+# antigo ainda citaria
+@st.cache_resource(max_entries=1)
+def get_duckdb_index(versao, _arquivos):
+    """Índice DuckDB sobre as partições de uma versão do histórico"""
+    return DuckDBIndex(_arquivos)
+
+
+def get_data_index(dados):
+    """Índice dos filtros no motor de consultas em uso (FilterIndex ou DuckDBIndex)"""
+    versao, df, _, arquivos = dados
+    if query_engine() == 'duckdb':
+        return get_duckdb_index(versao, arquivos)
+    return get_filter_index(versao, df)
+
+
+@st.cache_resource(max_entries=4)
+def get_price_tracking(versao, por_alojamento, _indice):
+    """Acompanhamento de preços de uma versão dos dados, compartilhado entre as sessões"""
+    with get_instrumentation().measure('precos'):
+        return _indice.price_tracking(por_alojamento)
+
+
+def price_tracking(selecao, chave, por_alojamento):
+    """Acompanhamento de preços da versão dos dados da chave; sem chave, só constrói"""
+    if chave is None:
+        return selecao.indice.price_tracking(por_alojamento)
+    return get_price_tracking(chave[0], por_alojamento, selecao.indice)
+
+
+@st.cache_resource(max_entries=2)
+def get_spend_forecast(versao, _indice):
+    """Previsão de gastos de uma versão dos dados, compartilhada entre as sessões"""
+    with get_instrumentation().measure('previsao'):
+        return SpendForecast(_indice.monthly_spend(), _indice.date_range()[1])
+
+
+def spend_forecast(selecao, chave):
+    """SpendForecast da versão dos dados da chave; sem chave, só constrói"""
+    if chave is None:
+        return SpendForecast(selecao.indice.monthly_spend(), selecao.indice.date_range()[1])
+    return get_spend_forecast(chave[0], selecao.indice)
+
+
+def select_data(dados, indice, filtros):
+    """Recorte dos dados (de DataRefresher.current()) pelos filtros da barra lateral, no motor do `indice`"""
+    if query_engine() == 'duckdb':
+        return indice.select(**filtros)
+    versao, _, cubo, _ = dados
+    return Selection(indice, get_cube_index(versao, cubo), filtros)
+
+
+def create_metrics_cards(cubo):
+    """Cria cards de métricas principais a partir do cubo de gastos filtrado"""
+    # Os quatro cards num único bloco HTML: uma mensagem para o navegador
+    kpis = compute_kpis(cubo)
+    variacao_color = "#F7931E" if kpis.variacao_mensal >= 0 else "#FF0000"
+    variacao_icon = "↗️" if kpis.variacao_mensal >= 0 else "↘️"
+    variacao = (f'<div class="metric-delta" style="color: {variacao_color}">'
+                f'{variacao_icon} {kpis.variacao_mensal:.1f}% vs mês anterior</div>')
+
+    cards = [
+        ("💰 Gasto Total", f"R$ {kpis.total_gasto:,.2f}", ""),
+        ("📦 Total de Itens", f"{kpis.total_itens:,}", ""),
+        ("📅 Gasto Médio/Dia", f"R$ {kpis.gasto_medio_dia:.2f}", variacao),
+        ("🏠 Alojamentos Ativos", f"{kpis.alojamentos_ativos}", ""),
+    ]
+    st.markdown(
+        '<div class="metric-row">' + "".join(
+            f'<div class="metric-card"><div class="metric-title">{titulo}</div>'
+            f'<div class="metric-value">{valor}</div>{extra}</div>'
+            for titulo, valor, extra in cards
+        ) + '</div>',
+        unsafe_allow_html=True
+    )
 
-        if "access_token" in result:
-            headers = {"Authorization": f"Bearer {result['access_token']}"}
 
-            # Obter o site_id
-            site_url = "https://graph.microsoft.com/v1.0/sites/rezendeenergia.sharepoint.com:/sites/Intranet"
-            site_response = requests.get(site_url, headers=headers)
+def top_list_html(titulo, linhas, classe):
+    """Lista Top 10 inteira (título e itens) como um só bloco de markdown"""
+    itens = "".join(
+        f'<div class="top-item {classe}"><strong>{posicao}. {html.escape(str(produto))}</strong><br>{detalhe}</div>'
+        for posicao, (produto, detalhe) in enumerate(linhas, 1)
+    )
+    return f"### {titulo}\n\n{itens}"
+
+
+class FigureCache:
+    """Cache LRU compartilhado de figuras (e estatísticas), limitado em entradas e em memória"""
+
+    def __init__(self, max_entradas=MAX_FIGURAS_CACHE, max_bytes=MAX_BYTES_FIGURAS_CACHE, instrumentacao=None):
+        self.max_entradas = max_entradas
+        self.instrumentacao = instrumentacao or Instrumentation()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def get_or_build(self, chave, construir, etapa='figuras'):
+        with self._lock:
+            if chave in self._entradas:
+                self._entradas.move_to_end(chave)
+                self.hits += 1
+                self.instrumentacao.count('cache_figuras_hit')
+                return self._entradas[chave][0]
+            self.misses += 1
+        self.instrumentacao.count('cache_figuras_miss')
+
+        with self.instrumentacao.measure(etapa):
+            valor = construir()
+        tamanho = estimate_size(valor)
+        if tamanho > self.max_bytes:
+            return valor
+
+        with self._lock:
+            if chave in self._entradas:
+                self.bytes -= self._entradas.pop(chave)[1]
+            self._entradas[chave] = (valor, tamanho)
+            self.bytes += tamanho
+            while len(self._entradas) > self.max_entradas or self.bytes > self.max_bytes:
+                _, (_, tamanho_removido) = self._entradas.popitem(last=False)
+                self.bytes -= tamanho_removido
+        return valor
+
+
+def estimate_size(valor):
+    """Tamanho aproximado, em bytes, de um valor guardado no FigureCache"""
+    if isinstance(valor, go.Figure):
+        return len(valor.to_json())
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if is_dataclass(valor):
+        return sum(estimate_size(getattr(valor, campo.name)) for campo in fields(valor))
+    return sys.getsizeof(valor)
+
+
+@st.cache_resource
+def get_figure_cache():
+    """FigureCache único por processo, compartilhado entre as sessões"""
+    return FigureCache(instrumentacao=get_instrumentation())
+
+
+def cached_figure(chave, nome, construir, etapa='figuras'):
+    """Figura `nome` para a chave (versão dos dados + filtros); sem chave, só constrói"""
+    if chave is None:
+        return construir()
+    return get_figure_cache().get_or_build(chave + (nome,), construir, etapa)
+
+
+def create_charts(cubo, chave=None):
+    """Cria gráficos do dashboard a partir do cubo de gastos filtrado"""
 
-            if site_response.status_code == 200:
-                site_data = site_response.json()
-                site_id = site_data['id']
+    col1, col2 = st.columns(2)
 
-                # Buscar o arquivo específico
-                search_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root/search(q='Controle Alimentação.xlsx')"
-                search_response = requests.get(search_url, headers=headers)
+    with col1:
+        fig_categoria = cached_figure(chave, 'categoria', lambda: build_category_pie(cubo))
+        st.plotly_chart(fig_categoria, use_container_width=True)
 
-                if search_response.status_code == 200:
-                    search_data = search_response.json()
-                    files_found = search_data.get('value', [])
+    with col2:
+        fig_alojamento = cached_figure(chave, 'alojamento', lambda: build_alojamento_bar(cubo))
+        st.plotly_chart(fig_alojamento, use_container_width=True)
 
-                    for item in files_found:
-                        if item['name'] == 'Controle Alimentação.xlsx':
-                            # Baixar o arquivo
-                            download_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/items/{item['id']}/content"
-                            download_response = requests.get(download_url, headers=headers)
+    fig_timeline = cached_figure(chave, 'timeline', lambda: build_timeline(cubo))
+    st.plotly_chart(fig_timeline, use_container_width=True)
 
-                            if download_response.status_code == 200:
-                                # Ler o arquivo Excel
-                                df = pd.read_excel(io.BytesIO(download_response.content))
-                                return df
+    fig_heatmap = cached_figure(chave, 'heatmap', lambda: build_heatmap(cubo))
+    st.plotly_chart(fig_heatmap, use_container_width=True)
 
-        return None
 
-    except Exception as e:
-        st.error(f"Erro ao conectar com SharePoint: {e}")
-        return None
+def render_top_products_tab(selecao, chave):
+    """Aba Top Produtos"""
+    stats = cached_figure(chave, 'stats', selecao.stats, 'agregacao')
+    col1, col2 = st.columns(2)
 
+    with col1:
+        # Top produtos mais comprados
+        top_produtos = stats.top_produtos
+        st.markdown(top_list_html(
+            "📈 Top 10 - Produtos Mais Comprados",
+            ((produto, f"Quantidade: {quantidade:.0f} | Valor: R$ {valor:,.2f}")
+             for produto, quantidade, valor in zip(top_produtos.index, top_produtos['quantidade'],
+                                                   top_produtos['valor_total'])),
+            'mais-comprado'
+        ), unsafe_allow_html=True)
 
-def process_data(df):
-    """Processa e limpa os dados"""
-    if df is None:
-        return None
+    with col2:
+        # Produtos mais caros
+        produtos_caros = stats.produtos_caros
+        st.markdown(top_list_html(
+            "💎 Top 10 - Produtos Mais Caros (Valor Unitário)",
+            ((produto, f"Valor Unitário: R$ {valor:,.2f}") for produto, valor in produtos_caros.items()),
+            'mais-caro'
+        ), unsafe_allow_html=True)
 
-    # Renomear colunas para facilitar o trabalho
-    df.columns = ['data_compra', 'item', 'unidade_medida', 'valor_unitario',
-                  'quantidade', 'valor_total', 'categoria', 'alojamento']
 
-    # Converter tipos de dados
-    df['data_compra'] = pd.to_datetime(df['data_compra'])
-    df['valor_unitario'] = pd.to_numeric(df['valor_unitario'], errors='coerce')
-    df['quantidade'] = pd.to_numeric(df['quantidade'], errors='coerce')
-    df['valor_total'] = pd.to_numeric(df['valor_total'], errors='coerce')
+def render_financial_tab(selecao, chave):
+    """Aba Análise Financeira"""
+    col1, col2 = st.columns(2)
 
-    # Adicionar colunas calculadas
-    df['mes_ano'] = df['data_compra'].dt.to_period('M')
-    df['dia_semana'] = df['data_compra'].dt.day_name()
-    df['semana'] = df['data_compra'].dt.isocalendar().week
+    with col1:
+        # Análise por mês
+        fig_mes = cached_figure(
+            chave, 'mes',
+            lambda: build_monthly_bar(cached_figure(chave, 'stats', selecao.stats, 'agregacao'))
+        )
+        st.plotly_chart(fig_mes, use_container_width=True)
 
-    return df
+    with col2:
+        # Distribuição de valores
+        fig_dist = cached_figure(chave, 'distribuicao', lambda: build_value_histogram(selecao.value_histogram()))
+        st.plotly_chart(fig_dist, use_container_width=True)
 
 
-def create_metrics_cards(df, col1, col2, col3, col4):
-    """Cria cards de métricas principais"""
+def render_alojamento_tab(selecao, chave):
+    """Aba Por Alojamento"""
+    stats = cached_figure(chave, 'stats', selecao.stats, 'agregacao')
 
-    # Métricas gerais
-    total_gasto = df['valor_total'].sum()
-    total_itens = len(df)
-    gasto_medio_dia = df.groupby('data_compra')['valor_total'].sum().mean()
-    alojamentos_ativos = df['alojamento'].nunique()
+    # Análise por alojamento
+    st.markdown("### 🏠 Estatísticas por Alojamento")
+    st.dataframe(stats.alojamento_stats, use_container_width=True)
 
-    # Métricas do mês atual vs anterior
-    hoje = datetime.now()
-    mes_atual = df[df['data_compra'].dt.month == hoje.month]
-    mes_anterior = df[df['data_compra'].dt.month == (hoje.month - 1 if hoje.month > 1 else 12)]
+    # Gráfico de comparação
+    fig_aloj_comp = cached_figure(chave, 'alojamento_comparativo', lambda: build_alojamento_comparison(stats))
+    st.plotly_chart(fig_aloj_comp, use_container_width=True)
 
-    gasto_mes_atual = mes_atual['valor_total'].sum() if len(mes_atual) > 0 else 0
-    gasto_mes_anterior = mes_anterior['valor_total'].sum() if len(mes_anterior) > 0 else 0
 
-    if gasto_mes_anterior > 0:
-        variacao_mensal = ((gasto_mes_atual - gasto_mes_anterior) / gasto_mes_anterior) * 100
-    else:
-        variacao_mensal = 0
+def render_trends_tab(selecao, chave):
+    """Aba Tendências"""
+    stats = cached_figure(chave, 'stats', selecao.stats, 'agregacao')
+    col1, col2 = st.columns(2)
 
     with col1:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">💰 Gasto Total</div>
-            <div class="metric-value">R$ {total_gasto:,.2f}</div>
-        </div>
-        """, unsafe_allow_html=True)
+        # Gastos por dia da semana
+        fig_dia_semana = cached_figure(chave, 'dia_semana', lambda: build_weekday_bar(stats))
+        st.plotly_chart(fig_dia_semana, use_container_width=True)
 
     with col2:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">📦 Total de Itens</div>
-            <div class="metric-value">{total_itens:,}</div>
-        </div>
-        """, unsafe_allow_html=True)
-
-    with col3:
-        variacao_color = "#F7931E" if variacao_mensal >= 0 else "#FF0000"
-        variacao_icon = "↗️" if variacao_mensal >= 0 else "↘️"
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">📅 Gasto Médio/Dia</div>
-            <div class="metric-value">R$ {gasto_medio_dia:.2f}</div>
-            <div class="metric-delta" style="color: {variacao_color}">
-                {variacao_icon} {variacao_mensal:.1f}% vs mês anterior
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        # Sazonalidade mensal
+        if len(selecao.cubo) > 0:
+            fig_sazonalidade = cached_figure(chave, 'sazonalidade', lambda: build_seasonality_line(stats))
+            st.plotly_chart(fig_sazonalidade, use_container_width=True)
+        else:
+            st.info("📊 Dados insuficientes para análise de sazonalidade")
 
-    with col4:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-title">🏠 Alojamentos Ativos</div>
-            <div class="metric-value">{alojamentos_ativos}</div>
-        </div>
-        """, unsafe_allow_html=True)
 
+def render_prices_tab(selecao, chave):
+    """Aba Preços: compras com valor unitário fora da curva do item (ou do item no alojamento)"""
+    por_alojamento = st.toggle("Comparar cada alojamento só com as próprias compras", key="precos_por_alojamento")
+    precos = price_tracking(selecao, chave, por_alojamento)
+    anomalias = precos.anomalies(**selecao.filtros)
 
-def create_charts(df):
-    """Cria gráficos do dashboard"""
+    st.markdown(f"### 🚨 {len(anomalias)} compras com preço fora da curva")
+    st.caption(
+        f"Valor unitário comparado com a mediana das {JANELA_PRECOS} compras anteriores do mesmo item"
+        f"{' no mesmo alojamento' if por_alojamento else ''}; marcadas as com |z| ≥ {LIMITE_Z_PRECOS}."
+    )
+    if anomalias.empty:
+        st.info("📊 Nenhum preço fora da curva com os filtros selecionados")
+        return
+
+    # Séries com compras marcadas, das que têm mais para as que têm menos
+    colunas_serie = ['item', 'alojamento'] if por_alojamento else ['item']
+    contagem = anomalias.groupby(colunas_serie, observed=True).size().sort_values(ascending=False)
+    series = {}
+    for serie, n in contagem.items():
+        serie = serie if isinstance(serie, tuple) else (serie,)
+        series[" — ".join(map(str, serie))] = (serie, n)
+    rotulo = st.selectbox(
+        "Série de preços:",
+        list(series),
+        format_func=lambda rotulo: f"{rotulo} ({series[rotulo][1]})",
+        key="serie_precos"
+    )
+    serie = series[rotulo][0]
+    fig_precos = cached_figure(
+        chave, ('precos', por_alojamento, rotulo),
+        lambda: build_price_series(precos.series_rows(*serie), f"💲 Valor Unitário - {rotulo}")
+    )
+    st.plotly_chart(fig_precos, use_container_width=True)
+
+    tabela = anomalias.head(MAX_ANOMALIAS_TABELA)
+    st.dataframe(
+        pd.DataFrame({
+            'Data': tabela['data_compra'].dt.strftime('%d/%m/%Y'),
+            'Item': tabela['item'],
+            'Alojamento': tabela['alojamento'],
+            'Valor Unitário': tabela['valor_unitario'],
+            'Mediana Anterior': tabela['mediana'].round(2),
+            'Variação (%)': tabela['variacao_pct'],
+            'z': tabela['z'].round(1),
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
 
-    # Cores da empresa
-    cores_empresa = ['#F7931E', '#000000', '#FF6B35', '#FFB366', '#333333', '#666666', '#999999']
 
-    col1, col2 = st.columns(2)
+def render_forecast_tab(selecao, chave):
+    """Aba Previsão: gasto mensal projetado por alojamento × categoria"""
+    previsao = spend_forecast(selecao, chave)
+    if len(previsao) == 0:
+        # Nenhum mês completo ainda
+        st.info("📊 Dados insuficientes para a previsão de gastos")
+        return
+    alojamento, categoria = selecao.filtros.get('alojamento'), selecao.filtros.get('categoria')
+    realizado, previsto = previsao.totals(alojamento, categoria)
+    if realizado.empty:
+        st.info("📊 Dados insuficientes para a previsão de gastos")
+        return
+
+    st.caption(
+        f"Tendência e sazonalidade mensal ajustadas a cada uma das {len(previsao)} séries alojamento × categoria "
+        "sobre o histórico inteiro (meses completos); os filtros de alojamento e categoria somam as séries escolhidas."
+    )
+    fig_previsao = cached_figure(chave, 'previsao', lambda: build_forecast_chart(realizado, previsto))
+    st.plotly_chart(fig_previsao, use_container_width=True)
 
-    with col1:
-        # Gráfico de gastos por categoria
-        gastos_categoria = df.groupby('categoria')['valor_total'].sum().reset_index()
-        gastos_categoria = gastos_categoria.sort_values('valor_total', ascending=False)
-
-        fig_categoria = px.pie(
-            gastos_categoria,
-            values='valor_total',
-            names='categoria',
-            title="💳 Distribuição de Gastos por Categoria",
-            color_discrete_sequence=cores_empresa
-        )
-        fig_categoria.update_layout(
-            height=400,
-            title_x=0.5,
-            font=dict(size=12),
-            title_font_color='#000000'
-        )
-        st.plotly_chart(fig_categoria, use_container_width=True)
+    # Uma linha por série, uma coluna por mês previsto
+    tabela = previsao.table(alojamento, categoria).pivot_table(
+        index=['alojamento', 'categoria'], columns='mes', values='previsto', observed=True
+    ).round(2)
+    st.markdown("### 🔮 Previsão por Alojamento e Categoria (R$)")
+    st.dataframe(tabela, use_container_width=True)
 
-    with col2:
-        # Gráfico de gastos por alojamento
-        gastos_alojamento = df.groupby('alojamento')['valor_total'].sum().reset_index()
-        gastos_alojamento = gastos_alojamento.sort_values('valor_total', ascending=True)
-
-        fig_alojamento = px.bar(
-            gastos_alojamento,
-            x='valor_total',
-            y='alojamento',
-            title="🏠 Gastos por Alojamento",
-            orientation='h',
-            color='valor_total',
-            color_continuous_scale=[[0, '#F7931E'], [1, '#000000']]
-        )
-        fig_alojamento.update_layout(
-            height=400,
-            title_x=0.5,
-            showlegend=False,
-            title_font_color='#000000'
-        )
-        st.plotly_chart(fig_alojamento, use_container_width=True)
 
-    # Gráfico de evolução temporal
-    gastos_diarios = df.groupby('data_compra')['valor_total'].sum().reset_index()
+@st.fragment
+def create_detailed_analysis(selecao, chave=None):
+    """Cria análises detalhadas a partir do recorte filtrado, só da aba selecionada"""
+    # Fragmento: trocar de aba reexecuta só este trecho da página
 
-    fig_timeline = px.line(
-        gastos_diarios,
-        x='data_compra',
-        y='valor_total',
-        title="📈 Evolução dos Gastos ao Longo do Tempo",
-        line_shape='spline'
-    )
-    fig_timeline.update_traces(line_color='#F7931E', line_width=3)
-    fig_timeline.update_layout(
-        height=400,
-        title_x=0.5,
-        xaxis_title="Data",
-        yaxis_title="Valor Total (R$)",
-        title_font_color='#000000'
-    )
-    st.plotly_chart(fig_timeline, use_container_width=True)
+    st.markdown("## 🔍 Análise Detalhada")
 
-    # Heatmap de gastos por dia da semana e categoria
-    df_pivot = df.pivot_table(
-        values='valor_total',
-        index='categoria',
-        columns='dia_semana',
-        aggfunc='sum',
-        fill_value=0
+    aba = st.radio(
+        "Análise detalhada",
+        ABAS_DETALHADAS,
+        key="aba_detalhada",
+        horizontal=True,
+        label_visibility="collapsed"
     )
 
-    # Reordenar dias da semana
-    dias_ordem = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    df_pivot = df_pivot.reindex(columns=[dia for dia in dias_ordem if dia in df_pivot.columns])
-
-    fig_heatmap = px.imshow(
-        df_pivot.values,
-        x=[dia[:3] for dia in df_pivot.columns],
-        y=df_pivot.index,
-        title="🗓️ Heatmap: Gastos por Categoria e Dia da Semana",
-        color_continuous_scale=[[0, '#FFFFFF'], [0.5, '#F7931E'], [1, '#000000']],
-        aspect='auto'
-    )
-    fig_heatmap.update_layout(
-        height=400,
-        title_x=0.5,
-        xaxis_title="Dia da Semana",
-        yaxis_title="Categoria",
-        title_font_color='#000000'
-    )
-    st.plotly_chart(fig_heatmap, use_container_width=True)
+    if aba == "📊 Top Produtos":
+        render_top_products_tab(selecao, chave)
+    elif aba == "💰 Análise Financeira":
+        render_financial_tab(selecao, chave)
+    elif aba == "🏠 Por Alojamento":
+        render_alojamento_tab(selecao, chave)
+    elif aba == "📅 Tendências":
+        render_trends_tab(selecao, chave)
+    elif aba == "💲 Preços":
+        render_prices_tab(selecao, chave)
+    else:
+        render_forecast_tab(selecao, chave)
 
 
-def create_detailed_analysis(df):
-    """Cria análises detalhadas"""
+@st.fragment
+def create_raw_data_section(selecao):
+    """Tabela de dados brutos, montada apenas quando o usuário pede para vê-la"""
+    if not st.toggle("📋 Dados Detalhados", key="mostrar_dados_detalhados"):
+        return
+    df = selecao.purchases()
 
-    st.markdown("## 🔍 Análise Detalhada")
+    # As compras filtradas já estão em ordem de data: basta inverter
+    st.dataframe(
+        df.iloc[::-1],
+        use_container_width=True,
+        hide_index=True
+    )
 
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 Top Produtos", "💰 Análise Financeira", "🏠 Por Alojamento", "📅 Tendências"])
-
-    with tab1:
-        col1, col2 = st.columns(2)
-
-        with col1:
-            # Top produtos mais comprados
-            top_produtos = df.groupby('item').agg({
-                'quantidade': 'sum',
-                'valor_total': 'sum'
-            }).sort_values('quantidade', ascending=False).head(10)
-
-            st.markdown("### 📈 Top 10 - Produtos Mais Comprados")
-            for idx, (produto, row) in enumerate(top_produtos.iterrows(), 1):
-                st.markdown(f"""
-                <div style="padding: 0.5rem; border-left: 3px solid #F7931E; margin-bottom: 0.5rem; background: #f8f9fa;">
-                    <strong>{idx}. {produto}</strong><br>
-                    Quantidade: {row['quantidade']:.0f} | Valor: R$ {row['valor_total']:,.2f}
-                </div>
-                """, unsafe_allow_html=True)
-
-        with col2:
-            # Produtos mais caros
-            produtos_caros = df.groupby('item')['valor_unitario'].mean().sort_values(ascending=False).head(10)
-
-            st.markdown("### 💎 Top 10 - Produtos Mais Caros (Valor Unitário)")
-            for idx, (produto, valor) in enumerate(produtos_caros.items(), 1):
-                st.markdown(f"""
-                <div style="padding: 0.5rem; border-left: 3px solid #000000; margin-bottom: 0.5rem; background: #f8f9fa;">
-                    <strong>{idx}. {produto}</strong><br>
-                    Valor Unitário: R$ {valor:,.2f}
-                </div>
-                """, unsafe_allow_html=True)
-
-    with tab2:
-        col1, col2 = st.columns(2)
-
-        with col1:
-            # Análise por mês
-            gastos_mes = df.groupby('mes_ano')['valor_total'].sum().reset_index()
-            gastos_mes['mes_ano_str'] = gastos_mes['mes_ano'].astype(str)
-
-            fig_mes = px.bar(
-                gastos_mes,
-                x='mes_ano_str',
-                y='valor_total',
-                title="📅 Gastos por Mês",
-                color='valor_total',
-                color_continuous_scale=[[0, '#F7931E'], [1, '#000000']]
-            )
-            fig_mes.update_layout(title_font_color='#000000')
-            st.plotly_chart(fig_mes, use_container_width=True)
-
-        with col2:
-            # Distribuição de valores
-            fig_dist = px.histogram(
-                df,
-                x='valor_total',
-                nbins=30,
-                title="📊 Distribuição de Valores das Compras",
-                color_discrete_sequence=['#F7931E']
-            )
-            fig_dist.update_layout(title_font_color='#000000')
-            st.plotly_chart(fig_dist, use_container_width=True)
-
-    with tab3:
-        # Análise por alojamento
-        alojamento_stats = df.groupby('alojamento').agg({
-            'valor_total': ['sum', 'mean', 'count'],
-            'quantidade': 'sum'
-        }).round(2)
-
-        alojamento_stats.columns = ['Total Gasto', 'Gasto Médio', 'Nº Compras', 'Quantidade Total']
-        alojamento_stats = alojamento_stats.sort_values('Total Gasto', ascending=False)
-
-        st.markdown("### 🏠 Estatísticas por Alojamento")
-        st.dataframe(alojamento_stats, use_container_width=True)
-
-        # Gráfico de comparação
-        fig_aloj_comp = go.Figure()
-
-        fig_aloj_comp.add_trace(go.Bar(
-            name='Total Gasto',
-            x=alojamento_stats.index,
-            y=alojamento_stats['Total Gasto'],
-            yaxis='y',
-            offsetgroup=1,
-            marker_color='#F7931E'
-        ))
-
-        fig_aloj_comp.add_trace(go.Bar(
-            name='Nº Compras',
-            x=alojamento_stats.index,
-            y=alojamento_stats['Nº Compras'],
-            yaxis='y2',
-            offsetgroup=2,
-            marker_color='#000000'
-        ))
-
-        fig_aloj_comp.update_layout(
-            title="📊 Comparativo: Gastos vs Número de Compras por Alojamento",
-            xaxis_title="Alojamento",
-            yaxis=dict(title="Valor Total (R$)", side="left"),
-            yaxis2=dict(title="Número de Compras", side="right", overlaying="y"),
-            height=500,
-            title_font_color='#000000'
+    # Opção para download: o arquivo só é gerado quando pedido
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        formato = st.radio(
+            "Formato do arquivo:",
+            list(FORMATOS_EXPORTACAO),
+            key="formato_exportacao",
+            horizontal=True
+        )
+    with col2:
+        preparar = st.button("⚙️ Preparar arquivo", use_container_width=True)
+
+    if preparar:
+        extensao, mime = FORMATOS_EXPORTACAO[formato]
+        with st.spinner("Gerando arquivo..."):
+            dados = export_dataframe(df, extensao)
+        st.download_button(
+            label=f"💾 Baixar dados filtrados ({formato})",
+            data=dados,
+            file_name=f"alimentacoes_filtrado_{datetime.now().strftime('%Y%m%d_%H%M')}.{extensao}",
+            mime=mime,
+            on_click="ignore"
         )
 
-        st.plotly_chart(fig_aloj_comp, use_container_width=True)
-
-    with tab4:
-        col1, col2 = st.columns(2)
-
-        with col1:
-            # Gastos por dia da semana - CORREÇÃO DO BUG
-            gastos_dia_semana = df.groupby('dia_semana')['valor_total'].mean().reset_index()
-            ordem_dias = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-
-            # Filtrar apenas os dias que existem nos dados
-            dias_presentes = gastos_dia_semana['dia_semana'].tolist()
-            gastos_dia_semana['dia_num'] = gastos_dia_semana['dia_semana'].apply(lambda x: ordem_dias.index(x))
-            gastos_dia_semana = gastos_dia_semana.sort_values('dia_num')
-
-            # Mapear apenas os dias presentes
-            mapeamento_dias = {
-                'Monday': 'Seg', 'Tuesday': 'Ter', 'Wednesday': 'Qua',
-                'Thursday': 'Qui', 'Friday': 'Sex', 'Saturday': 'Sáb', 'Sunday': 'Dom'
-            }
-            gastos_dia_semana['dia_pt'] = gastos_dia_semana['dia_semana'].map(mapeamento_dias)
-
-            fig_dia_semana = px.bar(
-                gastos_dia_semana,
-                x='dia_pt',
-                y='valor_total',
-                title="📅 Gasto Médio por Dia da Semana",
-                color='valor_total',
-                color_continuous_scale=[[0, '#F7931E'], [1, '#000000']],
-                text='valor_total'
-            )
-            fig_dia_semana.update_traces(texttemplate='R$ %{text:,.0f}', textposition='outside')
-            fig_dia_semana.update_layout(title_font_color='#000000')
-            st.plotly_chart(fig_dia_semana, use_container_width=True)
-
-        with col2:
-            # Sazonalidade mensal
-            if len(df) > 0:
-                df['mes'] = df['data_compra'].dt.month
-                gastos_sazonalidade = df.groupby('mes')['valor_total'].mean().reset_index()
-                meses_nomes = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
-                               'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
-                gastos_sazonalidade['mes_nome'] = gastos_sazonalidade['mes'].apply(lambda x: meses_nomes[x - 1])
-
-                fig_sazonalidade = px.line(
-                    gastos_sazonalidade,
-                    x='mes_nome',
-                    y='valor_total',
-                    title="🌟 Sazonalidade - Gasto Médio por Mês",
-                    markers=True
-                )
-                fig_sazonalidade.update_traces(line_color='#F7931E', line_width=3, marker_size=8,
-                                               marker_color='#000000')
-                fig_sazonalidade.update_layout(title_font_color='#000000')
-                st.plotly_chart(fig_sazonalidade, use_container_width=True)
-            else:
-                st.info("📊 Dados insuficientes para análise de sazonalidade")
+
+@st.fragment(run_every=INTERVALO_AGUARDAR_ATUALIZACAO)
+def wait_for_refresh(versao):
+    """Reexecuta a página quando a atualização pedida pelo botão termina com outra versão (ou sem dados)"""
+    concluida = st.session_state.get("atualizacao_pedida")
+    if concluida is None or not concluida.is_set():
+        return
+    del st.session_state["atualizacao_pedida"]
+    if versao is None or get_refresher().current()[0] != versao:
+        st.rerun(scope="app")
+
+
+def is_admin():
+    """Administrador: acessou a página com ?admin=<painel.admin_token dos secrets>"""
+    token = st.secrets.get("painel", {}).get("admin_token")
+    return bool(token) and hmac.compare_digest(st.query_params.get("admin", ""), token)
+
+
+def create_instrumentation_panel(registro, instrumentacao):
+    """Seção da barra lateral, só para administradores, com as medições da execução"""
+    with st.sidebar.expander("🛠️ Instrumentação"):
+        st.markdown(f"**Execução:** {registro['total_s']:.3f} s")
+        etapas = pd.Series(registro['etapas_s'], name='segundos', dtype=float)
+        st.dataframe(etapas.sort_values(ascending=False), use_container_width=True)
+
+        memoria = {chave: valor for chave, valor in registro.items() if chave.endswith('_mb')}
+        st.markdown("**Memória (MB)**")
+        st.json(memoria)
+
+        st.markdown("**Cache (esta execução / processo)**")
+        contadores = pd.DataFrame({
+            'execucao': pd.Series(registro['contadores'], dtype='Int64'),
+            'processo': pd.Series(dict(instrumentacao.contadores), dtype='Int64'),
+        }).fillna(0)
+        st.dataframe(contadores, use_container_width=True)
+        st.caption(f"Log: {instrumentacao.caminho_log}")
 
 
 def main():
     """Função principal do dashboard"""
+    instrumentacao = get_instrumentation()
+    instrumentacao.start_rerun()
 
     # Header principal
     st.markdown("""
@@ -532,25 +659,41 @@ def main():
     with st.sidebar:
         st.markdown("## 🔧 Filtros e Configurações")
 
-        # Botão para atualizar dados
+        # Botão para atualizar dados: agenda uma atualização prioritária, sem
+        # descartar os dados atuais (eles continuam valendo até a nova versão chegar)
         if st.button("🔄 Atualizar Dados", use_container_width=True):
-            st.cache_data.clear()
-            st.rerun()
+            try:
+                st.session_state["atualizacao_pedida"] = get_refresher().schedule(prioridade=True)
+                st.toast("🔄 Atualização solicitada ao SharePoint")
+            except Exception as e:
+                st.error(f"Erro ao conectar com SharePoint: {e}")
 
         st.markdown("---")
 
         # Carregar dados
-        with st.spinner("📊 Carregando dados do SharePoint..."):
-            df = download_excel_sharepoint()
-
-        if df is not None:
-            df = process_data(df)
-            st.success(f"✅ {len(df)} registros carregados!")
+        with st.spinner("📊 Carregando dados do SharePoint..."), instrumentacao.measure('carregamento'):
+            try:
+                refresher = get_refresher()
+                dados = refresher.current()
+                versao = dados[0]
+            except Exception as e:
+                st.error(f"Erro ao conectar com SharePoint: {e}")
+                refresher, versao = None, None
+            indice = get_data_index(dados) if versao is not None else None
+
+        if "atualizacao_pedida" in st.session_state:
+            wait_for_refresh(versao)
+
+        if indice is not None:
+            st.success(f"✅ {len(indice)} registros carregados!")
+            if refresher.ultimo_erro:
+                st.warning(f"⚠️ Exibindo a última versão disponível. Falha ao atualizar: {refresher.ultimo_erro}")
+            for planilha, linhas in refresher.linhas_descartadas.items():
+                st.warning(f"⚠️ {planilha}: {linhas} linha(s) com data inválida foram ignoradas")
 
             # Filtros
             st.markdown("### 📅 Período")
-            data_min = df['data_compra'].min().date()
-            data_max = df['data_compra'].max().date()
+            data_min, data_max = indice.date_range()
 
             data_inicio, data_fim = st.date_input(
                 "Selecione o período:",
@@ -561,7 +704,7 @@ def main():
 
             # Filtro por alojamento
             st.markdown("### 🏠 Alojamentos")
-            alojamentos_disponiveis = ['Todos'] + sorted(df['alojamento'].unique().tolist())
+            alojamentos_disponiveis = ['Todos'] + indice.options('alojamento')
             alojamento_selecionado = st.selectbox(
                 "Selecione o alojamento:",
                 alojamentos_disponiveis
@@ -569,60 +712,47 @@ def main():
 
             # Filtro por categoria
             st.markdown("### 📦 Categorias")
-            categorias_disponiveis = ['Todas'] + sorted(df['categoria'].unique().tolist())
+            categorias_disponiveis = ['Todas'] + indice.options('categoria')
             categoria_selecionada = st.selectbox(
                 "Selecione a categoria:",
                 categorias_disponiveis
             )
 
-            # Aplicar filtros
-            df_filtrado = df[
-                (df['data_compra'].dt.date >= data_inicio) &
-                (df['data_compra'].dt.date <= data_fim)
-                ]
-
-            if alojamento_selecionado != 'Todos':
-                df_filtrado = df_filtrado[df_filtrado['alojamento'] == alojamento_selecionado]
-
-            if categoria_selecionada != 'Todas':
-                df_filtrado = df_filtrado[df_filtrado['categoria'] == categoria_selecionada]
+            # Aplicar filtros (ao cubo de gastos; as compras só quando pedidas)
+            filtros = dict(
+                data_inicio=data_inicio,
+                data_fim=data_fim,
+                alojamento=None if alojamento_selecionado == 'Todos' else alojamento_selecionado,
+                categoria=None if categoria_selecionada == 'Todas' else categoria_selecionada
+            )
+            with instrumentacao.measure('filtros'):
+                selecao = select_data(dados, indice, filtros)
+            chave = (versao,) + tuple(filtros.values())
 
-            st.markdown(f"**📊 {len(df_filtrado)} registros após filtros**")
+            st.markdown(f"**📊 {len(selecao)} registros após filtros**")
 
+        elif refresher is not None and refresher.ultimo_erro:
+            st.error(f"❌ Não foi possível carregar os dados do SharePoint: {refresher.ultimo_erro}")
+            st.stop()
         else:
             st.error("❌ Não foi possível carregar os dados do SharePoint.")
             st.stop()
 
     # Dashboard principal
-    if df_filtrado is not None and len(df_filtrado) > 0:
+    if len(selecao) > 0:
 
         # Métricas principais
-        col1, col2, col3, col4 = st.columns(4)
-        create_metrics_cards(df_filtrado, col1, col2, col3, col4)
+        create_metrics_cards(selecao.cubo)
 
         # Gráficos principais
         st.markdown("## 📈 Visualizações")
-        create_charts(df_filtrado)
+        create_charts(selecao.cubo, chave)
 
         # Análise detalhada
-        create_detailed_analysis(df_filtrado)
+        create_detailed_analysis(selecao, chave)
 
         # Tabela de dados brutos
-        with st.expander("📋 Dados Detalhados"):
-            st.dataframe(
-                df_filtrado.sort_values('data_compra', ascending=False),
-                use_container_width=True,
-                hide_index=True
-            )
-
-            # Opção para download
-            csv = df_filtrado.to_csv(index=False)
-            st.download_button(
-                label="💾 Baixar dados filtrados (CSV)",
-                data=csv,
-                file_name=f"alimentacoes_filtrado_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-                mime="text/csv"
-            )
+        create_raw_data_section(selecao)
 
         # Rodapé
         st.markdown("---")
@@ -639,6 +769,16 @@ def main():
     else:
         st.warning("⚠️ Nenhum dado disponível com os filtros selecionados.")
 
+    registro = instrumentacao.finish_rerun(
+        motor_consultas=query_engine(),
+        registros=len(indice),
+        registros_filtrados=len(selecao),
+        memoria_dados_mb=indice.memory_mb(),
+        memoria_cubo_filtrado_mb=dataframe_memory_mb(selecao.cubo),
+    )
+    if registro is not None and is_admin():
+        create_instrumentation_panel(registro, instrumentacao)
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,21 @@
+import pytest
+
+from alimentacao.core import GraphClient, Instrumentation, load_token_cache
+from tests.graph_stub import StubGraph, StubTokenApp
+
+
+@pytest.fixture
+def graph():
+    grafo = StubGraph()
+    yield grafo
+    grafo.close()
+
+
+@pytest.fixture
+def client(graph, tmp_path):
+    """GraphClient apontado para o StubGraph, com o cache de tokens gravado em tmp_path"""
+    caminho = str(tmp_path / 'tokens.json')
+    token_cache = load_token_cache(caminho)
+    return GraphClient(StubTokenApp(token_cache), graph_url=graph.url, token_cache=token_cache,
+                       token_cache_path=caminho, instrumentacao=Instrumentation(ativo=True),
+                       sleep=lambda segundos: None)
@@ -0,0 +1,155 @@
+"""Substituto local da parte do Microsoft Graph / SharePoint usada pelo painel."""
+
+import io
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msal
+import pandas as pd
+
+CABECALHO = ['Data da Compra', 'Item', 'Unidade de Medida', 'Valor Unitário',
+             'Quantidade', 'Valor Total', 'Categoria', 'Alojamento']
+
+
+def make_workbook(linhas):
+    """Conteúdo de um .xlsx com o cabeçalho do livro de compras e as `linhas` (tuplas de 8 valores)"""
+    arquivo = io.BytesIO()
+    pd.DataFrame(list(linhas), columns=CABECALHO).to_excel(arquivo, index=False, engine='openpyxl')
+    return arquivo.getvalue()
+
+
+class StubTokenApp:
+    """Substituto do ConfidentialClientApplication: emite um token e depois o devolve do cache do MSAL"""
+
+    def __init__(self, token_cache):
+        self.token_cache = token_cache
+        self.emitidos = 0
+
+    def acquire_token_for_client(self, scopes):
+        for token in self.token_cache.search(msal.TokenCache.CredentialType.ACCESS_TOKEN, target=scopes):
+            return {'access_token': token['secret'], 'token_source': 'cache'}
+        self.emitidos += 1
+        resposta = {'access_token': f"token-{self.emitidos}", 'token_type': 'Bearer', 'expires_in': 3600}
+        self.token_cache.add({
+            'client_id': 'painel', 'scope': scopes, 'response': dict(resposta),
+            'token_endpoint': 'https://login.microsoftonline.com/local/oauth2/v2.0/token',
+        })
+        return {**resposta, 'token_source': 'identity_provider'}
+
+
+class StubGraph:
+    """Servidor HTTP local (keep-alive) com site, busca paginada, metadados e download das planilhas.
+
+    Cada requisição fica em `requisicoes` como (tipo, caminho, Authorization, porta do cliente).
+    """
+
+    SITE_ID = 'site-local'
+
+    def __init__(self, por_pagina=2):
+        self.por_pagina = por_pagina
+        self.arquivos = {}  # id -> (nome, conteudo, versao)
+        self.requisicoes = []
+        self.respostas = []  # respostas forçadas (status, corpo), usadas antes das normais
+        self._lock = threading.Lock()
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.servidor.daemon_threads = True
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.servidor.server_port}"
+
+    def close(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def put(self, nome, conteudo):
+        """Cria ou altera um arquivo do drive (a versão muda); retorna o id"""
+        with self._lock:
+            item_id = next((item_id for item_id, (atual, _, _) in self.arquivos.items() if atual == nome),
+                           f"item-{len(self.arquivos) + 1}")
+            versao = self.arquivos.get(item_id, (None, None, 0))[2] + 1
+            self.arquivos[item_id] = (nome, conteudo, versao)
+        return item_id
+
+    def remove(self, nome):
+        with self._lock:
+            self.arquivos = {item_id: arquivo for item_id, arquivo in self.arquivos.items() if arquivo[0] != nome}
+
+    def count(self, tipo):
+        return sum(1 for requisicao in self.requisicoes if requisicao[0] == tipo)
+
+    def connections(self):
+        """Conexões TCP distintas usadas pelo cliente"""
+        return {requisicao[3] for requisicao in self.requisicoes}
+
+    def metadata(self, item_id):
+        nome, conteudo, versao = self.arquivos[item_id]
+        etag = f'"{{{item_id}}},{versao}"'
+        return {'id': item_id, 'name': nome, 'eTag': etag, 'cTag': etag,
+                'lastModifiedDateTime': f"2024-01-01T00:00:{versao:02d}Z", 'size': len(conteudo)}
+
+    def _handler(grafo):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, corpo, tipo='application/json', cabecalhos=()):
+                if not isinstance(corpo, bytes):
+                    corpo = json.dumps(corpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(corpo)))
+                for nome, valor in cabecalhos:
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def do_GET(self):
+                partes = urllib.parse.urlsplit(self.path)
+                caminho = urllib.parse.unquote(partes.path)
+                if caminho.endswith('/content'):
+                    tipo = 'download'
+                elif 'search(' in caminho:
+                    tipo = 'busca'
+                elif '/items/' in caminho:
+                    tipo = 'metadados'
+                else:
+                    tipo = 'site'
+                with grafo._lock:
+                    grafo.requisicoes.append((tipo, caminho, self.headers.get('Authorization'),
+                                              self.client_address[1]))
+                    forcada = grafo.respostas.pop(0) if grafo.respostas else None
+                    arquivos = dict(grafo.arquivos)
+                if forcada is not None:
+                    return self.send(*forcada)
+
+                if tipo == 'site':
+                    return self.send(200, {'id': grafo.SITE_ID})
+                if tipo == 'busca':
+                    inicio = int(urllib.parse.parse_qs(partes.query).get('inicio', ['0'])[0])
+                    ids = sorted(arquivos)
+                    pagina = {'value': [grafo.metadata(item_id) for item_id in ids[inicio:inicio + grafo.por_pagina]]}
+                    if inicio + grafo.por_pagina < len(ids):
+                        pagina['@odata.nextLink'] = f"{grafo.url}{partes.path}?inicio={inicio + grafo.por_pagina}"
+                    return self.send(200, pagina)
+
+                item_id = caminho.split('/items/')[1].split('/')[0]
+                if item_id not in arquivos:
+                    return self.send(404, {'error': {'code': 'itemNotFound'}})
+                if tipo == 'metadados':
+                    return self.send(200, grafo.metadata(item_id))
+
+                conteudo = arquivos[item_id][1]
+                faixa = self.headers.get('Range')
+                if faixa:
+                    inicio, fim = (int(valor) for valor in faixa.split('=')[1].split('-'))
+                    return self.send(206, conteudo[inicio:fim + 1], 'application/octet-stream',
+                                     [('Content-Range', f"bytes {inicio}-{fim}/{len(conteudo)}")])
+                return self.send(200, conteudo, 'application/octet-stream')
+
+        return Handler
@@ -0,0 +1,42 @@
+"""Implementações de referência, série a série, que os testes e os benchmarks comparam com as do núcleo."""
+
+import numpy as np
+
+from alimentacao import core
+
+
+def legacy_price_tracking(precos, por_alojamento=False, janela=core.JANELA_PRECOS,
+                          limite_z=core.LIMITE_Z_PRECOS):
+    """Mediana, MAD e marcação calculadas série a série, com as janelas do pandas"""
+    colunas_serie = ['item', 'alojamento'] if por_alojamento else ['item']
+    precos = precos.dropna(subset=colunas_serie + ['valor_unitario'])
+    precos = precos.sort_values(colunas_serie + ['data_compra'], kind='stable', ignore_index=True)
+    anteriores = precos.groupby(colunas_serie, observed=True)['valor_unitario'].shift()
+    grupos = anteriores.groupby([precos[coluna] for coluna in colunas_serie], observed=True)
+
+    mediana = grupos.transform(lambda serie: serie.rolling(janela, min_periods=1).median())
+    mad = grupos.transform(lambda serie: serie.rolling(janela, min_periods=1).apply(
+        lambda janela_valores: np.nanmedian(np.abs(janela_valores - np.nanmedian(janela_valores))), raw=True))
+    n_anteriores = grupos.transform(lambda serie: serie.rolling(janela, min_periods=1).count())
+
+    escala = np.maximum(1.4826 * mad, core.DISPERSAO_MINIMA_PRECOS * mediana.abs())
+    z = (precos['valor_unitario'] - mediana) / escala.where(escala > 0)
+    anomalia = (n_anteriores >= core.MIN_HISTORICO_PRECOS) & (z.abs() >= limite_z)
+    return precos.assign(mediana=mediana, z=z, anomalia=anomalia)
+
+
+
+def per_series_forecast(previsao_lote):
+    """Mesma previsão, com uma regressão por série em Python"""
+    historico = previsao_lote.historico
+    horizonte = len(previsao_lote.meses_previstos)
+    previsao = np.zeros((horizonte, historico.shape[1]))
+    for coluna in range(historico.shape[1]):
+        serie = historico.iloc[:, coluna]
+        serie = serie[(serie != 0).to_numpy().argmax():]
+        n_meses = len(serie)
+        x = core.seasonal_design(n_meses, n_meses + horizonte, serie.index[0].month)
+        coeficientes, *_ = np.linalg.lstsq(x[:n_meses], serie.to_numpy(dtype=float), rcond=None)
+        previsao[:, coluna] = np.maximum(x[n_meses:] @ coeficientes, 0)
+    return previsao
+
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from alimentacao.core import (
+    COLUNAS, COLUNAS_PRECOS, DuckDBIndex, FilterIndex, HistoryStore, PriceTracking, SpendForecast, process_data,
+    typed_columns,
+)
+from benchmarks.synthetic import make_ledger
+from tests.reference import legacy_price_tracking, per_series_forecast
+
+
+FILTROS = dict(data_inicio=datetime(2000, 1, 1).date(), data_fim=datetime(2100, 1, 1).date())
+
+
+@pytest.fixture(scope='module')
+def indice():
+    return FilterIndex(process_data(make_ledger(20_000, n_itens=80, n_alojamentos=4, anos=3)))
+
+
+@pytest.mark.parametrize('por_alojamento', [False, True])
+def test_anomalies_match_the_per_series_version(indice, por_alojamento):
+    precos = indice.unit_prices().copy()
+    # Algumas compras bem fora do preço de costume
+    fora = np.random.default_rng(1).choice(len(precos), 40, replace=False)
+    precos.iloc[fora, precos.columns.get_loc('valor_unitario')] *= 4
+
+    vetorizado = PriceTracking(precos[COLUNAS_PRECOS], por_alojamento)
+    antigo = legacy_price_tracking(precos[COLUNAS_PRECOS], por_alojamento)
+
+    assert len(vetorizado) == len(antigo)
+    np.testing.assert_allclose(vetorizado.compras['mediana'], antigo['mediana'], equal_nan=True)
+    np.testing.assert_allclose(vetorizado.compras['z'], antigo['z'], equal_nan=True)
+    np.testing.assert_array_equal(vetorizado.compras['anomalia'], antigo['anomalia'])
+    assert vetorizado.compras['anomalia'].any()
+
+
+@pytest.mark.parametrize('por_alojamento', [False, True])
+def test_duckdb_anomalies_match_the_pandas_version(indice, por_alojamento, tmp_path):
+    pytest.importorskip('duckdb')
+    compras = indice.df[COLUNAS].copy()
+    fora = np.random.default_rng(2).choice(len(compras), 40, replace=False)
+    compras.iloc[fora, compras.columns.get_loc('valor_unitario')] *= 4
+    historico = HistoryStore(str(tmp_path), em_memoria=False)
+    historico.update(compras, ('v1',))
+
+    em_pandas = FilterIndex(process_data(compras)).price_tracking(por_alojamento)
+    no_duckdb = DuckDBIndex(historico.files()).price_tracking(por_alojamento)
+
+    assert len(no_duckdb) == len(em_pandas)
+    esperadas, anomalias = em_pandas.anomalies(**FILTROS), no_duckdb.anomalies(**FILTROS)
+    assert len(anomalias) > 0
+    for coluna in ('item', 'alojamento'):
+        assert list(anomalias[coluna].astype(str)) == list(esperadas[coluna].astype(str))
+    np.testing.assert_allclose(anomalias['z'], esperadas['z'])
+    np.testing.assert_allclose(anomalias['mediana'], esperadas['mediana'])
+
+    serie = (esperadas['item'].iloc[0], esperadas['alojamento'].iloc[0])[:2 if por_alojamento else 1]
+    esperada, consultada = em_pandas.series_rows(*serie), no_duckdb.series_rows(*serie)
+    assert len(consultada) == len(esperada)
+    np.testing.assert_allclose(consultada['mediana'], esperada['mediana'], equal_nan=True)
+    np.testing.assert_array_equal(consultada['anomalia'], esperada['anomalia'])
+
+
+def test_forecast_matches_the_per_series_version(indice):
+    previsao = SpendForecast(indice.monthly_spend(), indice.date_range()[1], processos=1)
+    assert len(previsao.historico) >= 24  # com sazonalidade
+
+    np.testing.assert_allclose(previsao.previsao.to_numpy(), per_series_forecast(previsao))
+    em_processos = SpendForecast(indice.monthly_spend(), indice.date_range()[1], processos=2)
+    np.testing.assert_allclose(em_processos.previsao.to_numpy(), previsao.previsao.to_numpy())
+
+
+def test_forecast_skips_the_incomplete_month(indice):
+    ultimo_dia = indice.date_range()[1]
+    previsao = SpendForecast(indice.monthly_spend(), ultimo_dia, processos=1)
+    ultimo_mes = pd.Period(ultimo_dia, 'M')
+    completo = ultimo_dia == ultimo_mes.end_time.date()
+    assert previsao.historico.index[-1] == (ultimo_mes if completo else ultimo_mes - 1)
+    assert previsao.meses_previstos[0] == previsao.historico.index[-1] + 1
+
+
+def test_forecast_without_a_complete_month_is_empty():
+    # Planilha começada neste mês: duas compras em outubro de 2026, mês ainda em curso
+    compras = typed_columns([
+        (datetime(2026, 10, 3), 'Arroz', 'kg', 5.0, 2, 10.0, 'Mercearia', 'Alojamento A'),
+        (datetime(2026, 10, 9), 'Leite', 'l', 4.5, 10, 45.0, 'Laticínios', 'Alojamento B'),
+    ])
+    indice = FilterIndex(process_data(compras))
+    previsao = SpendForecast(indice.monthly_spend(), indice.date_range()[1])
+
+    assert len(previsao) == 0
+    realizado, _ = previsao.totals()
+    assert realizado.empty
+    tabela = previsao.table()
+    assert tabela.empty
+    assert list(tabela.columns) == ['alojamento', 'categoria', 'mes', 'previsto', 'minimo', 'maximo']
@@ -0,0 +1,82 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from alimentacao.core import FilterIndex, lttb_indices, process_data
+from benchmarks.synthetic import make_ledger
+
+
+@pytest.fixture(scope='module')
+def indice():
+    return FilterIndex(process_data(make_ledger(5_000, n_itens=60, n_alojamentos=6, anos=2)))
+
+
+def mask_filter(df, data_inicio, data_fim, alojamento=None, categoria=None):
+    """Filtro de referência: máscara booleana sobre todas as linhas"""
+    manter = (df['data_compra'].dt.date >= data_inicio) & (df['data_compra'].dt.date <= data_fim)
+    if alojamento is not None:
+        manter &= df['alojamento'] == alojamento
+    if categoria is not None:
+        manter &= df['categoria'] == categoria
+    return df[manter]
+
+
+def test_index_is_in_date_order(indice):
+    assert indice.df['data_compra'].is_monotonic_increasing
+    assert isinstance(indice.df.index, pd.RangeIndex)
+
+
+def test_sorted_history_is_indexed_without_a_copy(indice):
+    assert FilterIndex(indice.df).df is indice.df
+
+
+def test_filters_match_a_boolean_mask(indice):
+    data_min, data_max = indice.date_range()
+    meio = data_min + (data_max - data_min) / 2
+    alojamento = indice.options('alojamento')[0]
+    categoria = indice.options('categoria')[-1]
+    casos = [
+        (data_min, data_max, None, None),
+        (data_min, meio, None, None),
+        (meio, meio, None, None),
+        (meio, data_max, alojamento, None),
+        (data_min, meio, None, categoria),
+        (data_min, data_max, alojamento, categoria),
+        (data_min, data_max, 'Alojamento inexistente', None),
+        (date(1990, 1, 1), date(1990, 12, 31), alojamento, categoria),
+    ]
+    for filtros in casos:
+        esperado = mask_filter(indice.df, *filtros)
+        filtrado = indice.filter(*filtros)
+        pd.testing.assert_frame_equal(filtrado.reset_index(drop=True), esperado.reset_index(drop=True))
+
+
+def test_unsorted_input_gives_the_same_index(indice):
+    embaralhado = indice.df.sample(frac=1, random_state=0)
+    outro = FilterIndex(embaralhado)
+    data_min, data_max = indice.date_range()
+    alojamento = indice.options('alojamento')[1]
+    assert outro.filter(data_min, data_max, alojamento)['valor_total'].sum() == pytest.approx(
+        indice.filter(data_min, data_max, alojamento)['valor_total'].sum())
+
+
+def test_lttb_keeps_endpoints_and_size():
+    rng = np.random.default_rng(0)
+    x = np.arange(10_000, dtype=float)
+    y = rng.normal(size=len(x))
+    y[4321] = 50.0  # pico isolado
+
+    for n_pontos in (3, 10, 500):
+        escolhidos = lttb_indices(x, y, n_pontos)
+        assert len(escolhidos) == n_pontos
+        assert escolhidos[0] == 0 and escolhidos[-1] == len(x) - 1
+        assert np.all(np.diff(escolhidos) > 0)
+    assert 4321 in lttb_indices(x, y, 500)
+
+
+def test_lttb_keeps_short_series_whole():
+    x = np.arange(5, dtype=float)
+    assert list(lttb_indices(x, x, 10)) == [0, 1, 2, 3, 4]
+    assert list(lttb_indices(x, x, 2)) == [0, 1, 2, 3, 4]
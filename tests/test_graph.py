@@ -0,0 +1,149 @@
+import os
+import stat
+from datetime import datetime
+
+import pytest
+import requests
+
+from alimentacao.core import GraphClient, GraphUnavailableError, HistoryStore, load_token_cache, sync_workbook
+from tests.graph_stub import StubTokenApp, make_workbook
+
+COMPRAS_2023 = [(datetime(2023, 3, 1), 'Feijão', 'kg', 8.0, 3, 24.0, 'Mercearia', 'Alojamento B')]
+COMPRAS = [
+    (datetime(2024, 1, 5), 'Arroz', 'kg', 5.0, 2, 10.0, 'Mercearia', 'Alojamento A'),
+    (datetime(2024, 2, 7), 'Leite', 'l', 4.5, 10, 45.0, 'Laticínios', 'Alojamento B'),
+]
+
+
+def test_token_is_reused_and_persisted(graph, client, tmp_path):
+    graph.put('Controle Alimentação.xlsx', make_workbook(COMPRAS))
+    client.get_items()
+    client.get_items()
+
+    assert client.app.emitidos == 1
+    assert {autorizacao for _, _, autorizacao, _ in graph.requisicoes} == {'Bearer token-1'}
+    caminho = tmp_path / 'tokens.json'
+    assert stat.S_IMODE(os.stat(caminho).st_mode) == 0o600
+
+    # Outro processo parte do cache gravado, sem pedir token novo
+    outro = StubTokenApp(load_token_cache(str(caminho)))
+    GraphClient(outro, graph_url=graph.url).resolve_site_id()
+    assert outro.emitidos == 0
+
+
+def test_requests_share_one_pooled_connection(graph, client):
+    for _ in range(5):
+        client.get(f"{graph.url}/sites/qualquer").raise_for_status()
+    assert len(graph.requisicoes) == 5
+    assert len(graph.connections()) == 1
+
+
+def test_site_and_workbooks_are_looked_up_once(graph, client):
+    graph.put('Controle Alimentação.xlsx', make_workbook(COMPRAS))
+    graph.put('Controle Alimentação 2023.xlsx', make_workbook(COMPRAS_2023))
+    graph.put('Cardápio.xlsx', b'outro arquivo')
+    graph.put('Controle Alimentação (1).xlsx', make_workbook(COMPRAS))  # cópia, não entra
+
+    primeira = client.get_items()
+    segunda = client.get_items()
+
+    assert [item['name'] for item in primeira] == ['Controle Alimentação 2023.xlsx', 'Controle Alimentação.xlsx']
+    assert segunda == primeira
+    assert graph.count('site') == 1
+    assert graph.count('busca') == 2  # duas páginas, só na primeira vez
+    assert graph.count('metadados') == 4
+
+
+def test_missing_workbook_triggers_a_new_search(graph, client):
+    graph.put('Controle Alimentação.xlsx', make_workbook(COMPRAS))
+    graph.put('Controle Alimentação 2023.xlsx', make_workbook(COMPRAS_2023))
+    client.get_items()
+
+    graph.remove('Controle Alimentação 2023.xlsx')
+    assert [item['name'] for item in client.get_items()] == ['Controle Alimentação.xlsx']
+    assert graph.count('busca') == 2
+
+
+def test_empty_search_is_repeated_at_once(graph, client):
+    assert client.get_items() == []
+    graph.put('Controle Alimentação.xlsx', make_workbook(COMPRAS))
+    assert [item['name'] for item in client.get_items()] == ['Controle Alimentação.xlsx']
+    assert graph.count('busca') == 2
+
+
+def test_new_yearly_workbook_is_found_by_the_next_search(graph, client):
+    graph.put('Controle Alimentação.xlsx', make_workbook(COMPRAS))
+    client.get_items()
+    graph.put('Controle Alimentação 2023.xlsx', make_workbook(COMPRAS_2023))
+    assert len(client.get_items()) == 1  # entre buscas, só os ids conhecidos
+
+    client.intervalo_descoberta = 0
+    assert len(client.get_items()) == 2
+
+
+def test_sync_downloads_only_changed_workbooks(graph, client):
+    graph.put('Controle Alimentação.xlsx', make_workbook(COMPRAS))
+    graph.put('Controle Alimentação 2023.xlsx', make_workbook(COMPRAS_2023))
+    estado, historico = {}, HistoryStore()
+
+    versao = sync_workbook(client, estado, historico)
+    assert graph.count('download') == 2
+    assert len(estado['df']) == 3
+
+    assert sync_workbook(client, estado, historico) == versao
+    assert graph.count('download') == 2
+    assert client.instrumentacao.contadores['sharepoint_inalterado'] == 1
+
+    novas = COMPRAS + [(datetime(2024, 2, 9), 'Pão', 'un', 0.5, 30, 15.0, 'Padaria', 'Alojamento A')]
+    graph.put('Controle Alimentação.xlsx', make_workbook(novas))
+    assert sync_workbook(client, estado, historico) != versao
+    assert graph.count('download') == 3
+    assert len(estado['df']) == 4
+
+
+def test_large_workbook_is_downloaded_in_ranges(graph, client):
+    conteudo = make_workbook(COMPRAS * 200)
+    graph.put('Controle Alimentação.xlsx', conteudo)
+    client.tamanho_bloco = 1000
+
+    item, = client.get_items()
+    assert client.download(item) == conteudo
+    assert graph.count('download') == -(-len(conteudo) // 1000)
+
+
+def test_ranged_download_without_progress_fails(graph, client):
+    graph.put('Controle Alimentação.xlsx', make_workbook(COMPRAS * 200))
+    client.tamanho_bloco = 1000
+    item, = client.get_items()
+
+    graph.respostas.append((206, b''))
+    with pytest.raises(RuntimeError, match='parou'):
+        client.download(item)
+
+    graph.respostas.extend([(206, b'x')] * 1000)
+    with pytest.raises(RuntimeError, match='incompleto'):
+        client.download(item)
+
+
+def test_client_errors_do_not_close_the_circuit(graph, client):
+    client.circuito.record_failure()
+    for status in (401, 403, 404):
+        graph.respostas.append((status, {'error': {'code': 'erro'}}))
+        assert client.get(f"{graph.url}/sites/qualquer").status_code == status
+    assert client.circuito.falhas == 1
+
+    client.get(f"{graph.url}/sites/qualquer").raise_for_status()
+    assert client.circuito.falhas == 0
+
+
+def test_temporary_errors_are_retried_then_open_the_circuit(graph, client):
+    graph.respostas.extend([(503, {}), (429, {})])
+    assert client.get(f"{graph.url}/sites/qualquer").status_code == 200
+    assert client.instrumentacao.contadores['graph_nova_tentativa'] == 2
+
+    client.circuito.limite_falhas = 1
+    graph.respostas.extend([(503, {})] * client.max_tentativas)
+    with pytest.raises(requests.HTTPError):
+        client.get(f"{graph.url}/sites/qualquer")
+    with pytest.raises(GraphUnavailableError):
+        client.get(f"{graph.url}/sites/qualquer")
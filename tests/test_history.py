@@ -0,0 +1,93 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from alimentacao.core import HistoryStore, concat_frames, typed_columns
+
+COMPRAS_2023 = [
+    (datetime(2023, 11, 3), 'Feijão', 'kg', 8.0, 3, 24.0, 'Mercearia', 'Alojamento B'),
+    (datetime(2023, 12, 9), 'Café', 'kg', 30.0, 1, 30.0, 'Mercearia', 'Alojamento A'),
+]
+COMPRAS_2024 = [
+    (datetime(2024, 1, 5), 'Arroz', 'kg', 5.0, 2, 10.0, 'Mercearia', 'Alojamento A'),
+    (datetime(2024, 1, 20), 'Pão', 'un', 0.5, 30, 15.0, 'Padaria', 'Alojamento A'),
+    (datetime(2024, 2, 7), 'Leite', 'l', 4.5, 10, 45.0, 'Laticínios', 'Alojamento B'),
+    (datetime(2024, 3, 1), 'Ovos', 'dz', 12.0, 2, 24.0, 'Mercearia', 'Alojamento B'),
+]
+
+
+def parquet_files(diretorio):
+    return sorted(nome for nome in os.listdir(diretorio) if nome.endswith('.parquet'))
+
+
+@pytest.fixture
+def historico(tmp_path):
+    historico = HistoryStore(str(tmp_path))
+    historico.update(typed_columns(COMPRAS_2024), ('v1',))
+    return historico
+
+
+def test_changing_one_month_reprocesses_only_that_month(historico, tmp_path):
+    arquivos = historico.files()['compras']
+
+    corrigidas = list(COMPRAS_2024)
+    corrigidas[2] = corrigidas[2][:4] + (12, 54.0) + corrigidas[2][6:]
+    assert historico.update(typed_columns(corrigidas), ('v2',)) == ['2024-02']
+
+    novos = historico.files()['compras']
+    assert novos['2024-02'] != arquivos['2024-02']
+    for mes in ('2024-01', '2024-03'):
+        assert novos[mes] == arquivos[mes]
+    assert len(parquet_files(tmp_path)) == 2 * 4  # o mês anterior fica até a próxima gravação
+
+    df, _ = historico.frames()
+    assert df['valor_total'].sum() == 10.0 + 15.0 + 54.0 + 24.0
+    assert historico.update(typed_columns(corrigidas), ('v2',)) == []
+
+
+def test_purchases_without_date_go_to_their_own_partition(historico, tmp_path):
+    sem_data = COMPRAS_2024 + [(None, 'Sal', 'kg', 2.0, 1, 2.0, 'Mercearia', 'Alojamento A')]
+    assert historico.update(typed_columns(sem_data), ('v2',)) == [HistoryStore.SEM_DATA]
+    assert list(historico.meses) == ['2024-01', '2024-02', '2024-03', HistoryStore.SEM_DATA]
+
+    # O histórico gravado volta com a compra sem data
+    recarregado = HistoryStore(str(tmp_path))
+    assert recarregado.load()
+    df, _ = recarregado.frames()
+    assert len(df) == len(sem_data)
+    assert df['data_compra'].isna().sum() == 1
+    assert df.loc[df['data_compra'].isna(), 'item'].tolist() == ['Sal']
+
+
+def test_removing_a_workbook_drops_its_months(tmp_path):
+    historico = HistoryStore(str(tmp_path))
+    ambas = concat_frames([typed_columns(COMPRAS_2023), typed_columns(COMPRAS_2024)])
+    historico.update(ambas, ('v1', 'v2023'))
+    assert list(historico.meses) == ['2023-11', '2023-12', '2024-01', '2024-02', '2024-03']
+
+    assert historico.update(typed_columns(COMPRAS_2024), ('v1',)) == []
+    assert list(historico.meses) == ['2024-01', '2024-02', '2024-03']
+    df, _ = historico.frames()
+    assert df['data_compra'].min() == pd.Timestamp(2024, 1, 5)
+
+    # Outra atualização limpa as partições que nenhum manifesto cita mais
+    historico.update(typed_columns(COMPRAS_2024[:3]), ('v1b',))
+    assert not [nome for nome in parquet_files(tmp_path) if '-2023-' in nome]
+
+    recarregado = HistoryStore(str(tmp_path))
+    assert recarregado.load()
+    assert list(recarregado.meses) == ['2024-01', '2024-02']
+
+
+def test_temporary_files_of_interrupted_writes_are_removed(historico, tmp_path):
+    orfao, em_andamento = tmp_path / 'compras-2024-01-abc.parquet.123.tmp', tmp_path / 'manifesto.json.456.tmp'
+    for temporario in (orfao, em_andamento):
+        temporario.write_bytes(b'parcial')
+    antigo = os.path.getmtime(orfao) - 2 * HistoryStore.IDADE_TEMPORARIO_ORFAO
+    os.utime(orfao, (antigo, antigo))
+
+    historico.update(typed_columns(COMPRAS_2024[:3]), ('v2',))
+    assert not orfao.exists()
+    assert em_andamento.exists()
@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pytest
+
+from alimentacao.core import Instrumentation, reset_peak_rss
+
+
+def test_stages_and_counters_go_to_the_rerun_record(tmp_path):
+    instrumentacao = Instrumentation(ativo=True, caminho_log=str(tmp_path / 'log.jsonl'))
+    instrumentacao.start_rerun()
+    with instrumentacao.measure('filtros'):
+        pass
+    instrumentacao.count('cache_figuras_hit', 2)
+    registro = instrumentacao.finish_rerun(registros=10)
+
+    assert set(registro['etapas_s']) == {'filtros'}
+    assert registro['contadores'] == {'cache_figuras_hit': 2}
+    assert registro['registros'] == 10
+    with open(tmp_path / 'log.jsonl', encoding='utf-8') as arquivo:
+        assert json.loads(arquivo.readline())['contadores'] == {'cache_figuras_hit': 2}
+
+
+def test_disabled_instrumentation_records_nothing(tmp_path):
+    instrumentacao = Instrumentation(caminho_log=str(tmp_path / 'log.jsonl'))
+    instrumentacao.start_rerun()
+    instrumentacao.count('cache_figuras_hit')
+    assert instrumentacao.finish_rerun() is None
+    assert not (tmp_path / 'log.jsonl').exists()
+
+
+@pytest.mark.skipif(not reset_peak_rss(), reason="pico de RSS só pode ser zerado no Linux")
+def test_peak_rss_is_measured_per_rerun():
+    instrumentacao = Instrumentation(ativo=True)
+    instrumentacao.start_rerun()
+    bloco = np.ones(64 * 2**20 // 8)  # 64 MB
+    del bloco
+    com_pico = instrumentacao.finish_rerun()
+
+    instrumentacao.start_rerun()
+    sem_pico = instrumentacao.finish_rerun()
+
+    assert com_pico['rss_pico_execucao_mb'] - sem_pico['rss_pico_execucao_mb'] > 48
+    assert sem_pico['rss_pico_processo_mb'] >= com_pico['rss_pico_execucao_mb']
+
+
+def test_log_is_rotated(tmp_path):
+    caminho = tmp_path / 'log.jsonl'
+    instrumentacao = Instrumentation(ativo=True, caminho_log=str(caminho), max_bytes_log=1, copias_log=2)
+    for execucao in range(4):
+        instrumentacao.start_rerun()
+        instrumentacao.finish_rerun(execucao=execucao)
+
+    assert sorted(arquivo.name for arquivo in tmp_path.iterdir()) == ['log.jsonl', 'log.jsonl.1', 'log.jsonl.2']
+    for nome, execucao in (('log.jsonl', 3), ('log.jsonl.1', 2), ('log.jsonl.2', 1)):
+        with open(tmp_path / nome, encoding='utf-8') as arquivo:
+            assert [json.loads(linha)['execucao'] for linha in arquivo] == [execucao]
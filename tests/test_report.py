@@ -0,0 +1,29 @@
+import json
+from datetime import datetime
+
+import pandas as pd
+
+from alimentacao.report import main
+from tests.graph_stub import make_workbook
+
+
+def test_report_of_a_workbook_without_a_complete_month(tmp_path):
+    planilha = tmp_path / 'Controle Alimentação.xlsx'
+    planilha.write_bytes(make_workbook([
+        (datetime(2026, 10, 3), 'Arroz', 'kg', 5.0, 2, 10.0, 'Mercearia', 'Alojamento A'),
+        (datetime(2026, 10, 9), 'Leite', 'l', 4.5, 10, 45.0, 'Laticínios', 'Alojamento B'),
+    ]))
+    saida = tmp_path / 'relatorio'
+
+    # O main liga o copy-on-write do processo; o teste o devolve como estava
+    with pd.option_context('mode.copy_on_write', pd.get_option('mode.copy_on_write')):
+        main(['--planilha', str(planilha), '--saida', str(saida)])
+
+    previsao = pd.read_parquet(saida / 'previsao_gastos.parquet')
+    assert previsao.empty
+    assert list(previsao.columns) == ['alojamento', 'categoria', 'mes', 'previsto', 'minimo', 'maximo']
+    with open(saida / 'relatorio.json', encoding='utf-8') as arquivo:
+        relatorio = json.load(arquivo)
+    assert relatorio['tabelas']['previsao_gastos'] == []
+    assert relatorio['indicadores']
+    assert (saida / 'relatorio.html').exists()
@@ -0,0 +1,92 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from alimentacao.core import (
+    HistoryStore, excel_engines, has_ledger_header, is_ledger_workbook, process_data, read_workbook,
+)
+from tests.graph_stub import CABECALHO, make_workbook
+
+# Código numérico do item numa coluna de texto, ao lado de nomes
+COMPRAS = [
+    (datetime(2024, 1, 5), 'Arroz', 'kg', 5.0, 2, 10.0, 'Mercearia', 'Alojamento A'),
+    (datetime(2024, 1, 9), 1234, 'kg', 7.0, 1, 7.0, 'Mercearia', 'Alojamento A'),
+    (datetime(2024, 2, 7), 'Leite', 'l', 4.5, 10, 45.0, 'Laticínios', 101),
+]
+
+
+@pytest.mark.parametrize('motor', excel_engines())
+def test_numeric_codes_in_text_columns_become_text(motor, tmp_path):
+    compras = read_workbook(make_workbook(COMPRAS), motor)
+
+    assert list(compras['item']) == ['Arroz', '1234', 'Leite']
+    assert list(compras['alojamento']) == ['Alojamento A', 'Alojamento A', '101']
+    for coluna in ('item', 'alojamento'):
+        assert all(isinstance(categoria, str) for categoria in compras[coluna].cat.categories)
+
+    # O histórico em Parquet aceita as planilhas com códigos numéricos
+    historico = HistoryStore(str(tmp_path))
+    historico.update(compras, 'v1')
+    assert historico.files()
+    processado = process_data(compras)
+    assert list(processado['item']) == ['Arroz', '1234', 'Leite']
+
+
+@pytest.mark.parametrize('motor', excel_engines())
+def test_unreadable_dates_drop_only_their_rows(motor):
+    compras = COMPRAS + [
+        ('ontem', 'Pão', 'un', 0.5, 30, 15.0, 'Padaria', 'Alojamento A'),
+        ('10/02/2024', 'Café', 'kg', 30.0, 1, 'trinta', 'Mercearia', 'Alojamento B'),
+        (None, 'Sal', 'kg', 2.0, 1, 2.0, 'Mercearia', 'Alojamento B'),
+    ]
+    lidas = read_workbook(make_workbook(compras), motor)
+
+    assert lidas.attrs['linhas_descartadas'] == 1
+    assert list(lidas['item']) == ['Arroz', '1234', 'Leite', 'Café', 'Sal']
+    assert lidas['data_compra'].iloc[3] == datetime(2024, 2, 10)
+    assert lidas['data_compra'].iloc[4] is pd.NaT
+    assert pd.isna(lidas['valor_total'].iloc[3])
+
+
+@pytest.mark.parametrize('motor', excel_engines())
+def test_blank_rows_are_not_purchases(motor):
+    vazia = (None,) * len(CABECALHO)
+    lidas = read_workbook(make_workbook([COMPRAS[0], vazia, vazia, COMPRAS[1], vazia, COMPRAS[2], vazia]), motor)
+
+    assert list(lidas['item']) == ['Arroz', '1234', 'Leite']
+    assert lidas['data_compra'].notna().all()
+    assert lidas.attrs['linhas_descartadas'] == 0
+
+
+def test_header_must_match_the_ledger_columns():
+    assert has_ledger_header(CABECALHO)
+    assert has_ledger_header(['DATA DA COMPRA', 'item', 'Unidade de medida', 'Valor unitario',
+                              'Quantidade ', 'Valor Total', 'Categoria', 'Alojamento', 'Observações'])
+    assert not has_ledger_header(['Mês', 'Item', 'Unidade', 'Preço', 'Qtd', 'Total', 'Categoria', 'Local'])
+    assert not has_ledger_header(CABECALHO[:7])
+    assert not has_ledger_header(None)
+
+
+@pytest.mark.parametrize('motor', excel_engines())
+def test_sheets_with_other_headers_are_skipped(motor):
+    arquivo = io.BytesIO()
+    with pd.ExcelWriter(arquivo, engine='openpyxl') as planilha:
+        pd.DataFrame(list(COMPRAS), columns=CABECALHO).to_excel(planilha, sheet_name='Compras', index=False)
+        pd.DataFrame({f"Coluna {n}": [1, 2] for n in range(8)}).to_excel(planilha, sheet_name='Resumo', index=False)
+    assert len(read_workbook(arquivo.getvalue(), motor)) == len(COMPRAS)
+
+
+@pytest.mark.parametrize('nome, planilha', [
+    ('Controle Alimentação.xlsx', True),
+    ('controle alimentação.XLSX', True),
+    ('Controle Alimentação 2023.xlsx', True),
+    ('Controle Alimentação (1).xlsx', False),
+    ('Controle Alimentação - backup.xlsx', False),
+    ('Controle Alimentação 2023 - Cópia.xlsx', False),
+    ('Controle Alimentação.xlsx.bak', False),
+    ('Cardápio.xlsx', False),
+])
+def test_only_the_ledger_and_its_yearly_archives_are_workbooks(nome, planilha):
+    assert is_ledger_workbook(nome) == planilha